@@ -4,7 +4,8 @@ from fastapi import APIRouter, HTTPException, Response, Request
 from fastapi.responses import JSONResponse
 from app.schemas.user import UserCreate, UserLogin
 from app.crud.user import create_user, verify_user, get_user_by_email
-from app.utils.helpers import create_access_token
+from app.services.last_login import record_login
+from app.utils.helpers import create_access_token, invalidate_cached_user
 from app.models.user import User
 from datetime import datetime, timezone
 import logging
@@ -50,8 +51,9 @@ async def login(user: UserLogin, request: Request):
         # Update last login time - with error handling for missing column
         try:
             # Fix: Use timezone-aware datetime
-            user_db.last_login = datetime.now(timezone.utc)
-            await user_db.save()
+            # Buffered and written in batches, unless write-behind is disabled
+            await record_login(user_db.id, datetime.now(timezone.utc))
+            invalidate_cached_user(user_db.id)
         except Exception as e:
             # Log the error but don't fail the login process
             logger.warning(f"Could not update last_login: {str(e)}")
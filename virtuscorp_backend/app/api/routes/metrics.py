@@ -1,135 +1,310 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from app.utils.conditional import is_not_modified, make_etag, not_modified_response, validator_headers
 from app.utils.helpers import get_current_user
+from app.models.upload import Upload
 from app.models.user import User
-import pandas as pd
+from app.crud.metric import aggregate_metrics
+from app.crud.upload import create_upload, find_upload_by_hash, get_latest_upload, touch_upload
+from app.schemas.metric import IngestionStatus, MetricAggregate
+from app.config import MAX_UPLOAD_SIZE, UPLOAD_CHUNK_SIZE, UPLOAD_SNIFF_ROWS
+from app.services.filters import FilterError, parse_filter
+from app.services.uploads import (
+    SUPPORTED_EXTENSIONS,
+    UPLOAD_DIR,
+    convert_upload,
+    link_upload,
+    load_upload_frame,
+    load_upload_summary,
+    remove_upload,
+    sniff_upload,
+    user_upload_dir,
+)
+from starlette.concurrency import run_in_threadpool
+import aiofiles
+import hashlib
+import logging
 import os
-import glob
-import traceback
+import uuid
 from datetime import datetime, timezone
-import json
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 router = APIRouter()
-UPLOAD_DIR = "uploaded_files"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+logger = logging.getLogger(__name__)
+
+MAX_PAGE_SIZE = 10_000
+# Rows serialized per chunk when streaming NDJSON
+STREAM_CHUNK_ROWS = 5_000
 
 @router.post("/upload-metrics")
-async def upload_metrics_file(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
+async def upload_metrics_file(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_user),
+):
     """
     Upload a metrics file (CSV or Excel) for the current user.
-    The file will be saved to the uploaded_files directory with a user-specific prefix.
+    The file is saved to the user's directory under uploaded_files and recorded in the
+    uploads table, and its rows are written to the metrics table in the background.
+    Files identical to one stored before (same SHA-256) are not stored, parsed or
+    validated again: the user's own copy just becomes the latest upload again, and
+    another user's copy is hard-linked with its derived artifacts.
     """
+    # Imported on first use, like everything that needs pandas
+    from app.services.ingestion import ingest_upload
+
     # Validate file format
-    if not file.filename.endswith((".csv", ".xlsx")):
+    if not file.filename.endswith(SUPPORTED_EXTENSIONS):
         raise HTTPException(status_code=400, detail="Unsupported file format. Only CSV and Excel files are supported.")
 
+    # Store the file in the user's own directory; uploading the same name again replaces it
+    filename = os.path.basename(file.filename)
+    user_dir = user_upload_dir(current_user.id)
+    file_path = os.path.join(user_dir, filename)
+    # Stream into a hidden temp file first, so a partial upload is never picked up as the latest one
+    tmp_path = os.path.join(UPLOAD_DIR, f".upload_{uuid.uuid4().hex}{os.path.splitext(filename)[1]}")
+
     try:
-        # Create a user-specific filename to avoid conflicts
-        file_path = os.path.join(UPLOAD_DIR, f"user_{current_user.id}_{file.filename}")
-        
-        # Save the file
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-        
-        # Try to read the file to validate it
+        # Save the file in bounded chunks, enforcing the size limit while streaming
+        size = 0
+        content_hash = hashlib.sha256()
+        async with aiofiles.open(tmp_path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                content_hash.update(chunk)
+                if size > MAX_UPLOAD_SIZE:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File size exceeds the limit of {MAX_UPLOAD_SIZE / (1024 * 1024)}MB.",
+                    )
+                await f.write(chunk)
+        digest = content_hash.hexdigest()
+        extension = os.path.splitext(filename)[1]
+
+        # The user uploaded these contents before: nothing to parse, validate or ingest
+        own = await find_upload_by_hash(digest, extension, user_id=current_user.id)
+        if own and os.path.exists(own.file_path):
+            await touch_upload(own)
+            logger.info("Upload matches a stored file, reusing it", extra={"upload": filename, "file_path": own.file_path})
+            return {"message": "File uploaded successfully", "filename": file.filename, "deduplicated": True}
+
+        # Another user stored them: share the file and its artifacts, only ingest the rows
+        shared = await find_upload_by_hash(digest, extension)
+        if shared and os.path.exists(shared.file_path):
+            os.makedirs(user_dir, exist_ok=True)
+            await run_in_threadpool(link_upload, shared.file_path, file_path)
+            df = await run_in_threadpool(load_upload_frame, current_user.id, file_path)
+            await create_upload(current_user.id, filename, file_path, size, digest, shared.row_count)
+            logger.info("Upload matches a stored file, linked it", extra={"upload": filename, "file_path": shared.file_path})
+            background_tasks.add_task(ingest_upload, current_user.id, filename, file_path, df)
+            return {"message": "File uploaded successfully", "filename": file.filename, "deduplicated": True}
+
+        # Validate on the header and the first rows only, off the event loop
         try:
-            if file.filename.endswith(".csv"):
-                df = pd.read_csv(file_path)
-            else:
-                df = pd.read_excel(file_path)
-            
-            # Check if the file has data
-            if df.empty:
-                raise HTTPException(status_code=400, detail="The uploaded file is empty.")
-            
-            # Log success
-            print(f"Successfully uploaded and validated file: {file_path}")
-            print(f"File contains {len(df)} rows and {len(df.columns)} columns")
-            print(f"Columns: {list(df.columns)}")
-            
+            sample = await run_in_threadpool(sniff_upload, tmp_path, UPLOAD_SNIFF_ROWS)
         except Exception as e:
             # If we can't read the file, it's probably invalid
-            os.remove(file_path)  # Clean up the invalid file
             raise HTTPException(
                 status_code=400, 
                 detail=f"Invalid file format or content: {str(e)}"
             )
-        
+
+        # Check if the file has data
+        if sample.empty:
+            raise HTTPException(status_code=400, detail="The uploaded file is empty.")
+
+        os.makedirs(user_dir, exist_ok=True)
+        os.replace(tmp_path, file_path)
+
+        # Parse the whole file once and convert it to the columnar format, in the thread pool
+        try:
+            df = await run_in_threadpool(convert_upload, current_user.id, file_path)
+        except Exception as e:
+            remove_upload(file_path)  # Clean up the invalid file
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Invalid file format or content: {str(e)}"
+            )
+
+        await create_upload(current_user.id, filename, file_path, size, digest, len(df))
+
+        logger.info(
+            "Upload stored",
+            extra={"file_path": file_path, "size": size, "rows": len(df), "columns": len(df.columns)},
+        )
+
+        # Persist the rows into the metrics table after the response is sent
+        background_tasks.add_task(ingest_upload, current_user.id, filename, file_path, df)
+
         return {"message": "File uploaded successfully", "filename": file.filename}
     
+    except HTTPException:
+        raise
     except Exception as e:
-        # Log the full error for debugging
-        print(f"Error in upload_metrics_file: {str(e)}")
-        traceback_str = traceback.format_exc()
-        print(f"Traceback: {traceback_str}")
-        
+        logger.exception("Upload failed", extra={"upload": filename})
+
         # Return a user-friendly error
         raise HTTPException(
             status_code=500, 
             detail=f"Failed to upload file: {str(e)}"
         )
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        await file.close()
+
+@router.get("/metrics/ingestion", response_model=IngestionStatus)
+async def get_metrics_ingestion_status(current_user: User = Depends(get_current_user)):
+    """Get the progress of the latest upload ingestion into the metrics table."""
+    from app.services.ingestion import get_ingestion_status
+
+    return get_ingestion_status(current_user.id)
+
+@router.get("/metrics/aggregate", response_model=List[MetricAggregate])
+async def aggregate_user_metrics(
+    bucket: str = Query("day", pattern="^(day|week|month)$"),
+    name: Optional[str] = None,
+    marketplace: Optional[str] = None,
+    category: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    filters: Optional[str] = Query(None, description="Filter expression, e.g. marketplace in (Ozon, WB) and value > 0"),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Aggregate the current user's metrics by name, marketplace, category and time bucket.
+    The grouping runs in the database; start is inclusive and end exclusive.
+    """
+    try:
+        where = parse_filter(filters)
+        return await aggregate_metrics(current_user.id, bucket, name, marketplace, category, start, end, where)
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid filters: {str(e)}")
+
+def _upload_validators(upload: Upload, *view) -> Tuple[str, float]:
+    """
+    ETag and Last-Modified of a view of the user's latest upload. Both come from the
+    upload row: a deduplicated upload is a link to an older file, so the file's mtime
+    doesn't tell when it became the latest one.
+    """
+    last_modified = upload.created_at.timestamp()
+    return make_etag(upload.id, last_modified, *view), last_modified
+
 
 @router.get("/uploaded-data")
-async def get_uploaded_data(current_user: User = Depends(get_current_user)):
+async def get_uploaded_data(
+    request: Request,
+    offset: int = Query(0, ge=0, description="Index of the first row to return"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size; omit for all rows"),
+    columns: Optional[str] = Query(None, description="Comma-separated list of columns to return"),
+    response_format: str = Query(
+        "json", alias="format", pattern="^(json|ndjson)$", description="json, or ndjson to stream"
+    ),
+    current_user: User = Depends(get_current_user),
+):
     """
     Get the data from the most recently uploaded file for the current user.
-    Returns the data as a list of records.
+    Returns the data as a list of records. Without parameters the whole file is returned;
+    with limit the response is a page with pagination info, and format=ndjson streams
+    one record per line in bounded chunks.
+    Responses carry an ETag and Last-Modified; a client sending a current one back in
+    If-None-Match or If-Modified-Since gets a 304 without the file being read.
     """
+    from app.services.serialization import NDJSON_MEDIA_TYPE, dumps, frame_to_records, iter_ndjson
+
     try:
-        # Find all files uploaded by this user
-        files = glob.glob(f"{UPLOAD_DIR}/user_{current_user.id}_*")
+        # Find the most recent file uploaded by this user
+        upload = await get_latest_upload(current_user.id)
         
-        if not files:
+        if not upload:
             # No files found, return empty data
-            print(f"No files found for user {current_user.id}")
+            if response_format == "ndjson":
+                return Response(content=b"", media_type=NDJSON_MEDIA_TYPE)
             return {"data": []}
+        latest_file = upload.file_path
 
-        # Get the most recent file
-        latest_file = max(files, key=os.path.getctime)
-        
-        # Debug information
-        print(f"Reading file: {latest_file}")
-        
-        # Read the file based on its extension
-        if latest_file.endswith(".csv"):
-            df = pd.read_csv(latest_file)
-        else:
-            df = pd.read_excel(latest_file)
-        
-        # Convert DataFrame to records
-        # Handle NaN values by replacing them with 0
-        # Also convert all values to appropriate Python types
-        records = []
-        for _, row in df.iterrows():
-            record = {}
-            for col in df.columns:
-                value = row[col]
-                # Handle NaN, NaT, and None values
-                if pd.isna(value):
-                    record[col] = 0
-                # Handle datetime objects
-                elif isinstance(value, pd.Timestamp):
-                    record[col] = value.strftime("%Y-%m-%d")
-                # Handle other types
-                else:
-                    record[col] = value
-            records.append(record)
-        
-        # Debug information
-        print(f"Records count: {len(records)}")
-        if len(records) > 0:
-            print(f"First record keys: {list(records[0].keys())}")
-            print(f"First record sample: {json.dumps(records[0], default=str)[:200]}...")
+        # Validators from the upload's identity and the requested view of it
+        etag, last_modified = _upload_validators(upload, offset, limit, columns, response_format)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        cache_headers = validator_headers(etag, last_modified)
+
+        # Load the parsed data (memory-mapped columnar copy, cached per user)
+        df = await run_in_threadpool(load_upload_frame, current_user.id, latest_file)
+        total = len(df)
+
+        if columns:
+            df = _project_columns(df, columns)
+        if offset or limit is not None:
+            df = df.iloc[offset:offset + limit if limit is not None else None]
+
+        if response_format == "ndjson":
+            return StreamingResponse(
+                iter_ndjson(df, STREAM_CHUNK_ROWS),
+                media_type=NDJSON_MEDIA_TYPE,
+                headers={"X-Total-Count": str(total), **cache_headers},
+            )
+
+        # Convert DataFrame to records column by column:
+        # NaN/NaT/None become 0 and timestamps become YYYY-MM-DD strings
+        records = await run_in_threadpool(frame_to_records, df)
+
+        content = {"data": records}
+        if limit is not None:
+            next_offset = offset + len(records)
+            content.update(
+                offset=offset,
+                limit=limit,
+                total=total,
+                next_offset=next_offset if next_offset < total else None,
+            )
         
-        return {"data": records}
-    
+        body = await run_in_threadpool(dumps, content)
+        return Response(content=body, media_type="application/json", headers=cache_headers)
+
+    except HTTPException:
+        raise
     except Exception as e:
-        # Print full traceback for debugging
-        traceback_str = traceback.format_exc()
-        print(f"Error in get_uploaded_data: {str(e)}")
-        print(f"Traceback: {traceback_str}")
-        
+        logger.exception("Reading uploaded data failed", extra={"user_id": current_user.id})
+
         # Return a more detailed error
         raise HTTPException(
             status_code=500, 
             detail=f"Failed to read file: {str(e)}. Please check file format and contents."
         )
+
+
+@router.get("/uploaded-data/summary")
+async def get_uploaded_data_summary(request: Request, current_user: User = Depends(get_current_user)):
+    """
+    Per-column summary of the most recently uploaded file: count, null count, distinct
+    estimate, and sum/mean/min/max with a histogram for numeric columns. Precomputed at
+    upload time, so the cost doesn't depend on the size of the file.
+    """
+    upload = await get_latest_upload(current_user.id)
+    if not upload:
+        return {"rows": 0, "columns": []}
+    latest_file = upload.file_path
+
+    etag, last_modified = _upload_validators(upload, "summary")
+    if is_not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    try:
+        content = await run_in_threadpool(load_upload_summary, latest_file)
+    except Exception as e:
+        logger.exception("Summarizing uploaded data failed", extra={"file_path": latest_file})
+        raise HTTPException(status_code=500, detail=f"Failed to summarize file: {str(e)}")
+    return Response(content=content, media_type="application/json", headers=validator_headers(etag, last_modified))
+
+
+def _project_columns(df: "pd.DataFrame", columns: str) -> "pd.DataFrame":
+    """Keep only the requested columns, in the requested order."""
+    by_name = {str(col): i for i, col in enumerate(df.columns)}
+    requested = [name.strip() for name in columns.split(",") if name.strip()]
+    missing = [name for name in requested if name not in by_name]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(missing)}")
+    return df.iloc[:, [by_name[name] for name in requested]]
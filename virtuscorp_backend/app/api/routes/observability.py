@@ -0,0 +1,56 @@
+# app/api/routes/observability.py
+
+import hmac
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, Response
+from starlette.concurrency import run_in_threadpool
+
+from app.config import APP_ENV, METRICS_TOKEN, PROFILER_ENABLED, PROFILER_MAX_SECONDS
+from app.utils.instrumentation import METRICS_MEDIA_TYPE, render_metrics
+from app.utils.profiler import DEFAULT_INTERVAL, profile_for
+
+router = APIRouter()
+
+
+def _check_metrics_token(request: Request):
+    # Compared in constant time, so response times don't reveal how much of a guess matched
+    authorization = request.headers.get("authorization", "").encode()
+    if not hmac.compare_digest(authorization, f"Bearer {METRICS_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    """
+    Request latencies and spans in the Prometheus text format, for scraping.
+    Requires METRICS_TOKEN as a bearer token; only development serves it without one.
+    """
+    if METRICS_TOKEN:
+        _check_metrics_token(request)
+    elif APP_ENV != "development":
+        raise HTTPException(status_code=404, detail="Not Found")
+    # Reads the sample files of every worker process under app.server
+    return Response(await run_in_threadpool(render_metrics), media_type=METRICS_MEDIA_TYPE)
+
+
+@router.get("/api/debug/profile", response_class=PlainTextResponse)
+async def get_profile(
+    request: Request,
+    seconds: float = Query(10, gt=0, le=PROFILER_MAX_SECONDS),
+    interval: float = Query(DEFAULT_INTERVAL, ge=0.001, le=1),
+):
+    """
+    Sample the stacks of the worker process serving this request for the given number
+    of seconds, while it keeps handling other requests, and return them collapsed
+    (one "frame;frame;frame count" line per stack) for flame graph tools.
+    Only available with PROFILER_ENABLED and a METRICS_TOKEN, which it requires as a
+    bearer token like GET /metrics; one profile per process at a time.
+    """
+    if not PROFILER_ENABLED or not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    _check_metrics_token(request)
+    try:
+        return await profile_for(seconds, interval)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
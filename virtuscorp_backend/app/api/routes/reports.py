@@ -1,52 +1,175 @@
 # app/api/routes/reports.py
 
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from app.crud.upload import find_latest_upload
 from app.models.user import User
 from app.models.report import Report
+from app.utils.conditional import is_not_modified, make_etag, not_modified_response, validator_headers
 from app.utils.helpers import get_current_user
 from app.schemas.report import ReportGenerateRequest, ReportResponse
-import pandas as pd
-import io
-import json
+from app.services.report_cache import report_cache, report_cache_key
+from app.services.report_jobs import get_job_stage, submit_combined_report_job, submit_report_job
+from app.services.uploads import file_digest, pin_upload, remove_upload
+from starlette.concurrency import run_in_threadpool
+from tortoise.expressions import Q
+import base64
+import logging
 import os
-import glob
-import traceback
 from datetime import datetime, timezone
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from typing import List
+from typing import TYPE_CHECKING, List, Optional
+
+if TYPE_CHECKING:
+    from app.services.report_options import ReportOptions
 
 router = APIRouter()
-UPLOAD_DIR = "uploaded_files"
+logger = logging.getLogger(__name__)
 REPORTS_DIR = "reports"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
 os.makedirs(REPORTS_DIR, exist_ok=True)
 
-# Register a font with Cyrillic support
-try:
-    pdfmetrics.registerFont(TTFont("DejaVuSans", "DejaVuSans.ttf"))
-except Exception as e:
-    print(f"Warning: Could not register DejaVuSans font: {str(e)}")
+
+def _report_response(report: Report) -> dict:
+    """Serialize a report, with its download URL once the file is ready."""
+    file_ready = report.status == "completed" and report.file_path
+    return {
+        "id": report.id,
+        "title": report.title,
+        "report_type": report.report_type,
+        "filters_applied": report.filters_applied,
+        "export_format": report.export_format,
+        "created_at": report.created_at,
+        "status": report.status,
+        "progress": get_job_stage(report.id) if report.status == "in-progress" else None,
+        "file_url": f"/api/reports/{report.id}/download" if file_ready else None,
+    }
+
+
+def _encode_cursor(report: Report) -> str:
+    raw = f"{report.created_at.isoformat()}|{report.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, report_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(report_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _combined_sections(report_type: str) -> List[str]:
+    """Report types of a combined report: a comma-separated list, or all for every type."""
+    # The exporters (and pandas) are imported on first use, not at startup
+    from app.services.exporters import REPORT_TYPES
+
+    if report_type.strip() == "all":
+        return list(REPORT_TYPES)
+    sections = list(dict.fromkeys(t.strip() for t in report_type.split(",") if t.strip()))
+    unknown = [t for t in sections if t not in REPORT_TYPES]
+    if unknown or not sections:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Combined reports are made of: {', '.join(REPORT_TYPES)} (or all); got {report_type}",
+        )
+    return sections
+
+
+async def _report_options(report_data: ReportGenerateRequest, file_path: str) -> "ReportOptions":
+    """The request's data selection options, checked against the columns of the upload."""
+    from app.services.report_options import ReportOptions, validate_report_options
+
+    options = ReportOptions.from_request(report_data)
+    try:
+        await run_in_threadpool(validate_report_options, options, file_path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid report options: {str(e)}")
+    return options
+
+
+async def _sections_with_data(options: "ReportOptions", file_path: str, sections: List[str]) -> Optional[List[str]]:
+    """
+    The sections of a combined report that have columns in the upload. Uploads without
+    columns of any section (e.g. name/value metric files) are rendered as one section.
+    """
+    from app.services.report_options import sections_with_data
+
+    found = await run_in_threadpool(sections_with_data, options, file_path, sections)
+    if not found:
+        logger.info("No section columns in the upload, rendering one section", extra={"sections": sections})
+    return found or None
 
 
 @router.get("/reports", response_model=List[ReportResponse])
-async def get_reports(current_user: User = Depends(get_current_user)):
-    """Get all reports for the current user."""
-    reports = await Report.filter(user=current_user).all()
-    return reports
+async def get_reports(
+    response: Response,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value of the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    report_type: Optional[str] = None,
+    status: Optional[str] = None,
+    export_format: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Get the current user's reports, newest first, one page at a time.
+    When more reports exist, the X-Next-Cursor response header holds the cursor of the next page.
+    """
+    query = Report.filter(user_id=current_user.id)
+    for field, value in (("report_type", report_type), ("status", status), ("export_format", export_format)):
+        if value is not None:
+            query = query.filter(**{field: value})
+    if cursor:
+        created_at, report_id = _decode_cursor(cursor)
+        query = query.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=report_id))
+
+    # One extra row tells whether there is a next page
+    reports = await query.order_by("-created_at", "-id").limit(limit + 1)
+    if len(reports) > limit:
+        reports = reports[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(reports[-1])
+    return [_report_response(report) for report in reports]
 
 
 @router.get("/reports/{report_id}", response_model=ReportResponse)
 async def get_report(report_id: int, current_user: User = Depends(get_current_user)):
-    """Get a specific report by ID."""
+    """Get a specific report by ID, including the progress of its generation."""
+    report = await Report.get_or_none(id=report_id, user=current_user)
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return _report_response(report)
+
+
+@router.get("/reports/{report_id}/download")
+async def download_report(report_id: int, request: Request, current_user: User = Depends(get_current_user)):
+    """
+    Download the file of a completed report. The ETag comes from the report id and the
+    file's hash, so a client with a current copy gets a 304; Range requests resume
+    interrupted downloads.
+    """
     report = await Report.get_or_none(id=report_id, user=current_user)
     if not report:
         raise HTTPException(status_code=404, detail="Report not found")
-    return report
+    if report.status != "completed":
+        raise HTTPException(status_code=409, detail=f"Report is not ready (status: {report.status})")
+    if not report.file_path or not os.path.exists(report.file_path):
+        raise HTTPException(status_code=404, detail="Report file not found")
+
+    from app.services.exporters import get_exporter
+
+    # Hashed once per file version and process, then remembered
+    digest = await run_in_threadpool(file_digest, report.file_path)
+    etag = make_etag(report.id, digest)
+    last_modified = os.path.getmtime(report.file_path)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    # FileResponse answers Range and If-Range requests against these validators
+    return FileResponse(
+        report.file_path,
+        media_type=get_exporter(report.export_format).media_type,
+        filename=os.path.basename(report.file_path),
+        headers=validator_headers(etag, last_modified),
+    )
 
 
 @router.delete("/reports/{report_id}")
@@ -59,146 +182,152 @@ async def delete_report(report_id: int, current_user: User = Depends(get_current
     return {"message": "Report deleted successfully"}
 
 
-@router.post("/reports/generate", response_class=Response)
+@router.post("/reports/generate", response_model=ReportResponse, status_code=202)
 async def generate_report(
-    report_data: ReportGenerateRequest, current_user: User = Depends(get_current_user)
+    report_data: ReportGenerateRequest,
+    response: Response,
+    current_user: User = Depends(get_current_user),
 ):
     """
-    Generate a report based on the uploaded data.
-    Returns a PDF file.
+    Start generating a report based on the uploaded data.
+    Returns the in-progress report right away; poll GET /reports/{id} and fetch the
+    file from its file_url once the status is completed. When the same report was
+    already rendered from the same data, it is returned completed with status 200.
+    With combine_reports, report_type lists the sections (comma-separated, or all),
+    which are rendered in parallel and merged into one PDF or multi-sheet XLSX. Each
+    section holds the identifying columns plus the columns of its report type; sections
+    the upload has no columns for are left out.
+    filters (see app/services/filters.py) and date_range select the rows to report on.
     """
+    from app.services.exporters import get_exporter
+
     try:
-        # Log the current user information for debugging
-        print(
-            f"Report generation requested by user ID: {current_user.id}, email: {current_user.email}"
-        )
+        try:
+            exporter = get_exporter(report_data.export_format)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        sections = None
+        if report_data.combine_reports:
+            if not exporter.combinable:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Export format {report_data.export_format} can't be combined; use pdf or excel.",
+                )
+            sections = _combined_sections(report_data.report_type)
 
         # Find the latest uploaded file for the user
-        files = glob.glob(f"{UPLOAD_DIR}/user_{current_user.id}_*")
-        if not files:
+        latest_file = await find_latest_upload(current_user.id)
+        if not latest_file:
             raise HTTPException(
                 status_code=404,
                 detail="No data file found. Please upload a file first.",
             )
 
-        latest_file = max(files, key=os.path.getctime)
-        print(f"Using file: {latest_file}")
-
-        # Read the data from the file
-        try:
-            if latest_file.endswith(".csv"):
-                df = pd.read_csv(latest_file)
-            else:
-                df = pd.read_excel(latest_file)
-
-            if df.empty:
-                raise HTTPException(status_code=400, detail="The data file is empty.")
-
-            print(f"Data loaded successfully. Shape: {df.shape}")
-        except Exception as e:
-            print(f"Error reading data file: {str(e)}")
-            traceback_str = traceback.format_exc()
-            print(f"Traceback: {traceback_str}")
-            raise HTTPException(
-                status_code=500, detail=f"Failed to read data file: {str(e)}"
-            )
-
-        # Create a PDF document
-        buffer = io.BytesIO()
-        styles = getSampleStyleSheet()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        elements = []
-
-        # Add title
-        report_title = f"Отчет: {report_data.report_type}"
-        elements.append(Paragraph(report_title, styles["Heading1"]))
-
-        # Convert DataFrame to table for PDF
-        headers = df.columns.tolist()
-        data = [headers]
-        for _, row in df.iterrows():
-            data.append([str(x) for x in row.tolist()])
-
-        table = Table(data)
-        table_style = TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (-1, 0), colors.lightblue),
-                ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
-                ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-                ("GRID", (0, 0), (-1, -1), 1, colors.black),
-            ]
-        )
-
-        table.setStyle(table_style)
-        elements.append(table)
-
-        # Build the PDF
-        doc.build(elements)
-        pdf_data = buffer.getvalue()
-        buffer.close()
-
-        # Generate filename
-        timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-        filename = f"{report_data.report_type}_{timestamp}.pdf"
-        file_path = os.path.join(REPORTS_DIR, filename)
-
-        # Save the PDF to disk
-        with open(file_path, "wb") as f:
-            f.write(pdf_data)
-
-        # Create a record in the database - FIX FOR FOREIGN KEY ISSUE
+        # The job reads a private link to the upload, so a re-upload before it runs can't
+        # change what is rendered under the cache key of the contents hashed here
+        source_path = await run_in_threadpool(pin_upload, latest_file)
+        queued = False
         try:
-            # Debug: Print user details to verify
-            print(f"Creating report record with user ID: {current_user.id}")
-            print(f"User model details: {current_user.__dict__}")
-
-            # First check if the user exists in the database
-            user_exists = await User.exists(id=current_user.id)
-            if not user_exists:
-                print(
-                    f"WARNING: User with ID {current_user.id} does not exist in the database"
-                )
-                # Return the PDF without creating a record
-                return Response(
-                    content=pdf_data,
-                    media_type="application/pdf",
-                    headers={
-                        "Content-Disposition": f'attachment; filename="{filename}"'
-                    },
-                )
+            options = await _report_options(report_data, source_path)
+            if sections:
+                sections = await _sections_with_data(options, source_path, sections)
+            source_digest = await run_in_threadpool(file_digest, source_path)
+            cache_key = report_cache_key(source_digest, report_data)
 
-            # Try creating the report with user_id instead of user object
+            report_title = f"Отчет: {report_data.report_type}"
+            report_type = report_data.report_type
+            if sections:
+                report_title = f"Сводный отчет: {', '.join(sections)}"
+                report_type = ",".join(sections)
             report = await Report.create(
                 title=report_title,
                 user_id=current_user.id,  # Use user_id instead of user
-                report_type=report_data.report_type,
-                status="completed",
+                report_type=report_type,
+                status="in-progress",
                 filters_applied=report_data.filters or "",
                 export_format=report_data.export_format,
-                file_path=file_path,
             )
 
-            print(f"Created report record with ID: {report.id}")
-        except Exception as e:
-            print(f"Error creating report record: {str(e)}")
-            traceback_str = traceback.format_exc()
-            print(f"Traceback: {traceback_str}")
-            # Continue even if the database record creation fails
-
-        # Return the PDF file
-        return Response(
-            content=pdf_data,
-            media_type="application/pdf",
-            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
-        )
+            try:
+                # Generate filename
+                timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+                name = "combined" if sections else report_data.report_type
+                filename = f"{name}_{timestamp}_{report.id}.{exporter.extension}"
+                file_path = os.path.join(REPORTS_DIR, filename)
+
+                if await run_in_threadpool(report_cache.fetch, cache_key, file_path):
+                    report.status = "completed"
+                    report.file_path = file_path
+                    await report.save(update_fields=["status", "file_path"])
+                    response.status_code = 200
+                    logger.info("Report served from cache", extra={"report_id": report.id, "file_path": file_path})
+                    return _report_response(report)
+
+                # Reading the data, exporting it and writing the file happen in worker processes
+                if sections:
+                    section_options = [(f"Отчет: {section}", options._replace(section=section)) for section in sections]
+                    submit_combined_report_job(report, source_path, file_path, section_options, cache_key)
+                else:
+                    submit_report_job(report, source_path, file_path, cache_key, options)
+                queued = True
+                logger.info(
+                    "Report queued",
+                    extra={"report_id": report.id, "report_type": report_type, "source": latest_file, "file_path": file_path},
+                )
+            except Exception:
+                # The row would otherwise stay in progress and be polled forever
+                report.status = "failed"
+                await report.save(update_fields=["status"])
+                raise
+
+            return _report_response(report)
+        finally:
+            if not queued:
+                await run_in_threadpool(remove_upload, source_path)
 
     except HTTPException as e:
         raise e
     except Exception as e:
-        print(f"Error generating report: {str(e)}")
-        traceback_str = traceback.format_exc()
-        print(f"Traceback: {traceback_str}")
+        logger.exception("Report generation failed", extra={"user_id": current_user.id})
 
         raise HTTPException(
             status_code=500, detail=f"Error generating report: {str(e)}"
         )
+
+
+@router.post("/reports/export")
+async def export_report(
+    report_data: ReportGenerateRequest, current_user: User = Depends(get_current_user)
+):
+    """
+    Stream the uploaded data in a streamable format (csv, json) straight to the client,
+    without creating a report or laying out a document.
+    """
+    from app.services.exporters import get_exporter, report_chunks
+
+    try:
+        exporter = get_exporter(report_data.export_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not exporter.streamable:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Export format {report_data.export_format} can't be streamed; use /reports/generate.",
+        )
+
+    latest_file = await find_latest_upload(current_user.id)
+    if not latest_file:
+        raise HTTPException(
+            status_code=404,
+            detail="No data file found. Please upload a file first.",
+        )
+    options = await _report_options(report_data, latest_file)
+
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    filename = f"{report_data.report_type}_{timestamp}.{exporter.extension}"
+    chunks = report_chunks(latest_file, options)
+    return StreamingResponse(
+        exporter.iter_bytes(chunks, f"Отчет: {report_data.report_type}"),
+        media_type=exporter.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from app.models.user import User
 from app.schemas.user import UserProfileUpdate, UserProfileResponse
-from app.utils.helpers import get_current_user
+from app.services.last_login import discard_pending_login, latest_last_login
+from app.utils.helpers import get_current_user, invalidate_cached_user
 import os
 from datetime import datetime, timezone
 import uuid
@@ -26,7 +27,7 @@ async def get_user_profile(current_user: User = Depends(get_current_user)):
         "department": current_user.department,
         "phone": current_user.phone,
         "avatar_url": current_user.avatar_url,
-        "last_login": current_user.last_login
+        "last_login": latest_last_login(current_user.id, current_user.last_login)
     }
 
 @router.put("/profile", response_model=UserProfileResponse)
@@ -36,21 +37,24 @@ async def update_user_profile(
 ):
     """Update the current user's profile"""
     # Update only the fields that are provided
-    if profile_data.full_name is not None:
-        current_user.full_name = profile_data.full_name
-    if profile_data.position is not None:
-        current_user.position = profile_data.position
-    if profile_data.department is not None:
-        current_user.department = profile_data.department
-    if profile_data.phone is not None:
-        current_user.phone = profile_data.phone
-    if profile_data.avatar_url is not None:
-        current_user.avatar_url = profile_data.avatar_url
+    changed = [
+        field
+        for field in ("full_name", "position", "department", "phone", "avatar_url")
+        if getattr(profile_data, field) is not None
+    ]
+    for field in changed:
+        setattr(current_user, field, getattr(profile_data, field))
     
     # Fix: Use timezone-aware datetime for last_login
     current_user.last_login = datetime.now(timezone.utc)
     
-    await current_user.save()
+    try:
+        # Write only the changed columns
+        await current_user.save(update_fields=changed + ["last_login"])
+        # An older buffered login must not be flushed over it
+        discard_pending_login(current_user.id)
+    finally:
+        invalidate_cached_user(current_user.id)
     
     return {
         "id": current_user.id,
@@ -100,6 +104,9 @@ async def upload_avatar(
     # Update the user's avatar_url
     avatar_url = f"/uploads/avatars/{unique_filename}"
     current_user.avatar_url = avatar_url
-    await current_user.save()
+    try:
+        await current_user.save(update_fields=["avatar_url"])
+    finally:
+        invalidate_cached_user(current_user.id)
     
     return {"avatar_url": avatar_url}
@@ -1,9 +1,10 @@
+import httpx
 from fastapi import APIRouter, Depends, HTTPException
 from app.schemas.yandex import YandexMarketCredentials
 from app.models.yandex import YandexIntegration
 from app.models.user import User
+from app.services import yandex_sync
 from app.utils.helpers import get_current_user
-import httpx
 
 router = APIRouter()
 
@@ -14,6 +15,9 @@ async def save_yandex_creds(
 ):
     existing = await YandexIntegration.get_or_none(user=current_user)
     if existing:
+        if existing.campaign_id != creds.campaign_id:
+            # Another campaign's stats start from the lookback period again
+            existing.synced_until = None
         existing.campaign_id = creds.campaign_id
         existing.business_id = creds.business_id
         existing.token = creds.token
@@ -33,18 +37,27 @@ async def test_yandex_connection(
     creds: YandexMarketCredentials,
     current_user: User = Depends(get_current_user),
 ):
-    url = f"https://api.partner.market.yandex.ru/campaigns/{creds.campaign_id}/stats"
-    headers = {
-        "Authorization": f"Bearer {creds.token}",
-        "Accept": "application/json"
-    }
+    try:
+        await yandex_sync.request("GET", f"/campaigns/{creds.campaign_id}", creds.token, retries=1)
+        return {"success": True}
+    except yandex_sync.YandexAPIError as e:
+        return {"success": False, "detail": e.detail}
+    except httpx.HTTPError as e:
+        # Timeouts and connection errors left after the retry
+        return {"success": False, "detail": str(e) or type(e).__name__}
+
+
+@router.post("/yandex-market/sync")
+async def sync_yandex_stats(current_user: User = Depends(get_current_user)):
+    integration = await YandexIntegration.get_or_none(user=current_user)
+    if integration is None:
+        raise HTTPException(status_code=404, detail="Yandex credentials are not saved")
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers)
-
-        if response.status_code == 200:
-            return {"success": True}
-        return {"success": False, "detail": response.text}
-    except Exception as e:
-        return {"success": False, "detail": str(e)}
+        rows = await yandex_sync.sync_claimed(integration)
+    except yandex_sync.SyncInProgress:
+        raise HTTPException(status_code=409, detail="Yandex sync is already running")
+    except yandex_sync.YandexAPIError as e:
+        raise HTTPException(status_code=502, detail=e.detail)
+
+    return {"rows": rows, "synced_until": integration.synced_until}
@@ -4,6 +4,9 @@ import os
 
 
 def get_database_url():
+    # A full URL (e.g. for a local database) takes precedence over the Docker secret
+    if os.getenv("DATABASE_URL"):
+        return os.getenv("DATABASE_URL")
     try:
         with open("/run/secrets/db_password", "r") as f:
             password = f.read().strip()
@@ -11,3 +14,104 @@ def get_database_url():
         password = os.getenv("DB_PASSWORD", "")
 
     return f"postgres://postgres:{password}@db:5432/virtuscorp_db"
+
+
+# development or production; production expects the schema to be kept up to date by migrations
+APP_ENV = os.getenv("APP_ENV", "development")
+# Create missing tables at startup; off by default in production, where entrypoint.sh
+# runs migrations/create_schema.py once before the workers start
+GENERATE_SCHEMAS = os.getenv("GENERATE_SCHEMAS", str(APP_ENV != "production")).lower() in ("1", "true", "yes")
+
+# API worker processes started by app.server; in-memory caches are per process, while
+# uploads, reports, the report cache and job and ingestion states are shared through
+# the database and the disk
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", min(4, os.cpu_count() or 1) if APP_ENV == "production" else 1))
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", 8000))
+# Event loop and HTTP parser of the workers: uvloop/httptools, or auto to fall back when missing
+SERVER_LOOP = os.getenv("SERVER_LOOP", "uvloop")
+SERVER_HTTP = os.getenv("SERVER_HTTP", "httptools")
+SERVER_KEEP_ALIVE = int(os.getenv("SERVER_KEEP_ALIVE", 5))
+# Addresses (or CIDR networks) of the reverse proxy, whose X-Forwarded-For/-Proto headers
+# are trusted for client addresses and schemes; anyone else's are ignored
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+# asyncpg pool of each worker process; WEB_CONCURRENCY * DB_POOL_MAX_SIZE must stay
+# below the server's max_connections
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 2))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+# Prepared statements cached per connection; 0 behind a transaction-pooling pgbouncer
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+# Seconds before a query is cancelled, and before an idle pooled connection is closed
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", 60))
+DB_MAX_INACTIVE_CONNECTION_LIFETIME = float(os.getenv("DB_MAX_INACTIVE_CONNECTION_LIFETIME", 300))
+
+# Upper bound for parsed uploads kept in memory by each worker process
+UPLOAD_CACHE_MAX_BYTES = int(os.getenv("UPLOAD_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Uploads are refused by Content-Length, or cut off while streaming, once they exceed the limit
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 100 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+# Rows read (after the header) to validate an upload before accepting it
+UPLOAD_SNIFF_ROWS = int(os.getenv("UPLOAD_SNIFF_ROWS", 100))
+
+# Rows per COPY batch when persisting uploaded data into the metrics table
+METRIC_INGEST_BATCH_SIZE = int(os.getenv("METRIC_INGEST_BATCH_SIZE", 5000))
+
+# Seconds between refreshes of the metric rollup tables
+ROLLUP_REFRESH_INTERVAL = float(os.getenv("ROLLUP_REFRESH_INTERVAL", 10))
+
+# Worker processes rendering reports in the background, per API worker process
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", 2))
+# Reports still in progress after this many seconds are considered abandoned
+REPORT_JOB_STALE_AFTER = int(os.getenv("REPORT_JOB_STALE_AFTER", 3600))
+# Start the report workers (and load their fonts and renderers) in the background after startup
+REPORT_WORKERS_PREWARM = os.getenv("REPORT_WORKERS_PREWARM", "true").lower() in ("1", "true", "yes")
+
+# Rendered reports are reused for identical requests on the same data, up to this total size
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", os.path.join("reports", ".cache"))
+REPORT_CACHE_MAX_BYTES = int(os.getenv("REPORT_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
+# Seconds a verified token and a user row are reused by get_current_user in each worker
+# process; profile changes elsewhere show up within this delay. 0 disables the cache
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", 30))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", 10_000))
+
+# Threads hashing and verifying passwords; logins beyond this wait in a queue
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+# bcrypt cost factor; stored hashes with a lower cost are rehashed on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+
+# Seconds between batched writes of users' last_login times; 0 writes each login directly
+LAST_LOGIN_FLUSH_INTERVAL = float(os.getenv("LAST_LOGIN_FLUSH_INTERVAL", 5))
+
+# Yandex Market Partner API, pulled into the metrics of users with stored credentials
+YANDEX_API_URL = os.getenv("YANDEX_API_URL", "https://api.partner.market.yandex.ru")
+# Seconds between sync runs; 0 disables the background sync
+YANDEX_SYNC_INTERVAL = float(os.getenv("YANDEX_SYNC_INTERVAL", 900))
+# Days fetched by the first sync of an integration
+YANDEX_SYNC_LOOKBACK_DAYS = int(os.getenv("YANDEX_SYNC_LOOKBACK_DAYS", 30))
+# Integrations synced at the same time by each worker process
+YANDEX_SYNC_CONCURRENCY = int(os.getenv("YANDEX_SYNC_CONCURRENCY", 4))
+# Seconds a worker may hold an integration before another one can take it over
+YANDEX_SYNC_LEASE = int(os.getenv("YANDEX_SYNC_LEASE", 600))
+# Requests per second sent with each token
+YANDEX_RATE_LIMIT = float(os.getenv("YANDEX_RATE_LIMIT", 5))
+# Pooled connections of the shared HTTP/2 client and its timeout in seconds
+YANDEX_MAX_CONNECTIONS = int(os.getenv("YANDEX_MAX_CONNECTIONS", 20))
+YANDEX_TIMEOUT = float(os.getenv("YANDEX_TIMEOUT", 30))
+# Retries of throttled, failed (5xx) and broken requests; backoff doubles from this many seconds
+YANDEX_MAX_RETRIES = int(os.getenv("YANDEX_MAX_RETRIES", 4))
+YANDEX_RETRY_BACKOFF = float(os.getenv("YANDEX_RETRY_BACKOFF", 1))
+
+# Log level and format of every process: json (one object per line) or text
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json" if APP_ENV == "production" else "text")
+# Requests slower than this many seconds are logged as warnings
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", 1))
+# Bearer token of GET /metrics and GET /api/debug/profile; without it they are not served,
+# except GET /metrics in development
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Allow holders of METRICS_TOKEN to run the sampling profiler; at most this many seconds per run
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", 60))
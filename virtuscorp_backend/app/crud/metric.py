@@ -0,0 +1,332 @@
+from datetime import date, datetime, timezone
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+from tortoise import connections
+from tortoise.backends.asyncpg.client import AsyncpgDBClient
+from tortoise.transactions import in_transaction
+
+from app.models.metric import Metric, MetricRollupDaily, MetricRollupDirty, MetricRollupMonthly
+from app.services.filters import compile_sql, metric_fields
+from app.utils.instrumentation import traced
+
+# Column order of the tuples passed to bulk_insert_metrics
+METRIC_COLUMNS = ("name", "value", "timestamp", "user_id", "marketplace", "category")
+
+# Serializes rollup refreshes across worker processes
+ROLLUP_LOCK_ID = 0x6D657472  # "metr"
+
+
+def _batches(rows: Iterable[tuple], batch_size: int) -> Iterable[List[tuple]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _utc_day(ts: datetime) -> date:
+    return ts.astimezone(timezone.utc).date() if ts.tzinfo else ts.date()
+
+
+@traced("db.bulk_insert_metrics")
+async def bulk_insert_metrics(
+    rows: Iterable[Sequence],
+    batch_size: int,
+    on_progress: Optional[Callable[[int], None]] = None,
+    upload: Optional[Tuple[int, str]] = None,
+) -> int:
+    """
+    Insert metric rows (tuples in METRIC_COLUMNS order) in fixed-size batches, all in one transaction.
+    Uses asyncpg COPY on PostgreSQL and falls back to bulk_create on other backends.
+    on_progress receives the number of rows written so far after every batch.
+    With upload, a (user_id, stored path) pair, the rows are tagged with the upload and
+    replace the ones ingested from it before, so uploading a file again doesn't count it twice.
+    The touched days are queued for the rollup refresher in the same transaction.
+    Called inside in_transaction(), the rows join the caller's transaction.
+    """
+    written = 0
+    touched = set()
+    conn = connections.get("default")
+    columns = METRIC_COLUMNS
+    if upload:
+        columns = METRIC_COLUMNS + ("upload_path",)
+        rows = (tuple(row) + (upload[1],) for row in rows)
+
+    if isinstance(conn, AsyncpgDBClient):
+        async with conn.acquire_connection() as pg:
+            async with pg.transaction():
+                if upload:
+                    # Days losing rows are recomputed too, even if the new rows skip them
+                    await pg.execute(
+                        f"""
+                        WITH deleted AS (
+                            DELETE FROM {Metric._meta.db_table} WHERE user_id = $1 AND upload_path = $2
+                            RETURNING (timestamp AT TIME ZONE 'UTC')::date AS bucket
+                        )
+                        INSERT INTO {MetricRollupDirty._meta.db_table} (user_id, bucket)
+                        SELECT DISTINCT $1::int, bucket FROM deleted
+                        ON CONFLICT DO NOTHING
+                        """,
+                        upload[0],
+                        upload[1],
+                    )
+                for batch in _batches(rows, batch_size):
+                    await pg.copy_records_to_table(Metric._meta.db_table, records=batch, columns=columns)
+                    touched.update((row[3], _utc_day(row[2])) for row in batch)
+                    written += len(batch)
+                    if on_progress:
+                        on_progress(written)
+                if touched:
+                    user_ids, days = zip(*touched)
+                    await pg.execute(
+                        f"""
+                        INSERT INTO {MetricRollupDirty._meta.db_table} (user_id, bucket)
+                        SELECT * FROM unnest($1::int[], $2::date[])
+                        ON CONFLICT DO NOTHING
+                        """,
+                        list(user_ids),
+                        list(days),
+                    )
+        return written
+
+    async with in_transaction():
+        if upload:
+            previous = Metric.filter(user_id=upload[0], upload_path=upload[1])
+            touched.update((upload[0], _utc_day(ts)) for ts in await previous.values_list("timestamp", flat=True))
+            await previous.delete()
+        for batch in _batches(rows, batch_size):
+            await Metric.bulk_create([Metric(**dict(zip(columns, row))) for row in batch])
+            touched.update((row[3], _utc_day(row[2])) for row in batch)
+            written += len(batch)
+            if on_progress:
+                on_progress(written)
+        await MetricRollupDirty.bulk_create(
+            [MetricRollupDirty(user_id=user_id, bucket=day) for user_id, day in touched],
+            ignore_conflicts=True,
+        )
+    return written
+
+
+# Columns filter expressions can refer to; rollups keep labels as '' instead of NULL
+RAW_FILTER_FIELDS = {
+    "name": ("m.name", "text"),
+    "marketplace": ("COALESCE(m.marketplace, '')", "text"),
+    "category": ("COALESCE(m.category, '')", "text"),
+    "value": ("m.value", "number"),
+    "timestamp": ('m."timestamp"', "timestamp"),
+}
+ROLLUP_FILTER_FIELDS = {
+    "name": ("r.name", "text"),
+    "marketplace": ("r.marketplace", "text"),
+    "category": ("r.category", "text"),
+}
+
+ROLLUP_COLUMNS = "user_id, name, marketplace, category, bucket, value_count, value_sum, value_min, value_max"
+ROLLUP_UPSERT = """
+    ON CONFLICT (user_id, name, marketplace, category, bucket) DO UPDATE SET
+        value_count = EXCLUDED.value_count,
+        value_sum = EXCLUDED.value_sum,
+        value_min = EXCLUDED.value_min,
+        value_max = EXCLUDED.value_max
+"""
+
+
+@traced("db.refresh_rollups")
+async def refresh_rollups() -> int:
+    """
+    Recompute the daily and monthly rollups of every queued day, then clear the queue.
+    Only buckets touched by newly ingested rows are recomputed. Returns the number of
+    days processed, or 0 when the queue is empty or another process holds the lock.
+    PostgreSQL only.
+    """
+    daily = MetricRollupDaily._meta.db_table
+    monthly = MetricRollupMonthly._meta.db_table
+    dirty = MetricRollupDirty._meta.db_table
+    metrics = Metric._meta.db_table
+
+    conn = connections.get("default")
+    async with conn.acquire_connection() as pg:
+        async with pg.transaction():
+            if not await pg.fetchval("SELECT pg_try_advisory_xact_lock($1)", ROLLUP_LOCK_ID):
+                return 0
+            days = await pg.fetch(f"DELETE FROM {dirty} RETURNING user_id, bucket")
+            if not days:
+                return 0
+            user_ids = [row["user_id"] for row in days]
+            buckets = [row["bucket"] for row in days]
+
+            # Days recomputed from scratch: drop old values (groups may have disappeared)
+            await pg.execute(
+                f"""
+                DELETE FROM {daily} r USING unnest($1::int[], $2::date[]) AS t(user_id, bucket)
+                WHERE r.user_id = t.user_id AND r.bucket = t.bucket
+                """,
+                user_ids,
+                buckets,
+            )
+            await pg.execute(
+                f"""
+                INSERT INTO {daily} ({ROLLUP_COLUMNS})
+                SELECT m.user_id, m.name, COALESCE(m.marketplace, ''), COALESCE(m.category, ''), t.bucket,
+                       COUNT(*), SUM(m.value), MIN(m.value), MAX(m.value)
+                FROM unnest($1::int[], $2::date[]) AS t(user_id, bucket)
+                JOIN {metrics} m
+                  ON m.user_id = t.user_id
+                 AND m."timestamp" >= t.bucket::timestamp AT TIME ZONE 'UTC'
+                 AND m."timestamp" < (t.bucket + 1)::timestamp AT TIME ZONE 'UTC'
+                GROUP BY 1, 2, 3, 4, 5
+                {ROLLUP_UPSERT}
+                """,
+                user_ids,
+                buckets,
+            )
+
+            # Months containing a recomputed day are rebuilt from the daily rollups
+            months = sorted({(user_id, day.replace(day=1)) for user_id, day in zip(user_ids, buckets)})
+            month_user_ids = [user_id for user_id, _ in months]
+            month_buckets = [month for _, month in months]
+            await pg.execute(
+                f"""
+                DELETE FROM {monthly} r USING unnest($1::int[], $2::date[]) AS t(user_id, bucket)
+                WHERE r.user_id = t.user_id AND r.bucket = t.bucket
+                """,
+                month_user_ids,
+                month_buckets,
+            )
+            await pg.execute(
+                f"""
+                INSERT INTO {monthly} ({ROLLUP_COLUMNS})
+                SELECT d.user_id, d.name, d.marketplace, d.category, t.bucket,
+                       SUM(d.value_count), SUM(d.value_sum), MIN(d.value_min), MAX(d.value_max)
+                FROM unnest($1::int[], $2::date[]) AS t(user_id, bucket)
+                JOIN {daily} d
+                  ON d.user_id = t.user_id
+                 AND d.bucket >= t.bucket
+                 AND d.bucket < (t.bucket + interval '1 month')::date
+                GROUP BY 1, 2, 3, 4, 5
+                {ROLLUP_UPSERT}
+                """,
+                month_user_ids,
+                month_buckets,
+            )
+            return len(days)
+
+
+# date_trunc units accepted by aggregate_metrics
+BUCKETS = ("day", "week", "month")
+# Rollup table (and its bucket unit) that serves each aggregation unit
+ROLLUP_SOURCES = {
+    "day": (MetricRollupDaily, "day"),
+    "week": (MetricRollupDaily, "day"),
+    "month": (MetricRollupMonthly, "month"),
+}
+
+
+def _aligned(value: Optional[datetime], unit: str) -> bool:
+    """Whether a range bound falls on a rollup bucket boundary (UTC)."""
+    if value is None:
+        return True
+    value = value.astimezone(timezone.utc) if value.tzinfo else value
+    if value.time() != datetime.min.time():
+        return False
+    return unit == "day" or value.day == 1
+
+
+@traced("db.aggregate_metrics")
+async def aggregate_metrics(
+    user_id: int,
+    bucket: str,
+    name: Optional[str] = None,
+    marketplace: Optional[str] = None,
+    category: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    where=None,
+) -> List[dict]:
+    """
+    Sum/avg/min/max of the user's metrics grouped by name, marketplace, category and
+    time bucket (UTC), computed by PostgreSQL. where is a parsed filter expression
+    (app.services.filters) compiled into the WHERE clause.
+
+    Closed periods are read from the rollup tables; the open bucket and days still queued
+    for the rollup refresher are aggregated from raw metrics. Ranges that don't fall on
+    rollup bucket boundaries, and filters on value or timestamp, are answered from raw
+    metrics only.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unsupported bucket: {bucket}")
+
+    rollup_model, rollup_unit = ROLLUP_SOURCES[bucket]
+    use_rollups = _aligned(start, rollup_unit) and _aligned(end, rollup_unit)
+    if where is not None and not metric_fields(where) <= ROLLUP_FILTER_FIELDS.keys():
+        use_rollups = False
+
+    # $1 user, $2 aggregation unit, $3 rollup bucket unit (rollup queries only); filters follow
+    params = [user_id, bucket] + ([rollup_unit] if use_rollups else [])
+    raw_conditions = ["m.user_id = $1"]
+    rollup_conditions = ["r.user_id = $1"]
+    for column, value in (("name", name), ("marketplace", marketplace), ("category", category)):
+        if value is not None:
+            params.append(value)
+            raw_conditions.append(f"m.{column} = ${len(params)}")
+            rollup_conditions.append(f"r.{column} = ${len(params)}")
+    if start is not None:
+        params.append(start)
+        raw_conditions.append(f'm."timestamp" >= ${len(params)}')
+        rollup_conditions.append(f"r.bucket >= (${len(params)}::timestamptz AT TIME ZONE 'UTC')::date")
+    if end is not None:
+        params.append(end)
+        raw_conditions.append(f'm."timestamp" < ${len(params)}')
+        rollup_conditions.append(f"r.bucket < (${len(params)}::timestamptz AT TIME ZONE 'UTC')::date")
+    if where is not None:
+        raw_conditions.append(compile_sql(where, RAW_FILTER_FIELDS, params))
+        if use_rollups:
+            rollup_conditions.append(compile_sql(where, ROLLUP_FILTER_FIELDS, params))
+
+    raw_select = f"""
+        SELECT date_trunc($2, m."timestamp" AT TIME ZONE 'UTC') AS bucket,
+               m.name, COALESCE(m.marketplace, '') AS marketplace, COALESCE(m.category, '') AS category,
+               COUNT(*) AS count, SUM(m.value) AS sum, MIN(m.value) AS min, MAX(m.value) AS max
+        FROM {Metric._meta.db_table} m
+        WHERE {" AND ".join(raw_conditions)}
+    """
+    if use_rollups:
+        open_start = "date_trunc($2, now() AT TIME ZONE 'UTC')"
+        sources = f"""
+            -- Rollup buckets that are stale because one of their days is still queued
+            stale AS (
+                SELECT DISTINCT date_trunc($3, q.bucket::timestamp)::date AS bucket
+                FROM {MetricRollupDirty._meta.db_table} q
+                WHERE q.user_id = $1
+            ),
+            parts AS (
+                SELECT date_trunc($2, r.bucket::timestamp) AS bucket,
+                       r.name, r.marketplace, r.category,
+                       r.value_count AS count, r.value_sum AS sum, r.value_min AS min, r.value_max AS max
+                FROM {rollup_model._meta.db_table} r
+                WHERE {" AND ".join(rollup_conditions)}
+                  AND r.bucket < {open_start}::date
+                  AND r.bucket NOT IN (SELECT bucket FROM stale)
+                UNION ALL
+                {raw_select}
+                  AND (m."timestamp" >= {open_start} AT TIME ZONE 'UTC'
+                       OR date_trunc($3, m."timestamp" AT TIME ZONE 'UTC')::date IN (SELECT bucket FROM stale))
+                GROUP BY 1, 2, 3, 4
+            )
+        """
+    else:
+        sources = f"parts AS ({raw_select} GROUP BY 1, 2, 3, 4)"
+
+    sql = f"""
+        WITH {sources}
+        SELECT bucket, name, NULLIF(marketplace, '') AS marketplace, NULLIF(category, '') AS category,
+               SUM(count)::bigint AS count, SUM(sum) AS sum, SUM(sum) / SUM(count) AS avg,
+               MIN(min) AS min, MAX(max) AS max
+        FROM parts
+        GROUP BY 1, 2, 3, 4
+        ORDER BY 1, 2, 3, 4
+    """
+    return await connections.get("default").execute_query_dict(sql, params)
@@ -0,0 +1,52 @@
+import os
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.models.upload import Upload
+
+
+async def create_upload(
+    user_id: int,
+    filename: str,
+    file_path: str,
+    size: int,
+    content_hash: str,
+    row_count: Optional[int],
+) -> Upload:
+    """Record a stored upload; an earlier upload stored at the same path is replaced by it."""
+    await Upload.filter(user_id=user_id, file_path=file_path).delete()
+    return await Upload.create(
+        user_id=user_id,
+        filename=filename,
+        file_path=file_path,
+        size=size,
+        content_hash=content_hash,
+        row_count=row_count,
+        format=os.path.splitext(file_path)[1].lstrip(".").lower(),
+    )
+
+
+async def find_latest_upload(user_id: int) -> Optional[str]:
+    """Return the stored path of the most recent upload of the user, if any."""
+    return await (
+        Upload.filter(user_id=user_id).order_by("-created_at").first().values_list("file_path", flat=True)
+    )
+
+
+async def get_latest_upload(user_id: int) -> Optional[Upload]:
+    """The most recent upload of the user, if any."""
+    return await Upload.filter(user_id=user_id).order_by("-created_at").first()
+
+
+async def find_upload_by_hash(content_hash: str, extension: str, user_id: Optional[int] = None) -> Optional[Upload]:
+    """The most recent upload with these contents and format, of the given user or of anyone."""
+    query = Upload.filter(content_hash=content_hash, format=extension.lstrip(".").lower())
+    if user_id is not None:
+        query = query.filter(user_id=user_id)
+    return await query.order_by("-created_at").first()
+
+
+async def touch_upload(upload: Upload):
+    """Make an earlier upload the user's latest one again."""
+    upload.created_at = datetime.now(timezone.utc)
+    await Upload.filter(id=upload.id).update(created_at=upload.created_at)
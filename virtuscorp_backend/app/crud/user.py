@@ -1,13 +1,53 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
 from passlib.context import CryptContext
+from tortoise import connections
+from tortoise.backends.asyncpg.client import AsyncpgDBClient
+from tortoise.expressions import Q
+
+from app.config import BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS
 from app.models.user import User
+from app.utils.instrumentation import traced
+
+# Hashes with fewer rounds than configured are upgraded on the next successful login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+
+# Users per UPDATE statement when writing buffered last_login times
+LAST_LOGIN_BATCH_SIZE = 1000
+
+# bcrypt releases the GIL, so hashing in threads keeps the event loop free; the bound
+# caps how much CPU a login storm can take from everything else
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+
+async def _run_hashing(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+
+
+@traced("auth.bcrypt_hash")
+async def hash_password(password: str) -> str:
+    return await _run_hashing(pwd_context.hash, password)
+
+
+@traced("auth.bcrypt_verify")
+async def verify_password(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    """Check a password; also returns a new hash when the stored one uses outdated settings."""
+    return await _run_hashing(pwd_context.verify_and_update, password, password_hash)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 async def get_user_by_email(email: str):
     return await User.get_or_none(email=email)
 
 async def create_user(user_data):
-    hashed_password = pwd_context.hash(user_data.password)
+    hashed_password = await hash_password(user_data.password)
     return await User.create(
         full_name=user_data.full_name,
         email=user_data.email,
@@ -17,6 +57,39 @@ async def create_user(user_data):
 
 async def verify_user(email: str, password: str):
     user = await get_user_by_email(email)
-    if user and pwd_context.verify(password, user.password_hash):  # Changed from hashed_password to password_hash
-        return user
-    return None
+    if not user:
+        return None
+    valid, new_hash = await verify_password(password, user.password_hash)
+    if not valid:
+        return None
+    if new_hash:
+        # Rehash on login after the hashing parameters changed
+        user.password_hash = new_hash
+        await user.save(update_fields=["password_hash"])
+    return user
+
+
+async def update_last_logins(logins: Dict[int, datetime]):
+    """Write the last_login time of many users; one statement per batch on PostgreSQL."""
+    conn = connections.get("default")
+    if not isinstance(conn, AsyncpgDBClient):
+        for user_id, last_login in logins.items():
+            # Never move last_login back, like the guard of the batch statement below
+            await User.filter(
+                Q(last_login__isnull=True) | Q(last_login__lt=last_login), id=user_id
+            ).update(last_login=last_login)
+        return
+
+    items = list(logins.items())
+    for start in range(0, len(items), LAST_LOGIN_BATCH_SIZE):
+        batch = items[start:start + LAST_LOGIN_BATCH_SIZE]
+        values = ", ".join(f"(${2 * i + 1}::int, ${2 * i + 2}::timestamptz)" for i in range(len(batch)))
+        params = [value for item in batch for value in item]
+        await conn.execute_query(
+            f"""
+            UPDATE {User._meta.db_table} AS u SET last_login = v.last_login
+            FROM (VALUES {values}) AS v(id, last_login)
+            WHERE u.id = v.id AND (u.last_login IS NULL OR u.last_login < v.last_login)
+            """,
+            params,
+        )
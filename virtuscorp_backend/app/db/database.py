@@ -1,7 +1,31 @@
-from app.config import get_database_url
+from tortoise.backends.base.config_generator import expand_db_url
+
+from app.config import (
+    DB_COMMAND_TIMEOUT,
+    DB_MAX_INACTIVE_CONNECTION_LIFETIME,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_MIN_SIZE,
+    DB_STATEMENT_CACHE_SIZE,
+    get_database_url,
+)
+
+
+def get_connection_config(db_url: str) -> dict:
+    """The connection settings of db_url, with the asyncpg pool sized from the settings."""
+    config = expand_db_url(db_url)
+    if config["engine"] == "tortoise.backends.asyncpg":
+        config["credentials"].update(
+            minsize=DB_POOL_MIN_SIZE,
+            maxsize=DB_POOL_MAX_SIZE,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            command_timeout=DB_COMMAND_TIMEOUT,
+            max_inactive_connection_lifetime=DB_MAX_INACTIVE_CONNECTION_LIFETIME,
+        )
+    return config
+
 
 TORTOISE_ORM = {
-    "connections": {"default": get_database_url()},
+    "connections": {"default": get_connection_config(get_database_url())},
     "apps": {
         "models": {
             "models": [
@@ -9,6 +33,7 @@ TORTOISE_ORM = {
                 "app.models.metric",
                 "app.models.report",
                 "app.models.yandex",
+                "app.models.upload",
                 "aerich.models",
             ],
             "default_connection": "default",
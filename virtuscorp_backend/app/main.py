@@ -1,46 +1,90 @@
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from app.middleware.cors import add_cors_middleware
-from app.api.routes import auth, yandex, metrics, reports, user
-from tortoise.contrib.fastapi import register_tortoise
+from app.middleware.timing import add_timing_middleware
+from app.middleware.upload_limit import add_upload_limit_middleware
+from app.api.routes import auth, yandex, metrics, observability, reports, user
+from tortoise import connections
+from tortoise.contrib.fastapi import RegisterTortoise
+from app.config import (
+    GENERATE_SCHEMAS,
+    LAST_LOGIN_FLUSH_INTERVAL,
+    REPORT_WORKERS_PREWARM,
+    ROLLUP_REFRESH_INTERVAL,
+    YANDEX_SYNC_INTERVAL,
+)
 from app.db.database import TORTOISE_ORM
+from app.services import report_jobs, yandex_sync
+from app.services.last_login import run_last_login_flusher
+from app.services.rollups import run_rollup_refresher
+from app.utils.instrumentation import instrument_db_client
+from app.utils.logger import configure_logging
+from contextlib import asynccontextmanager, suppress
+import asyncio
 import os
 
-app = FastAPI()
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with RegisterTortoise(
+        app,
+        config=TORTOISE_ORM,
+        # In production the schema is managed by migrations instead
+        generate_schemas=GENERATE_SCHEMAS,
+        add_exception_handlers=True,
+    ):
+        instrument_db_client(connections.get("default"))
+        await report_jobs.fail_stale_jobs()
+        # Background jobs live as long as the application
+        background = [
+            asyncio.create_task(run_rollup_refresher(ROLLUP_REFRESH_INTERVAL)),
+            asyncio.create_task(run_last_login_flusher(LAST_LOGIN_FLUSH_INTERVAL)),
+            asyncio.create_task(yandex_sync.run_yandex_sync(YANDEX_SYNC_INTERVAL)),
+        ]
+        if REPORT_WORKERS_PREWARM:
+            background.append(asyncio.create_task(report_jobs.prewarm()))
+        yield
+        for task in background:
+            task.cancel()
+        for task in background:
+            # The last_login flusher writes what is still buffered before it stops
+            with suppress(asyncio.CancelledError):
+                await task
+        await yandex_sync.close_client()
+        report_jobs.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 add_cors_middleware(app)
+add_upload_limit_middleware(app)
+# Added last, so it runs first and times everything else
+add_timing_middleware(app)
 
 app.include_router(auth.router, prefix="/auth")
 app.include_router(yandex.router, prefix="/api")
 app.include_router(metrics.router, prefix="/api")  
 app.include_router(reports.router, prefix="/api")
 app.include_router(user.router, prefix="/api/user")
+app.include_router(observability.router)
 
 # Mount the uploads directory for serving static files
 # Create the directory if it doesn't exist
 uploads_dir = "uploads"
-if not os.path.exists(uploads_dir):
-    os.makedirs(uploads_dir)
+# exist_ok: worker processes import this module at the same time
+os.makedirs(uploads_dir, exist_ok=True)
     
 app.mount("/uploads", StaticFiles(directory=uploads_dir), name="uploads")
 
 # Create uploaded_files directory if it doesn't exist
 uploaded_files_dir = "uploaded_files"
-if not os.path.exists(uploaded_files_dir):
-    os.makedirs(uploaded_files_dir)
+os.makedirs(uploaded_files_dir, exist_ok=True)
 
 # Create reports directory if it doesn't exist
 reports_dir = "reports"
-if not os.path.exists(reports_dir):
-    os.makedirs(reports_dir)
-
-register_tortoise(
-    app,
-    config=TORTOISE_ORM,
-    generate_schemas=True,
-    add_exception_handlers=True,
-)
-
+os.makedirs(reports_dir, exist_ok=True)
 
 @app.get("/")
 def read_root():
@@ -14,5 +14,5 @@ def add_cors_middleware(app: FastAPI):
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*", "x-auth-token"],
-        expose_headers=["*", "Set-Cookie"]
+        expose_headers=["*", "Set-Cookie", "X-Next-Cursor"]
     )
\ No newline at end of file
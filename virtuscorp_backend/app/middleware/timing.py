@@ -0,0 +1,76 @@
+import logging
+import time
+import uuid
+
+from fastapi import FastAPI
+
+from app.config import SLOW_REQUEST_SECONDS
+from app.utils.instrumentation import REQUEST_LATENCY
+from app.utils.logger import request_id_var
+
+logger = logging.getLogger(__name__)
+
+
+def _route_template(scope) -> str:
+    """
+    The path template of the matched route, e.g. /api/reports/{report_id}, which keeps the
+    label values bounded. Routes of included routers only know their path below the
+    prefix, so the prefix is taken from the request path.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "unmatched"
+    try:
+        suffix = route.path_format.format(**scope.get("path_params", {}))
+    except (AttributeError, KeyError, IndexError, ValueError):
+        return template
+    path = scope["path"]
+    return path[: len(path) - len(suffix)] + template if path.endswith(suffix) else template
+
+
+class TimingMiddleware:
+    """
+    Record the latency of every request per route template and status, tag the request's
+    log lines and response with a request id, and log slow requests. Plain ASGI, so
+    streamed responses are timed until their last chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex[:16]
+        token = request_id_var.set(request_id)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = [*message["headers"], (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = _route_template(scope)
+            REQUEST_LATENCY.labels(scope["method"], route, str(status)).observe(elapsed)
+            if elapsed >= SLOW_REQUEST_SECONDS:
+                logger.warning(
+                    "Slow request",
+                    extra={"method": scope["method"], "route": route, "status": status, "duration": round(elapsed, 3)},
+                )
+            request_id_var.reset(token)
+
+
+def add_timing_middleware(app: FastAPI):
+    app.add_middleware(TimingMiddleware)
@@ -0,0 +1,56 @@
+from fastapi import FastAPI, HTTPException
+from starlette.responses import JSONResponse
+
+from app.config import MAX_UPLOAD_SIZE
+
+# Room for the multipart boundaries and part headers around the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadLimitMiddleware:
+    """
+    Reject request bodies larger than max_size on the given paths before they are read.
+    The multipart parser spools the whole body to disk before the endpoint runs, so the
+    endpoint's own size check would only fire after an oversized upload was received.
+    A Content-Length over the limit is refused at once; bodies without one (chunked)
+    are counted as they arrive and cut off when they cross it.
+    """
+
+    def __init__(self, app, paths, max_size: int):
+        self.app = app
+        self.paths = set(paths)
+        self.max_size = max_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"File size exceeds the limit of {MAX_UPLOAD_SIZE / (1024 * 1024)}MB."
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_size:
+            response = JSONResponse({"detail": detail}, status_code=413, headers={"Connection": "close"})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def receive_limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    # Raised inside the body parsing, so the exception handlers answer it
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, receive_limited, send)
+
+
+def add_upload_limit_middleware(app: FastAPI):
+    app.add_middleware(
+        UploadLimitMiddleware,
+        paths=["/api/upload-metrics"],
+        max_size=MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD,
+    )
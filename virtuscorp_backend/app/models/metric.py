@@ -1,4 +1,5 @@
 from tortoise import fields
+from tortoise.indexes import Index
 from tortoise.models import Model
 from app.models.user import User
 
@@ -11,9 +12,61 @@ class Metric(Model):
     user = fields.ForeignKeyField("models.User", related_name="metrics")  # Кто загрузил метрику
     marketplace = fields.CharField(max_length=100, null=True)  # Ozon, WB, Yandex и т.п.
     category = fields.CharField(max_length=100, null=True)     # например, "Продажи", "Ценообразование"
+    # Stored path of the upload the row was ingested from; re-ingesting it replaces its rows
+    upload_path = fields.CharField(max_length=500, null=True)
 
     class Meta:
         table = "metrics"
+        # Serve per-user time-range queries (aggregation by name or by marketplace)
+        indexes = (
+            Index(fields=("user_id", "name", "timestamp"), name="idx_metrics_user_name_ts"),
+            Index(fields=("user_id", "marketplace", "timestamp"), name="idx_metrics_user_mp_ts"),
+            Index(fields=("user_id", "upload_path"), name="idx_metrics_user_upload"),
+        )
 
     def __str__(self):
         return f"{self.name}: {self.value} ({self.timestamp})"
+
+
+# Pre-aggregated metrics per time bucket. Empty strings stand for a missing
+# marketplace/category so that the columns can take part in the unique key.
+class MetricRollup(Model):
+    id = fields.BigIntField(pk=True)
+    name = fields.CharField(max_length=255)
+    marketplace = fields.CharField(max_length=100, default="")
+    category = fields.CharField(max_length=100, default="")
+    bucket = fields.DateField()  # First day of the bucket (UTC)
+    value_count = fields.BigIntField()
+    value_sum = fields.FloatField()
+    value_min = fields.FloatField()
+    value_max = fields.FloatField()
+
+    class Meta:
+        abstract = True
+
+
+class MetricRollupDaily(MetricRollup):
+    user = fields.ForeignKeyField("models.User", related_name="metric_rollups_daily")
+
+    class Meta:
+        table = "metric_rollups_daily"
+        unique_together = (("user", "name", "marketplace", "category", "bucket"),)
+
+
+class MetricRollupMonthly(MetricRollup):
+    user = fields.ForeignKeyField("models.User", related_name="metric_rollups_monthly")
+
+    class Meta:
+        table = "metric_rollups_monthly"
+        unique_together = (("user", "name", "marketplace", "category", "bucket"),)
+
+
+# UTC days that received new metrics since their rollups were last computed
+class MetricRollupDirty(Model):
+    id = fields.BigIntField(pk=True)
+    user = fields.ForeignKeyField("models.User", related_name="metric_rollups_dirty")
+    bucket = fields.DateField()
+
+    class Meta:
+        table = "metric_rollup_dirty"
+        unique_together = (("user", "bucket"),)
@@ -1,4 +1,5 @@
 from tortoise import fields
+from tortoise.indexes import Index
 from tortoise.models import Model
 from datetime import datetime, timezone
 
@@ -15,6 +16,8 @@ class Report(Model):
     
     class Meta:
         table = "reports"
+        # Keyset pagination of a user's reports, newest first (read as a backward index scan)
+        indexes = (Index(fields=("user_id", "created_at", "id"), name="idx_reports_user_created"),)
     
     def __str__(self):
         return f"{self.title} ({self.created_at})"
@@ -0,0 +1,27 @@
+from tortoise import fields
+from tortoise.indexes import Index
+from tortoise.models import Model
+
+
+class Upload(Model):
+    id = fields.IntField(pk=True)
+    user = fields.ForeignKeyField("models.User", related_name="uploads")
+    filename = fields.CharField(max_length=255)  # Name of the file as uploaded
+    file_path = fields.CharField(max_length=500)  # Where the file is stored
+    size = fields.BigIntField()  # Bytes
+    content_hash = fields.CharField(max_length=64)  # SHA-256 of the contents, hex
+    row_count = fields.IntField(null=True)
+    format = fields.CharField(max_length=10)  # csv, xlsx
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "uploads"
+        indexes = (
+            # The latest upload of a user is one backward index scan
+            Index(fields=("user_id", "created_at"), name="idx_uploads_user_created"),
+            # Same name as in migrations/add_upload_indexes.py, so there is one index either way
+            Index(fields=("content_hash",), name="idx_uploads_content_hash"),
+        )
+
+    def __str__(self):
+        return f"{self.filename} ({self.created_at})"
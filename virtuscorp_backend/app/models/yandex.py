@@ -8,6 +8,10 @@ class YandexIntegration(Model):
     campaign_id = fields.CharField(max_length=50)
     business_id = fields.CharField(max_length=50)
     token = fields.TextField()
+    # Sync cursor: the last day whose stats are in the metrics table
+    synced_until = fields.DateField(null=True)
+    # Set while a worker syncs the integration, so other workers skip it
+    sync_lease_until = fields.DatetimeField(null=True)
 
     class Meta:
         table = "yandex_integrations"
@@ -0,0 +1,23 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional
+
+class IngestionStatus(BaseModel):
+    status: str  # idle, running, completed, failed
+    filename: Optional[str] = None
+    rows_total: int = 0
+    rows_written: int = 0
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+class MetricAggregate(BaseModel):
+    bucket: datetime
+    name: str
+    marketplace: Optional[str] = None
+    category: Optional[str] = None
+    count: int
+    sum: float
+    avg: float
+    min: float
+    max: float
@@ -15,6 +15,7 @@ class ReportResponse(ReportBase):
     id: int
     created_at: datetime
     status: str
+    progress: Optional[str] = None  # queued, rendering (merging for combined reports) while status is in-progress
     file_url: Optional[str] = None
 
     class Config:
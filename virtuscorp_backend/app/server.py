@@ -0,0 +1,55 @@
+# app/server.py
+#
+# Production entry point: python -m app.server starts WEB_CONCURRENCY uvicorn worker
+# processes behind one socket, each with its own event loop, database pool and report
+# workers. Background jobs coordinate through the database (advisory locks, leases).
+
+import os
+import shutil
+import tempfile
+
+import uvicorn
+
+from app.config import (
+    FORWARDED_ALLOW_IPS,
+    SERVER_HOST,
+    SERVER_HTTP,
+    SERVER_KEEP_ALIVE,
+    SERVER_LOOP,
+    SERVER_PORT,
+    WEB_CONCURRENCY,
+)
+from app.utils.logger import configure_logging
+
+
+def _prepare_metrics_dir():
+    # Every process started from here writes its metric samples to this directory, so
+    # GET /metrics on any worker reports all of them; samples of a previous run are dropped
+    path = os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "virtuscorp_metrics")
+    )
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+
+def main():
+    configure_logging()
+    _prepare_metrics_dir()
+    uvicorn.run(
+        "app.main:app",
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        workers=WEB_CONCURRENCY,
+        loop=SERVER_LOOP,
+        http=SERVER_HTTP,
+        timeout_keep_alive=SERVER_KEEP_ALIVE,
+        # Server and access logs go through the application's logging setup
+        log_config=None,
+        # Client addresses and schemes come from the reverse proxy in front
+        proxy_headers=True,
+        forwarded_allow_ips=FORWARDED_ALLOW_IPS,
+    )
+
+
+if __name__ == "__main__":
+    main()
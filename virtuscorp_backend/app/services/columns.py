@@ -0,0 +1,55 @@
+# app/services/columns.py
+#
+# Recognized column headers (lower-cased) of uploaded files, shared by ingestion,
+# report filters and report options.
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+DATE_COLUMNS = {"date", "datetime", "timestamp", "time", "day", "period", "дата", "время", "день", "период"}
+MARKETPLACE_COLUMNS = {"marketplace", "маркетплейс", "площадка"}
+CATEGORY_COLUMNS = {"category", "категория"}
+NAME_COLUMNS = {"name", "metric", "название", "метрика", "показатель"}
+VALUE_COLUMNS = {"value", "значение"}
+REVENUE_COLUMNS = {"revenue", "sales", "выручка", "продажи", "доход"}
+PROFIT_COLUMNS = {"profit", "прибыль"}
+COST_COLUMNS = {"cost", "costs", "expenses", "себестоимость", "расходы", "затраты"}
+QUANTITY_COLUMNS = {"quantity", "qty", "units", "orders", "количество", "штук", "заказы"}
+STOCK_COLUMNS = {"stock", "inventory", "остаток", "остатки", "запас", "склад"}
+MARKETING_COLUMNS = {
+    "ad spend", "advertising", "marketing", "clicks", "impressions", "views", "ctr", "cpc", "conversion",
+    "реклама", "расходы на рекламу", "клики", "показы", "просмотры", "конверсия",
+}
+# Columns whose header contains one of these are tax columns
+TAX_MARKERS = ("tax", "vat", "налог", "ндс")
+
+# Columns identifying a row, kept in every section of a combined report
+KEY_COLUMNS = DATE_COLUMNS | MARKETPLACE_COLUMNS | CATEGORY_COLUMNS | NAME_COLUMNS
+# Measure columns of each report type, the sections of a combined report
+SECTION_COLUMNS = {
+    "financial": REVENUE_COLUMNS | PROFIT_COLUMNS | COST_COLUMNS,
+    "sales": REVENUE_COLUMNS | QUANTITY_COLUMNS,
+    "inventory": STOCK_COLUMNS | QUANTITY_COLUMNS,
+    "marketing": MARKETING_COLUMNS,
+}
+
+
+def find_column(df: pd.DataFrame, names: set) -> Optional[object]:
+    for col in df.columns:
+        if str(col).strip().lower() in names:
+            return col
+    return None
+
+
+def find_date_column(df: pd.DataFrame) -> Optional[object]:
+    """The date column by header, or else the first column parsed as datetimes."""
+    from pandas.api.types import is_datetime64_any_dtype
+
+    col = find_column(df, DATE_COLUMNS)
+    if col is None:
+        col = next((c for c in df.columns if is_datetime64_any_dtype(df[c].dtype)), None)
+    return col
@@ -0,0 +1,247 @@
+# app/services/exporters.py
+#
+# Report exporters, keyed by the export_format of a report request. Every exporter
+# consumes the data as a sequence of DataFrame chunks. The csv, json and excel ones write
+# each chunk out before reading the next, so their memory stays flat as the row count
+# grows; the pdf one keeps a table flowable per page of rows until the document is built,
+# so its memory grows with the report. Streamable ones can also feed a StreamingResponse.
+# reportlab, openpyxl and pypdf are imported by the exporters that use them, so only
+# report workers rendering those formats load them.
+
+import itertools
+import os
+import re
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype
+
+from app.services.report_options import ReportOptions, apply_report_options
+from app.services.serialization import NDJSON_MEDIA_TYPE, iter_ndjson
+from app.services.uploads import iter_upload_chunks
+from app.utils.instrumentation import traced
+
+# Rows read from the upload per chunk
+EXPORT_CHUNK_ROWS = 5_000
+# Sections of a combined report, in document order
+REPORT_TYPES = ("financial", "sales", "inventory", "marketing")
+
+EXPORTERS: Dict[str, "Exporter"] = {}
+
+
+def register_exporter(cls):
+    """Class decorator adding an exporter to the registry under its export format."""
+    EXPORTERS[cls.export_format] = cls()
+    return cls
+
+
+def get_exporter(export_format: str) -> "Exporter":
+    try:
+        return EXPORTERS[export_format]
+    except KeyError:
+        raise ValueError(
+            f"Unsupported export format: {export_format}. Supported: {', '.join(sorted(EXPORTERS))}"
+        )
+
+
+class Exporter(ABC):
+    export_format = ""
+    extension = ""
+    media_type = "application/octet-stream"
+    # Streamable exporters produce their output incrementally through iter_bytes
+    streamable = False
+    # Combinable exporters can merge separately rendered sections into one document
+    combinable = False
+
+    @abstractmethod
+    def write(self, chunks: Iterable[pd.DataFrame], title: str, path: str):
+        """Render the chunks into a document at path."""
+
+
+class StreamableExporter(Exporter):
+    streamable = True
+
+    def write(self, chunks, title, path):
+        with open(path, "wb") as f:
+            for data in self.iter_bytes(chunks, title):
+                f.write(data)
+
+    @abstractmethod
+    def iter_bytes(self, chunks: Iterable[pd.DataFrame], title: str) -> Iterator[bytes]:
+        """The document, produced incrementally as the chunks are consumed."""
+
+
+class CombinableExporter(Exporter):
+    combinable = True
+
+    @abstractmethod
+    def merge(self, sections: List[Tuple[str, str]], path: str):
+        """Merge the (title, path) section files into one document at path."""
+
+
+@register_exporter
+class PdfExporter(CombinableExporter):
+    export_format = "pdf"
+    extension = "pdf"
+    media_type = "application/pdf"
+
+    def write(self, chunks, title, path):
+        from app.services.reporting import build_pdf
+
+        build_pdf(chunks, title, path)
+
+    def merge(self, sections, path):
+        from pypdf import PdfWriter
+
+        writer = PdfWriter()
+        for title, section_path in sections:
+            # Each section starts with a bookmark, so the merged document has an outline
+            writer.append(section_path, outline_item=title)
+        with open(path, "wb") as f:
+            writer.write(f)
+
+
+@register_exporter
+class CsvExporter(StreamableExporter):
+    export_format = "csv"
+    extension = "csv"
+    media_type = "text/csv; charset=utf-8"
+
+    def iter_bytes(self, chunks, title):
+        # The BOM makes Excel detect UTF-8, so Cyrillic text opens correctly
+        header = True
+        yield "\ufeff".encode("utf-8")
+        for chunk in chunks:
+            yield chunk.to_csv(index=False, header=header).encode("utf-8")
+            header = False
+
+
+@register_exporter
+class JsonExporter(StreamableExporter):
+    """Newline-delimited JSON, one record per line in the /api/uploaded-data record format."""
+    export_format = "json"
+    extension = "ndjson"
+    media_type = NDJSON_MEDIA_TYPE
+
+    def iter_bytes(self, chunks, title):
+        for chunk in chunks:
+            yield from iter_ndjson(chunk, max(len(chunk), 1))
+
+
+def _excel_sheet_title(title: str) -> str:
+    # Excel forbids []:*?/\\ in sheet names and limits them to 31 characters
+    return re.sub(r"[\[\]:*?/\\]", " ", title).strip()[:31] or "Report"
+
+
+def _excel_rows(chunk: pd.DataFrame) -> Iterator[tuple]:
+    columns = []
+    for _, col in chunk.items():
+        if is_datetime64_any_dtype(col.dtype) and col.dt.tz is not None:
+            # Excel has no time zones
+            col = col.dt.tz_convert(None)
+        columns.append(col.astype(object).where(col.notna(), None))
+    return zip(*columns)
+
+
+@register_exporter
+class ExcelExporter(CombinableExporter):
+    export_format = "excel"
+    extension = "xlsx"
+    media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+    def write(self, chunks, title, path):
+        from openpyxl import Workbook
+
+        # Write-only workbooks stream rows to disk instead of keeping every cell in memory
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(_excel_sheet_title(title))
+        header_written = False
+        for chunk in chunks:
+            if not header_written:
+                sheet.append([str(col) for col in chunk.columns])
+                header_written = True
+            for row in _excel_rows(chunk):
+                sheet.append(row)
+        workbook.save(path)
+
+    def merge(self, sections, path):
+        from openpyxl import Workbook, load_workbook
+
+        # One sheet per section; rows are copied through without holding any workbook in memory
+        workbook = Workbook(write_only=True)
+        for title, section_path in sections:
+            source = load_workbook(section_path, read_only=True)
+            sheet = workbook.create_sheet(_excel_sheet_title(title))
+            for row in source.worksheets[0].iter_rows(values_only=True):
+                sheet.append(row)
+            source.close()
+        workbook.save(path)
+
+
+def report_chunks(source_path: str, options: Optional[ReportOptions] = None) -> Iterator[pd.DataFrame]:
+    """The upload in chunks, with the report's filters and column options applied."""
+    chunks = iter_upload_chunks(source_path, EXPORT_CHUNK_ROWS)
+    if options is not None:
+        chunks = apply_report_options(chunks, options)
+    return chunks
+
+
+@traced("report.render")
+def render_report_file(
+    source_path: str, file_path: str, title: str, export_format: str, options: Optional[ReportOptions] = None
+) -> int:
+    """
+    Export the data of an uploaded file to file_path in the requested format.
+    Runs in the report worker processes. Returns the number of data rows exported.
+    """
+    exporter = get_exporter(export_format)
+    chunks = report_chunks(source_path, options)
+    first = next(chunks, None)
+    if first is None or first.empty:
+        filtered = options is not None and options.condition() is not None
+        raise ValueError("No rows match the report filters." if filtered else "The data file is empty.")
+
+    rows = 0
+
+    def counted(chunks):
+        nonlocal rows
+        for chunk in chunks:
+            rows += len(chunk)
+            yield chunk
+
+    # Write under a temporary name so a half-written file is never served
+    tmp_path = f"{file_path}.tmp"
+    try:
+        exporter.write(counted(itertools.chain([first], chunks)), title, tmp_path)
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return rows
+
+
+def prepare_worker():
+    """
+    Load the renderers of every format and register the PDF fonts, once per report
+    worker process when it starts, instead of during its first report.
+    """
+    import openpyxl  # noqa: F401
+    import pypdf  # noqa: F401
+
+    import app.services.reporting  # noqa: F401
+
+
+@traced("report.merge")
+def merge_report_files(sections: List[Tuple[str, str]], file_path: str, export_format: str):
+    """
+    Merge separately rendered (title, path) sections into one file at file_path.
+    Runs in the report worker processes.
+    """
+    tmp_path = f"{file_path}.tmp"
+    try:
+        get_exporter(export_format).merge(sections, tmp_path)
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,522 @@
+# app/services/filters.py
+#
+# Filter expressions of report requests and metric queries, for example
+#
+#     marketplace in (Ozon, WB) and Выручка >= 1000 and not `Статус заказа` = 'Отменен'
+#
+# Comparisons (= != < <= > >=) and in-lists over columns, combined with and, or, not and
+# parentheses. Values are numbers, quoted strings, bare words and dates (YYYY-MM-DD, a
+# whole day, or YYYY-MM-DD HH:MM[:SS]). Headers with spaces or punctuation are quoted
+# with backticks. Missing text values compare as the empty string. An expression compiles to a vectorized pandas mask over an upload
+# chunk, or to a parameterized SQL condition over the metrics table.
+#
+# pandas is imported by the mask functions on first use, so the metrics queries, which
+# only need the parser and the SQL compiler, don't load it.
+
+from __future__ import annotations
+
+import re
+from datetime import date, datetime, time, timedelta, timezone
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+from app.services.columns import (
+    CATEGORY_COLUMNS,
+    DATE_COLUMNS,
+    MARKETPLACE_COLUMNS,
+    NAME_COLUMNS,
+    VALUE_COLUMNS,
+    find_column,
+    find_date_column,
+)
+
+MAX_FILTER_LENGTH = 2_000
+MAX_FILTER_DEPTH = 32
+
+
+class FilterError(ValueError):
+    """A malformed filter expression or date range, or a reference to an unknown column."""
+
+
+class Comparison(NamedTuple):
+    column: str
+    op: str  # =, !=, <, <=, >, >=
+    value: object  # int, float, str, date (a whole day) or datetime
+
+
+class InList(NamedTuple):
+    column: str
+    values: tuple
+
+
+class Not(NamedTuple):
+    operand: object
+
+
+class And(NamedTuple):
+    operands: tuple
+
+
+class Or(NamedTuple):
+    operands: tuple
+
+
+_TOKENS = re.compile(
+    r"""
+    (?P<space>\s+)
+    |(?P<datetime>\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2})?)
+    |(?P<date>\d{4}-\d{2}-\d{2})
+    |(?P<number>-?\d+(?:\.\d+)?)
+    |(?P<string>'[^']*'|"[^"]*")
+    |(?P<quoted>`[^`]+`)
+    |(?P<word>[^\W\d][\w.]*)
+    |(?P<op><=|>=|!=|<>|==|=|<|>)
+    |(?P<punct>[(),])
+    """,
+    re.VERBOSE,
+)
+_KEYWORDS = {"and", "or", "not", "in"}
+_OPERATORS = {"=": "=", "==": "=", "!=": "!=", "<>": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+
+
+def _tokenize(text: str) -> List[Tuple[str, object]]:
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = _TOKENS.match(text, pos)
+        if match is None:
+            raise FilterError(f"Unexpected character {text[pos]!r} at position {pos}")
+        kind, raw = match.lastgroup, match.group()
+        pos = match.end()
+        if kind == "space":
+            continue
+        if kind == "word" and raw.lower() in _KEYWORDS:
+            tokens.append(("keyword", raw.lower()))
+        elif kind == "datetime":
+            tokens.append(("value", _parse_datetime(raw)))
+        elif kind == "date":
+            tokens.append(("value", _parse_date(raw)))
+        elif kind == "number":
+            tokens.append(("value", float(raw) if "." in raw else int(raw)))
+        elif kind == "string":
+            tokens.append(("value", raw[1:-1]))
+        elif kind == "quoted":
+            tokens.append(("word", raw[1:-1]))
+        elif kind == "op":
+            tokens.append(("op", _OPERATORS[raw]))
+        else:
+            tokens.append((kind, raw))
+    return tokens
+
+
+def _parse_date(raw: str) -> date:
+    try:
+        return date.fromisoformat(raw)
+    except ValueError:
+        raise FilterError(f"Invalid date: {raw}")
+
+
+def _parse_datetime(raw: str) -> datetime:
+    try:
+        return datetime.fromisoformat(raw.replace(" ", "T"))
+    except ValueError:
+        raise FilterError(f"Invalid date and time: {raw}")
+
+
+class _Parser:
+    """Recursive descent over the tokens; and binds tighter than or."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.depth = 0
+
+    def peek(self, kind: str, value=None) -> bool:
+        if self.pos >= len(self.tokens):
+            return False
+        token_kind, token_value = self.tokens[self.pos]
+        return token_kind == kind and (value is None or token_value == value)
+
+    def take(self, kind: str, value=None, expected: str = ""):
+        if not self.peek(kind, value):
+            found = repr(self.tokens[self.pos][1]) if self.pos < len(self.tokens) else "end of filter"
+            raise FilterError(f"Expected {expected or value or kind}, found {found}")
+        self.pos += 1
+        return self.tokens[self.pos - 1][1]
+
+    def expression(self):
+        self.depth += 1
+        if self.depth > MAX_FILTER_DEPTH:
+            raise FilterError("Filter is nested too deeply")
+        operands = [self.conjunction()]
+        while self.peek("keyword", "or"):
+            self.pos += 1
+            operands.append(self.conjunction())
+        self.depth -= 1
+        return operands[0] if len(operands) == 1 else Or(tuple(operands))
+
+    def conjunction(self):
+        operands = [self.unary()]
+        while self.peek("keyword", "and"):
+            self.pos += 1
+            operands.append(self.unary())
+        return operands[0] if len(operands) == 1 else And(tuple(operands))
+
+    def unary(self):
+        if self.peek("keyword", "not"):
+            self.pos += 1
+            return Not(self.unary())
+        if self.peek("punct", "("):
+            self.pos += 1
+            node = self.expression()
+            self.take("punct", ")")
+            return node
+        return self.condition()
+
+    def condition(self):
+        column = self.take("word", expected="a column name")
+        negated = False
+        if self.peek("keyword", "not"):
+            self.pos += 1
+            negated = True
+        if self.peek("keyword", "in"):
+            self.pos += 1
+            self.take("punct", "(")
+            values = [self.value()]
+            while self.peek("punct", ","):
+                self.pos += 1
+                values.append(self.value())
+            self.take("punct", ")")
+            node = InList(column, tuple(values))
+            return Not(node) if negated else node
+        if negated:
+            raise FilterError(f"Expected in after {column} not")
+        op = self.take("op", expected="a comparison operator")
+        return Comparison(column, op, self.value())
+
+    def value(self):
+        # Bare words are strings, so marketplace = Ozon needs no quotes
+        if self.peek("word"):
+            return self.take("word")
+        return self.take("value", expected="a value")
+
+
+def parse_filter(text: Optional[str]):
+    """Parse a filter expression; None or a blank string means no filter."""
+    if text is None or not text.strip():
+        return None
+    if len(text) > MAX_FILTER_LENGTH:
+        raise FilterError(f"Filter is longer than {MAX_FILTER_LENGTH} characters")
+    parser = _Parser(_tokenize(text))
+    node = parser.expression()
+    if parser.pos < len(parser.tokens):
+        raise FilterError(f"Unexpected {parser.tokens[parser.pos][1]!r} after the end of the filter")
+    return node
+
+
+_LAST_DAYS = re.compile(r"last_(\d+)_days")
+
+
+def parse_date_range(text: Optional[str], today: Optional[date] = None) -> Tuple[Optional[date], Optional[date]]:
+    """
+    Parse a date range into its first and last day, both inclusive and either open:
+    YYYY-MM-DD..YYYY-MM-DD (or with / between the dates), ..YYYY-MM-DD, YYYY-MM-DD..,
+    a single YYYY-MM-DD, or last_N_days ending today (UTC).
+    """
+    if text is None or not text.strip():
+        return None, None
+    text = text.strip()
+    match = _LAST_DAYS.fullmatch(text)
+    if match:
+        today = today or datetime.now(timezone.utc).date()
+        return today - timedelta(days=int(match.group(1)) - 1), today
+    for separator in ("..", "/"):
+        if separator in text:
+            first, _, last = text.partition(separator)
+            start = _parse_date(first.strip()) if first.strip() else None
+            end = _parse_date(last.strip()) if last.strip() else None
+            if start and end and start > end:
+                raise FilterError(f"Date range starts after it ends: {text}")
+            return start, end
+    day = _parse_date(text)
+    return day, day
+
+
+def date_range_condition(text: Optional[str]):
+    """The date range as a filter over the date column, or None."""
+    start, end = parse_date_range(text)
+    conditions = []
+    if start is not None:
+        conditions.append(Comparison("date", ">=", start))
+    if end is not None:
+        conditions.append(Comparison("date", "<=", end))
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else And(tuple(conditions))
+
+
+def combine(*nodes):
+    """And the given conditions, skipping None."""
+    nodes = [node for node in nodes if node is not None]
+    if not nodes:
+        return None
+    return nodes[0] if len(nodes) == 1 else And(tuple(nodes))
+
+
+# pandas
+
+
+def resolve_column(df: pd.DataFrame, name: str):
+    """
+    The column a filter refers to: by exact header, then case-insensitively, then
+    date, marketplace and category by any of their recognized headers.
+    """
+    for col in df.columns:
+        if str(col) == name:
+            return col
+    lowered = name.strip().lower()
+    for col in df.columns:
+        if str(col).strip().lower() == lowered:
+            return col
+    col = None
+    if lowered in DATE_COLUMNS:
+        col = find_date_column(df)
+    elif lowered in MARKETPLACE_COLUMNS:
+        col = find_column(df, MARKETPLACE_COLUMNS)
+    elif lowered in CATEGORY_COLUMNS:
+        col = find_column(df, CATEGORY_COLUMNS)
+    if col is None:
+        raise FilterError(f"Unknown column: {name}")
+    return col
+
+
+def compile_mask(node, df: pd.DataFrame) -> pd.Series:
+    """Evaluate a parsed filter over a DataFrame into a boolean row mask."""
+    if isinstance(node, And):
+        mask = compile_mask(node.operands[0], df)
+        for operand in node.operands[1:]:
+            mask &= compile_mask(operand, df)
+        return mask
+    if isinstance(node, Or):
+        mask = compile_mask(node.operands[0], df)
+        for operand in node.operands[1:]:
+            mask |= compile_mask(operand, df)
+        return mask
+    if isinstance(node, Not):
+        return ~compile_mask(node.operand, df)
+
+    col = resolve_column(df, node.column)
+    series = df[col]
+    if isinstance(node, InList):
+        return _in_mask(series, node)
+    return _comparison_mask(series, node)
+
+
+def _as_bool(mask) -> pd.Series:
+    # Nullable comparisons leave <NA> for missing values; those rows don't match
+    return mask.fillna(False).astype(bool)
+
+
+def _text(series: pd.Series) -> pd.Series:
+    # Missing labels compare as the empty string, like in the SQL fields and the rollups
+    return series.astype("string").fillna("")
+
+
+def _datetimes(series: pd.Series) -> pd.Series:
+    import pandas as pd
+    from pandas.api.types import is_datetime64_any_dtype
+
+    if is_datetime64_any_dtype(series.dtype):
+        return series
+    # ISO dates with or without a time; anything else (03.01.2024) is read day first
+    parsed = pd.to_datetime(series, errors="coerce", format="ISO8601")
+    rest = parsed.isna() & series.notna()
+    if rest.any():
+        parsed[rest] = pd.to_datetime(series[rest], errors="coerce", format="mixed", dayfirst=True)
+    return parsed
+
+
+def _timestamp(value, series: pd.Series, column: str) -> pd.Timestamp:
+    import pandas as pd
+
+    try:
+        ts = pd.Timestamp(value)
+    except ValueError:
+        raise FilterError(f"{column} holds dates, got {value!r}")
+    tz = series.dt.tz
+    if tz is not None and ts.tzinfo is None:
+        return ts.tz_localize(tz)
+    if tz is None and ts.tzinfo is not None:
+        return ts.tz_convert("UTC").tz_localize(None)
+    return ts
+
+
+def _number(value, column: str) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise FilterError(f"{column} holds numbers, got {value!r}")
+
+
+def _compare(left, op: str, right):
+    if op == "=":
+        return left == right
+    if op == "!=":
+        return left != right
+    if op == "<":
+        return left < right
+    if op == "<=":
+        return left <= right
+    if op == ">":
+        return left > right
+    return left >= right
+
+
+def _is_day(value) -> bool:
+    return isinstance(value, date) and not isinstance(value, datetime)
+
+
+def _day_bounds(op: str, day: date) -> List[Tuple[str, datetime]]:
+    """A comparison with a whole day as comparisons with its first and next midnight."""
+    start = datetime.combine(day, time.min)
+    following = start + timedelta(days=1)
+    return {
+        "=": [(">=", start), ("<", following)],
+        "<": [("<", start)],
+        "<=": [("<", following)],
+        ">": [(">=", following)],
+        ">=": [(">=", start)],
+    }[op]
+
+
+def _comparison_mask(series: pd.Series, node: Comparison) -> pd.Series:
+    import pandas as pd
+    from pandas.api.types import is_datetime64_any_dtype, is_numeric_dtype
+
+    value = node.value
+    if isinstance(value, date) or is_datetime64_any_dtype(series.dtype):
+        series = _datetimes(series)
+        if _is_day(value) and node.op != "!=":
+            mask = None
+            for op, bound in _day_bounds(node.op, value):
+                part = _compare(series, op, _timestamp(bound, series, node.column))
+                mask = part if mask is None else mask & part
+            return _as_bool(mask)
+        if _is_day(value):
+            return ~_comparison_mask(series, node._replace(op="="))
+        return _as_bool(_compare(series, node.op, _timestamp(value, series, node.column)))
+
+    if isinstance(value, (int, float)) or is_numeric_dtype(series.dtype):
+        if not is_numeric_dtype(series.dtype):
+            series = pd.to_numeric(series, errors="coerce")
+        return _as_bool(_compare(series, node.op, _number(value, node.column)))
+
+    return _as_bool(_compare(_text(series), node.op, str(value)))
+
+
+def _in_mask(series: pd.Series, node: InList) -> pd.Series:
+    import pandas as pd
+    from pandas.api.types import is_datetime64_any_dtype, is_numeric_dtype
+
+    values = node.values
+    if any(isinstance(value, date) for value in values) or is_datetime64_any_dtype(series.dtype):
+        series = _datetimes(series)
+        if all(_is_day(value) for value in values):
+            # Whole days: compare the dates of the timestamps
+            days = [_timestamp(value, series, node.column) for value in values]
+            return _as_bool(series.dt.normalize().isin(days))
+        return _as_bool(series.isin([_timestamp(value, series, node.column) for value in values]))
+    if is_numeric_dtype(series.dtype) or all(isinstance(value, (int, float)) for value in values):
+        if not is_numeric_dtype(series.dtype):
+            series = pd.to_numeric(series, errors="coerce")
+        return _as_bool(series.isin([_number(value, node.column) for value in values]))
+    return _as_bool(_text(series).isin([str(value) for value in values]))
+
+
+# SQL over the metrics table
+
+# Recognized names of the metric columns
+_METRIC_FIELDS = (
+    ("timestamp", DATE_COLUMNS),
+    ("marketplace", MARKETPLACE_COLUMNS),
+    ("category", CATEGORY_COLUMNS),
+    ("name", NAME_COLUMNS),
+    ("value", VALUE_COLUMNS),
+)
+
+
+def metric_field(name: str) -> str:
+    """The metrics table column a filter refers to: name, value, timestamp, marketplace or category."""
+    lowered = name.strip().lower()
+    for field, names in _METRIC_FIELDS:
+        if lowered in names:
+            return field
+    raise FilterError(f"Unknown metric column: {name}. Use name, value, timestamp, marketplace or category")
+
+
+def metric_fields(node) -> set:
+    """The metrics table columns a filter refers to."""
+    if isinstance(node, (And, Or)):
+        return set().union(*(metric_fields(operand) for operand in node.operands))
+    if isinstance(node, Not):
+        return metric_fields(node.operand)
+    return {metric_field(node.column)}
+
+
+def _sql_literal(value, kind: str, column: str):
+    if kind == "number":
+        return _number(value, column)
+    if kind == "timestamp":
+        if isinstance(value, str):
+            try:
+                value = datetime.fromisoformat(value)
+            except ValueError:
+                raise FilterError(f"{column} holds dates, got {value!r}")
+        elif _is_day(value):
+            value = datetime.combine(value, time.min)
+        # Naive timestamps are UTC, like the time buckets
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return str(value)
+
+
+_SQL_OPERATORS = {"=": "=", "!=": "<>", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+_SQL_ARRAY_TYPES = {"text": "text[]", "number": "double precision[]"}
+
+
+def compile_sql(node, fields: Dict[str, Tuple[str, str]], params: list) -> str:
+    """
+    Compile a parsed filter into a SQL condition with $n placeholders, appending the
+    literals to params. fields maps metric columns (see metric_field) to their SQL
+    expression and kind: text, number or timestamp. The expressions must not be NULL
+    (COALESCE nullable labels to ''), so that not selects the same rows as compile_mask.
+    """
+    if isinstance(node, (And, Or)):
+        joiner = " AND " if isinstance(node, And) else " OR "
+        return "(" + joiner.join(compile_sql(operand, fields, params) for operand in node.operands) + ")"
+    if isinstance(node, Not):
+        return f"NOT {compile_sql(node.operand, fields, params)}"
+
+    field = metric_field(node.column)
+    if field not in fields:
+        raise FilterError(f"Filtering on {node.column} is not supported here")
+    expression, kind = fields[field]
+
+    if isinstance(node, InList):
+        if kind == "timestamp":
+            return compile_sql(Or(tuple(Comparison(node.column, "=", v) for v in node.values)), fields, params)
+        params.append([_sql_literal(value, kind, node.column) for value in node.values])
+        return f"{expression} = ANY(${len(params)}::{_SQL_ARRAY_TYPES[kind]})"
+
+    if kind == "timestamp" and _is_day(node.value):
+        if node.op == "!=":
+            return f"NOT {compile_sql(node._replace(op='='), fields, params)}"
+        parts = []
+        for op, bound in _day_bounds(node.op, node.value):
+            params.append(_sql_literal(bound, kind, node.column))
+            parts.append(f"{expression} {_SQL_OPERATORS[op]} ${len(params)}")
+        return "(" + " AND ".join(parts) + ")"
+
+    params.append(_sql_literal(node.value, kind, node.column))
+    return f"{expression} {_SQL_OPERATORS[node.op]} ${len(params)}"
@@ -0,0 +1,179 @@
+# app/services/ingestion.py
+
+import logging
+import os
+from datetime import datetime, timezone
+import orjson
+import pandas as pd
+from pandas.api.types import is_numeric_dtype, is_bool_dtype
+from starlette.concurrency import run_in_threadpool
+
+from app.config import METRIC_INGEST_BATCH_SIZE
+from app.crud.metric import bulk_insert_metrics
+from app.services.columns import (
+    CATEGORY_COLUMNS,
+    MARKETPLACE_COLUMNS,
+    NAME_COLUMNS,
+    VALUE_COLUMNS,
+    find_column,
+    find_date_column,
+)
+from app.services.uploads import user_upload_dir
+
+logger = logging.getLogger(__name__)
+
+# Mirrors the CharField lengths of the Metric model
+NAME_MAX_LENGTH = 255
+LABEL_MAX_LENGTH = 100
+
+METRIC_FRAME_COLUMNS = ["name", "value", "timestamp", "marketplace", "category"]
+
+# Latest ingestion progress of a user, kept next to the uploads so that every worker
+# process can answer the status endpoint, whichever one runs the ingestion
+STATUS_FILENAME = ".ingestion.json"
+
+
+def _labels(df: pd.DataFrame, col) -> pd.Series:
+    if col is None:
+        return pd.Series(None, index=df.index, dtype=object)
+    return df[col].astype(str).str.slice(0, LABEL_MAX_LENGTH).where(df[col].notna(), None)
+
+
+def _timestamps(df: pd.DataFrame, col, default: datetime) -> pd.Series:
+    if col is None:
+        return pd.Series(default, index=df.index)
+    parsed = pd.to_datetime(df[col], errors="coerce", utc=True)
+    return parsed.fillna(pd.Timestamp(default))
+
+
+def _empty_metric_frame() -> pd.DataFrame:
+    # Typed like a filled one, so the rows are read the same way
+    return pd.DataFrame(
+        {
+            "name": pd.Series(dtype=object),
+            "value": pd.Series(dtype=float),
+            "timestamp": pd.Series(dtype="datetime64[ns, UTC]"),
+            "marketplace": pd.Series(dtype=object),
+            "category": pd.Series(dtype=object),
+        }
+    )
+
+
+def frame_to_metric_frame(df: pd.DataFrame, uploaded_at: datetime) -> pd.DataFrame:
+    """
+    Map an uploaded table to Metric columns (name, value, timestamp, marketplace, category).
+
+    Long tables with name/value columns map row by row. Otherwise every numeric column
+    becomes a metric named after its header, with one value per row. Date, marketplace and
+    category columns are picked up by header; rows without a date get the upload time.
+    """
+    date_col = find_date_column(df)
+    marketplace_col = find_column(df, MARKETPLACE_COLUMNS)
+    category_col = find_column(df, CATEGORY_COLUMNS)
+    name_col = find_column(df, NAME_COLUMNS)
+    value_col = find_column(df, VALUE_COLUMNS)
+
+    base = pd.DataFrame(
+        {
+            "timestamp": _timestamps(df, date_col, uploaded_at),
+            "marketplace": _labels(df, marketplace_col),
+            "category": _labels(df, category_col),
+        },
+        index=df.index,
+    )
+
+    if name_col is not None and value_col is not None:
+        metrics = base.assign(
+            name=df[name_col].astype(str).str.slice(0, NAME_MAX_LENGTH),
+            value=pd.to_numeric(df[value_col], errors="coerce"),
+        )
+        metrics = metrics[df[name_col].notna()]
+    else:
+        skip = {date_col, marketplace_col, category_col}
+        value_cols = [
+            col
+            for col in df.columns
+            if col not in skip and is_numeric_dtype(df[col].dtype) and not is_bool_dtype(df[col].dtype)
+        ]
+        if not value_cols:
+            return _empty_metric_frame()
+        values = df[value_cols].set_axis([str(col)[:NAME_MAX_LENGTH] for col in value_cols], axis=1)
+        melted = values.melt(var_name="name", value_name="value", ignore_index=False)
+        metrics = base.join(melted)
+
+    metrics = metrics.dropna(subset=["value"])
+    for col in ("marketplace", "category"):
+        metrics[col] = metrics[col].astype(object).where(metrics[col].notna(), None)
+    return metrics[METRIC_FRAME_COLUMNS].reset_index(drop=True)
+
+
+def _metric_rows(metrics: pd.DataFrame, user_id: int):
+    timestamps = metrics["timestamp"].dt.to_pydatetime()
+    for name, value, ts, marketplace, category in zip(
+        metrics["name"], metrics["value"].astype(float), timestamps, metrics["marketplace"], metrics["category"]
+    ):
+        yield (name, value, ts, user_id, marketplace, category)
+
+
+def _status_path(user_id: int) -> str:
+    return os.path.join(user_upload_dir(user_id), STATUS_FILENAME)
+
+
+def _save_status(user_id: int, status: dict):
+    path = _status_path(user_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written aside and renamed, so readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(orjson.dumps(status))
+    os.replace(tmp_path, path)
+
+
+def get_ingestion_status(user_id: int) -> dict:
+    try:
+        with open(_status_path(user_id), "rb") as f:
+            return orjson.loads(f.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return {"status": "idle"}
+
+
+async def ingest_upload(user_id: int, filename: str, file_path: str, df: pd.DataFrame) -> int:
+    """
+    Write the rows of an uploaded table into the metrics table in fixed-size batches,
+    replacing the rows ingested before from the upload stored at file_path.
+    Meant to run as a background task after the upload response; progress is kept
+    per user in a status file and served by the ingestion status endpoint.
+    """
+    status = {
+        "status": "running",
+        "filename": filename,
+        "rows_total": 0,
+        "rows_written": 0,
+        "started_at": datetime.now(timezone.utc),
+        "finished_at": None,
+        "error": None,
+    }
+    _save_status(user_id, status)
+
+    def on_progress(written: int):
+        status["rows_written"] = written
+        _save_status(user_id, status)
+        logger.info(f"Metric ingestion for user {user_id}: {written}/{status['rows_total']} rows")
+
+    try:
+        metrics = await run_in_threadpool(frame_to_metric_frame, df, status["started_at"])
+        status["rows_total"] = len(metrics)
+        _save_status(user_id, status)
+        written = await bulk_insert_metrics(
+            _metric_rows(metrics, user_id), METRIC_INGEST_BATCH_SIZE, on_progress, upload=(user_id, file_path)
+        )
+        status["status"] = "completed"
+        return written
+    except Exception as e:
+        logger.exception(f"Metric ingestion failed for user {user_id}, file {filename}")
+        status["status"] = "failed"
+        status["error"] = str(e)
+        return 0
+    finally:
+        status["finished_at"] = datetime.now(timezone.utc)
+        _save_status(user_id, status)
@@ -0,0 +1,79 @@
+# app/services/last_login.py
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+from app.config import LAST_LOGIN_FLUSH_INTERVAL
+from app.crud.user import update_last_logins
+
+logger = logging.getLogger(__name__)
+
+# Logins not written yet: user id -> latest login time, local to this worker process
+_pending: Dict[int, datetime] = {}
+
+
+async def record_login(user_id: int, at: datetime):
+    """
+    Remember a login. With write-behind enabled (LAST_LOGIN_FLUSH_INTERVAL > 0) the time
+    is buffered and written in a batch by the flusher, otherwise it is written right away.
+    """
+    if LAST_LOGIN_FLUSH_INTERVAL <= 0:
+        await update_last_logins({user_id: at})
+        return
+    previous = _pending.get(user_id)
+    if previous is None or previous < at:
+        _pending[user_id] = at
+
+
+def latest_last_login(user_id: int, stored: Optional[datetime]) -> Optional[datetime]:
+    """The later of the buffered login and the stored last_login of the user."""
+    pending = _pending.get(user_id)
+    if pending is None or stored is None:
+        return pending or stored
+    return max(pending, stored)
+
+
+def discard_pending_login(user_id: int):
+    """Drop the buffered login of a user whose last_login was just written directly."""
+    _pending.pop(user_id, None)
+
+
+async def flush_last_logins() -> int:
+    """Write the buffered logins; returns how many users were updated."""
+    global _pending
+    if not _pending:
+        return 0
+    batch, _pending = _pending, {}
+    try:
+        await update_last_logins(batch)
+    except Exception:
+        # Put the batch back unless newer logins arrived meanwhile
+        for user_id, at in batch.items():
+            if user_id not in _pending or _pending[user_id] < at:
+                _pending[user_id] = at
+        raise
+    return len(batch)
+
+
+async def run_last_login_flusher(interval: float):
+    """
+    Write buffered last_login times every interval seconds, and once more when cancelled
+    at shutdown. Runs for the lifetime of the application.
+    """
+    if interval <= 0:
+        return
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await flush_last_logins()
+            except Exception:
+                logger.exception("Writing last_login times failed")
+    finally:
+        if _pending:
+            try:
+                await flush_last_logins()
+            except Exception:
+                logger.exception(f"Lost last_login times of {len(_pending)} user(s)")
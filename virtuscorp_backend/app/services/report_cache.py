@@ -0,0 +1,147 @@
+# app/services/report_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+
+from app.config import REPORT_CACHE_DIR, REPORT_CACHE_MAX_BYTES
+from app.schemas.report import ReportGenerateRequest
+from app.utils.instrumentation import REPORT_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Bump when the rendered output changes, so files of the old renderer are not served
+RENDER_VERSION = 1
+
+
+def report_cache_key(source_digest: str, request: ReportGenerateRequest) -> str:
+    """
+    Key of a rendered report: the source file contents plus the normalized request
+    parameters that affect the output.
+    """
+    params = {
+        "version": RENDER_VERSION,
+        "source": source_digest,
+        "report_type": request.report_type,
+        "filters": (request.filters or "").strip() or None,
+        "date_range": (request.date_range or "").strip() or None,
+        "exclude_taxes": bool(request.exclude_taxes),
+        "show_profit_margin": bool(request.show_profit_margin),
+        "export_format": request.export_format.lower(),
+        "combine_reports": bool(request.combine_reports),
+    }
+    raw = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ReportCache:
+    """
+    Content-addressed store of rendered report files, one file per key, shared by all
+    worker processes through the filesystem. Reports get hard links to the cached files,
+    so evicting an entry never breaks a report that was served from it.
+    Least recently used entries are evicted once the total size exceeds max_bytes. The
+    time of last use is the mtime of a sidecar file next to each entry: the entry itself
+    shares its inode with users' report files, which must not be touched.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str, file_path: str) -> str:
+        # Keyed files keep the extension of the report format
+        return os.path.join(self.directory, key + os.path.splitext(file_path)[1])
+
+    @staticmethod
+    def _used_path(path: str) -> str:
+        # Dot files are not taken for entries
+        directory, name = os.path.split(path)
+        return os.path.join(directory, f".{name}.used")
+
+    def _mark_used(self, path: str):
+        if not os.path.exists(path):
+            return  # Evicted meanwhile; the report keeps its link
+        with open(self._used_path(path), "a"):
+            pass
+        os.utime(self._used_path(path))
+
+    def fetch(self, key: str, target: str) -> bool:
+        """Materialize the cached file at target. Returns False on a miss. Blocking."""
+        cached = self._path(key, target)
+        try:
+            _link_or_copy(cached, target)
+        except FileNotFoundError:
+            REPORT_CACHE_LOOKUPS.labels("miss").inc()
+            return False
+        REPORT_CACHE_LOOKUPS.labels("hit").inc()
+        self._mark_used(cached)
+        return True
+
+    def store(self, key: str, source: str):
+        """Add a freshly rendered file to the cache and evict down to the size budget. Blocking."""
+        if os.path.getsize(source) > self.max_bytes:
+            return
+        tmp_path = os.path.join(self.directory, f".{uuid.uuid4().hex}.tmp")
+        cached = self._path(key, source)
+        try:
+            _link_or_copy(source, tmp_path)
+            os.replace(tmp_path, cached)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._mark_used(cached)
+        self._evict()
+
+    def _last_used(self, path: str, stat: os.stat_result) -> int:
+        try:
+            return os.stat(self._used_path(path)).st_mtime_ns
+        except FileNotFoundError:
+            return stat.st_mtime_ns  # Stored by a process that hadn't marked it yet
+
+    def _entries(self):
+        """(last_used_ns, path, size) of every cached file."""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # Evicted by another process meanwhile
+                entries.append((self._last_used(entry.path, stat), entry.path, stat.st_size))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            try:
+                os.remove(self._used_path(path))
+            except FileNotFoundError:
+                pass
+            total -= size
+            logger.info(f"Evicted cached report {os.path.basename(path)} ({size} bytes)")
+
+
+def _link_or_copy(source: str, target: str):
+    try:
+        os.link(source, target)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        # Different filesystem or no hard link support
+        shutil.copyfile(source, target)
+
+
+report_cache = ReportCache(REPORT_CACHE_DIR, REPORT_CACHE_MAX_BYTES)
@@ -0,0 +1,209 @@
+# app/services/report_jobs.py
+#
+# The exporters (pandas and the renderers) are imported by the worker processes and,
+# in the API process, when the first report is submitted, not when the API starts.
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+import os
+from typing import TYPE_CHECKING, Awaitable, Dict, List, Optional, Tuple
+
+from app.config import REPORT_JOB_STALE_AFTER, REPORT_WORKERS
+from app.models.report import Report
+from app.services.report_cache import report_cache
+from app.services.uploads import remove_stale_pins, remove_upload
+from app.utils.logger import configure_logging
+
+if TYPE_CHECKING:
+    from app.services.report_options import ReportOptions
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+# Jobs of this process that haven't finished: report id -> worker futures
+_jobs: Dict[int, List[Future]] = {}
+# Combined reports whose sections are rendered and being merged
+_merging = set()
+# Keeps job tasks referenced until they finish
+_tasks = set()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: forking a process that runs an event loop and DB pool is not safe
+        _executor = ProcessPoolExecutor(
+            max_workers=REPORT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_prepare_worker,
+        )
+    return _executor
+
+
+def _submit(fn, *args) -> Future:
+    """
+    Submit a call to the report workers. A pool whose worker died (killed for memory,
+    crashed) refuses every job, so it is replaced by a new one and the call retried once.
+    """
+    global _executor
+    try:
+        return _get_executor().submit(fn, *args)
+    except BrokenProcessPool:
+        logger.warning("Report worker pool is broken, starting a new one")
+        broken, _executor = _executor, None
+        if broken is not None:
+            broken.shutdown(wait=False, cancel_futures=True)
+        return _get_executor().submit(fn, *args)
+
+
+def _prepare_worker():
+    from app.services.exporters import prepare_worker
+
+    configure_logging()
+    prepare_worker()
+
+
+async def prewarm():
+    """
+    Start every report worker in the background, so fonts and renderers are loaded
+    before the first report is requested rather than while it waits.
+    """
+    # Workers are spawned on demand, one per job submitted while none is idle
+    futures = [_submit(os.getpid) for _ in range(REPORT_WORKERS)]
+    try:
+        await asyncio.gather(*map(asyncio.wrap_future, futures))
+    except Exception:
+        logger.exception("Could not start the report workers")
+
+
+def get_job_stage(report_id: int) -> Optional[str]:
+    """queued, rendering or merging for jobs running in this process, None otherwise."""
+    if report_id in _merging:
+        return "merging"
+    futures = _jobs.get(report_id)
+    if futures is None:
+        return None
+    return "rendering" if any(future.running() or future.done() for future in futures) else "queued"
+
+
+def submit_report_job(
+    report: Report,
+    source_path: str,
+    file_path: str,
+    cache_key: Optional[str] = None,
+    options: Optional[ReportOptions] = None,
+):
+    """
+    Export the report in a worker process and record the outcome on the Report row.
+    source_path is a pinned upload (see pin_upload), removed once the job is done.
+    With a cache_key the rendered file is added to the report cache.
+    """
+    from app.services.exporters import render_report_file
+
+    future = _submit(render_report_file, source_path, file_path, report.title, report.export_format, options)
+    _jobs[report.id] = [future]
+    _start(_wait_for_job(report.id, asyncio.wrap_future(future), source_path, file_path, cache_key))
+
+
+def submit_combined_report_job(
+    report: Report,
+    source_path: str,
+    file_path: str,
+    section_options: List[Tuple[str, ReportOptions]],
+    cache_key: Optional[str] = None,
+):
+    """
+    Render every (title, options) section of a combined report in its own worker
+    process, then merge the sections into one file. With enough workers the wall-clock
+    time is that of the slowest section plus the merge, instead of the sum of all sections.
+    source_path is a pinned upload, like for submit_report_job.
+    """
+    from app.services.exporters import render_report_file
+
+    # Parts keep the extension, which the merge step uses to recognize the format
+    root, extension = os.path.splitext(file_path)
+    sections = [(title, f"{root}.part{i}{extension}") for i, (title, _) in enumerate(section_options)]
+    futures = [
+        _submit(render_report_file, source_path, section_path, title, report.export_format, options)
+        for (title, section_path), (_, options) in zip(sections, section_options)
+    ]
+    _jobs[report.id] = futures
+    job = _render_combined(report.id, futures, sections, file_path, report.export_format)
+    _start(_wait_for_job(report.id, job, source_path, file_path, cache_key))
+
+
+async def _render_combined(report_id: int, futures: List[Future], sections, file_path: str, export_format: str) -> int:
+    from app.services.exporters import merge_report_files
+
+    try:
+        # Wait for every section before failing, so no worker still writes a part afterwards
+        results = await asyncio.gather(*map(asyncio.wrap_future, futures), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        _merging.add(report_id)
+        await asyncio.wrap_future(
+            _submit(merge_report_files, sections, file_path, export_format)
+        )
+        return sum(results)
+    finally:
+        _merging.discard(report_id)
+        for _, section_path in sections:
+            if os.path.exists(section_path):
+                os.remove(section_path)
+
+
+def _start(job: Awaitable):
+    task = asyncio.create_task(job)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def _wait_for_job(
+    report_id: int, job: Awaitable[int], source_path: str, file_path: str, cache_key: Optional[str]
+):
+    try:
+        rows = await job
+        await Report.filter(id=report_id).update(status="completed", file_path=file_path)
+        logger.info(f"Report {report_id} rendered ({rows} rows): {file_path}")
+    except Exception:
+        logger.exception(f"Report {report_id} failed")
+        await Report.filter(id=report_id).update(status="failed")
+        return
+    finally:
+        _jobs.pop(report_id, None)
+        await asyncio.to_thread(remove_upload, source_path)
+
+    if cache_key:
+        try:
+            await asyncio.to_thread(report_cache.store, cache_key, file_path)
+        except OSError:
+            logger.exception(f"Could not cache report {report_id}")
+
+
+async def fail_stale_jobs():
+    """
+    Mark reports left in progress by a process that died as failed, and remove the
+    uploads pinned for them. Only jobs older than REPORT_JOB_STALE_AFTER are touched, so
+    jobs of other live workers are left alone.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=REPORT_JOB_STALE_AFTER)
+    count = await Report.filter(status="in-progress", created_at__lt=cutoff).update(status="failed")
+    if count:
+        logger.warning(f"Marked {count} stale report job(s) as failed")
+    if removed := await asyncio.to_thread(remove_stale_pins, REPORT_JOB_STALE_AFTER):
+        logger.warning(f"Removed {removed} pinned upload(s) of stale report jobs")
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
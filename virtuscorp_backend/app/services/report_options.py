@@ -0,0 +1,117 @@
+# app/services/report_options.py
+
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.schemas.report import ReportGenerateRequest
+from app.services.columns import (
+    COST_COLUMNS,
+    KEY_COLUMNS,
+    PROFIT_COLUMNS,
+    REVENUE_COLUMNS,
+    SECTION_COLUMNS,
+    TAX_MARKERS,
+    find_column,
+)
+from app.services.filters import combine, compile_mask, date_range_condition, parse_filter
+from app.services.uploads import upload_schema_frame
+
+MARGIN_COLUMN = "Маржа, %"
+
+
+class ReportOptions(NamedTuple):
+    """The data selection options of a report request; picklable, so it can go to report workers."""
+
+    filters: Optional[str] = None
+    date_range: Optional[str] = None
+    exclude_taxes: bool = False
+    show_profit_margin: bool = False
+    # Report type of a combined report section; limits the columns to those of the type
+    section: Optional[str] = None
+
+    @classmethod
+    def from_request(cls, request: ReportGenerateRequest) -> "ReportOptions":
+        return cls(
+            filters=request.filters,
+            date_range=request.date_range,
+            exclude_taxes=bool(request.exclude_taxes),
+            show_profit_margin=bool(request.show_profit_margin),
+        )
+
+    def condition(self):
+        """The filter and the date range as one parsed condition, or None."""
+        return combine(parse_filter(self.filters), date_range_condition(self.date_range))
+
+
+def _profit_margin(chunk: pd.DataFrame) -> pd.Series:
+    revenue_col = find_column(chunk, REVENUE_COLUMNS)
+    profit_col = find_column(chunk, PROFIT_COLUMNS)
+    cost_col = find_column(chunk, COST_COLUMNS)
+    if revenue_col is None or (profit_col is None and cost_col is None):
+        raise ValueError("show_profit_margin needs a revenue column and a profit or cost column")
+
+    revenue = pd.to_numeric(chunk[revenue_col], errors="coerce")
+    if profit_col is not None:
+        profit = pd.to_numeric(chunk[profit_col], errors="coerce")
+    else:
+        profit = revenue - pd.to_numeric(chunk[cost_col], errors="coerce")
+    margin = (profit / revenue.where(revenue != 0) * 100).round(2)
+    return margin.replace([np.inf, -np.inf], np.nan)
+
+
+def _shape_chunk(chunk: pd.DataFrame, condition, options: ReportOptions) -> pd.DataFrame:
+    if condition is not None:
+        chunk = chunk[compile_mask(condition, chunk)]
+    if options.show_profit_margin:
+        chunk = chunk.assign(**{MARGIN_COLUMN: _profit_margin(chunk)})
+    if options.exclude_taxes:
+        taxes = [col for col in chunk.columns if any(marker in str(col).lower() for marker in TAX_MARKERS)]
+        chunk = chunk.drop(columns=taxes)
+    if options.section:
+        chunk = chunk[_section_columns(chunk.columns, options.section)]
+    return chunk
+
+
+def _is_measure(col, section: str) -> bool:
+    header = str(col).strip().lower()
+    if header in SECTION_COLUMNS[section]:
+        return True
+    if section == "financial" and any(marker in header for marker in TAX_MARKERS):
+        return True
+    return col == MARGIN_COLUMN and section in ("financial", "sales")
+
+
+def _section_columns(columns, section: str) -> list:
+    """The identifying columns plus the measure columns of the report type, in upload order."""
+    return [col for col in columns if str(col).strip().lower() in KEY_COLUMNS or _is_measure(col, section)]
+
+
+def apply_report_options(chunks: Iterable[pd.DataFrame], options: ReportOptions) -> Iterator[pd.DataFrame]:
+    """
+    Filter the rows and shape the columns of each chunk before anything is rendered,
+    so the rendering cost follows the selected rows. Chunks left empty are skipped.
+    """
+    condition = options.condition()
+    for chunk in chunks:
+        chunk = _shape_chunk(chunk, condition, options)
+        if not chunk.empty:
+            yield chunk
+
+
+def validate_report_options(options: ReportOptions, file_path: str):
+    """
+    Raise ValueError (FilterError for filters and date ranges) when the options don't
+    fit the upload, by applying them to its columns without reading any rows. Blocking.
+    """
+    _shape_chunk(upload_schema_frame(file_path), options.condition(), options)
+
+
+def sections_with_data(options: ReportOptions, file_path: str, sections: List[str]) -> List[str]:
+    """
+    The sections of a combined report the upload has measure columns for, so no section
+    repeats another's data under a different title. Blocking.
+    """
+    frame = _shape_chunk(upload_schema_frame(file_path), options.condition(), options)
+    return [section for section in sections if any(_is_measure(col, section) for col in frame.columns)]
@@ -0,0 +1,153 @@
+# app/services/reporting.py
+#
+# PDF rendering engine used by the PDF exporter in the report worker processes.
+
+import logging
+from typing import List, NamedTuple, Optional
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import LongTable, Paragraph, SimpleDocTemplate, TableStyle
+
+from app.utils.instrumentation import traced
+
+logger = logging.getLogger(__name__)
+
+# Register a font with Cyrillic support
+try:
+    pdfmetrics.registerFont(TTFont("DejaVuSans", "DejaVuSans.ttf"))
+    FONT_NAME = "DejaVuSans"
+except Exception as e:
+    logger.warning(f"Could not register DejaVuSans font: {str(e)}")
+    FONT_NAME = "Helvetica"
+
+PAGE_SIZE = letter
+MARGIN = 72
+TABLE_WIDTH = PAGE_SIZE[0] - 2 * MARGIN
+FONT_SIZE = 8
+# Left plus right padding reportlab puts around the text of a cell
+CELL_PADDING = 12
+# Columns get the width of their header or longest value within these bounds; longer
+# values wrap, and columns that don't fit next to each other go to tables of their own
+MIN_COL_WIDTH = 40
+MAX_COL_WIDTH = TABLE_WIDTH / 3
+# Values are cut to this many characters, so one cell can't outgrow a page
+MAX_CELL_CHARS = 200
+# Data rows per table; most chunks fit one page, while tables with wrapped cells split over pages
+ROWS_PER_TABLE = 40
+
+# Built once per process instead of once per report
+STYLES = getSampleStyleSheet()
+TITLE_STYLE = ParagraphStyle("ReportTitle", parent=STYLES["Heading1"], fontName=FONT_NAME)
+CELL_STYLE = ParagraphStyle(
+    "ReportCell", fontName=FONT_NAME, fontSize=FONT_SIZE, leading=FONT_SIZE + 2, alignment=TA_CENTER,
+)
+TABLE_STYLE = TableStyle(
+    [
+        ("FONTNAME", (0, 0), (-1, -1), FONT_NAME),
+        ("FONTSIZE", (0, 0), (-1, -1), FONT_SIZE),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.lightblue),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
+        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("GRID", (0, 0), (-1, -1), 1, colors.black),
+    ]
+)
+
+
+class TableLayout(NamedTuple):
+    """Width of every column, and the column indexes of each table placed across the page."""
+
+    widths: List[float]
+    groups: List[List[int]]
+
+
+def _cell_strings(df) -> list:
+    """Convert every cell to its string form one column at a time, as a list of rows."""
+    return df.astype(str).values.tolist()
+
+
+def _text_width(text: str) -> float:
+    return pdfmetrics.stringWidth(text, FONT_NAME, FONT_SIZE)
+
+
+def table_layout(df) -> TableLayout:
+    """
+    Size the columns of a DataFrame from their header and longest value, and split them
+    into groups that fit the page width. Every group after the first starts with the
+    first column again, so its rows can still be told apart.
+    """
+    widths = []
+    for col in df.columns:
+        values = df[col].astype(str)
+        longest = values.iloc[values.str.len().argmax()][:MAX_CELL_CHARS] if len(values) else ""
+        natural = max(_text_width(str(col)), _text_width(longest)) + CELL_PADDING
+        widths.append(min(max(natural, MIN_COL_WIDTH), MAX_COL_WIDTH))
+
+    groups = []
+    group, used = [0], widths[0] if widths else 0
+    for i in range(1, len(widths)):
+        if used + widths[i] > TABLE_WIDTH:
+            groups.append(group)
+            group, used = [0], widths[0]
+        group.append(i)
+        used += widths[i]
+    if widths:
+        groups.append(group)
+    return TableLayout(widths, groups)
+
+
+def _cell(text: str, width: float):
+    """A cell's value, as a wrapping Paragraph when it doesn't fit on one line of the column."""
+    if len(text) > MAX_CELL_CHARS:
+        text = text[:MAX_CELL_CHARS - 1] + "…"
+    if _text_width(text) + CELL_PADDING <= width:
+        return text
+    return Paragraph(escape(text), CELL_STYLE)
+
+
+def table_flowables(df, layout: Optional[TableLayout] = None, rows_per_table: int = ROWS_PER_TABLE) -> list:
+    """
+    Split a DataFrame into LongTables of rows_per_table rows that repeat the header row,
+    one per column group of the layout (by default sized from df). Only values too wide
+    for their column become Paragraphs, so reportlab lays out short cells as plain strings.
+    """
+    headers = [str(col) for col in df.columns]
+    if not headers:
+        return []
+    layout = layout or table_layout(df)
+    rows = _cell_strings(df)
+
+    tables = []
+    for start in range(0, max(len(rows), 1), rows_per_table):
+        block = [headers] + rows[start:start + rows_per_table]
+        for group in layout.groups:
+            widths = [layout.widths[i] for i in group]
+            data = [[_cell(row[i], layout.widths[i]) for i in group] for row in block]
+            table = LongTable(data, colWidths=widths, repeatRows=1)
+            table.setStyle(TABLE_STYLE)
+            tables.append(table)
+    return tables
+
+
+@traced("report.build_pdf")
+def build_pdf(chunks, title: str, target):
+    """
+    Render DataFrame chunks as a PDF document with a title and a table,
+    into a path or file object. The columns are sized from the first chunk.
+    """
+    elements = [Paragraph(title, TITLE_STYLE)]
+    layout = None
+    for chunk in chunks:
+        layout = layout or table_layout(chunk)
+        elements.extend(table_flowables(chunk, layout))
+    doc = SimpleDocTemplate(
+        target, pagesize=PAGE_SIZE,
+        leftMargin=MARGIN, rightMargin=MARGIN, topMargin=MARGIN, bottomMargin=MARGIN,
+    )
+    doc.build(elements)
@@ -0,0 +1,32 @@
+# app/services/rollups.py
+
+import asyncio
+import logging
+
+from tortoise import connections
+from tortoise.backends.asyncpg.client import AsyncpgDBClient
+
+from app.crud.metric import refresh_rollups
+
+logger = logging.getLogger(__name__)
+
+
+async def run_rollup_refresher(interval: float):
+    """
+    Keep the metric rollups up to date: every interval seconds, recompute the buckets
+    touched by newly ingested rows. Runs for the lifetime of the application.
+    """
+    if not isinstance(connections.get("default"), AsyncpgDBClient):
+        logger.info("Metric rollups need PostgreSQL; refresher not started")
+        return
+
+    while True:
+        try:
+            # Drain the queue before sleeping, so bursts of uploads catch up quickly
+            while days := await refresh_rollups():
+                logger.info(f"Refreshed metric rollups for {days} day(s)")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Metric rollup refresh failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,60 @@
+# app/services/serialization.py
+
+import orjson
+import pandas as pd
+from pandas.api.types import infer_dtype, is_datetime64_any_dtype, is_object_dtype
+
+from app.utils.instrumentation import traced
+
+DATE_FORMAT = "%Y-%m-%d"
+JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def _convert_cell(value):
+    """Per-cell conversion, only used for object columns that mix timestamps with other values."""
+    if pd.isna(value):
+        return 0
+    if isinstance(value, pd.Timestamp):
+        return value.strftime(DATE_FORMAT)
+    return value
+
+
+def _convert_column(col: pd.Series) -> pd.Series:
+    if is_datetime64_any_dtype(col.dtype):
+        return col.dt.strftime(DATE_FORMAT).astype(object).where(col.notna(), 0)
+    if is_object_dtype(col.dtype) and infer_dtype(col, skipna=True) in ("datetime", "mixed"):
+        return col.map(_convert_cell)
+    if col.hasnans:
+        # Object dtype keeps the filled 0 an int, as in the original per-cell loop
+        return col.astype(object).where(col.notna(), 0)
+    return col
+
+
+@traced("serialize.records")
+def frame_to_records(df: pd.DataFrame) -> list:
+    """
+    Convert a DataFrame to a list of records column by column:
+    missing values become 0 and timestamps become YYYY-MM-DD strings.
+    """
+    columns = list(df.columns)
+    converted = [_convert_column(df.iloc[:, i]) for i in range(len(columns))]
+    if not converted:
+        return [{} for _ in range(len(df))]
+    frame = pd.DataFrame(dict(enumerate(converted)))
+    return [dict(zip(columns, row)) for row in frame.itertuples(index=False, name=None)]
+
+
+@traced("serialize.json")
+def dumps(content) -> bytes:
+    return orjson.dumps(content, option=JSON_OPTIONS)
+
+
+def iter_ndjson(df: pd.DataFrame, chunk_rows: int):
+    """
+    Yield the frame as newline-delimited JSON records, converting one chunk of rows
+    at a time so only chunk_rows records exist as Python dicts at once.
+    """
+    for start in range(0, len(df), chunk_rows):
+        records = frame_to_records(df.iloc[start:start + chunk_rows])
+        yield b"".join(dumps(record) + b"\n" for record in records)
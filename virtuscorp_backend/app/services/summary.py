@@ -0,0 +1,139 @@
+# app/services/summary.py
+
+import math
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_datetime64_any_dtype, is_numeric_dtype
+
+from app.utils.instrumentation import traced
+
+# Bumped when the layout of a summary changes, so stale sidecars are recomputed
+SUMMARY_VERSION = 1
+HISTOGRAM_BINS = 20
+# Hashes kept per column for the distinct count; exact below this many distinct values
+DISTINCT_SKETCH_SIZE = 1024
+
+
+def _number(value) -> Optional[float]:
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+class _ColumnStats:
+    """Mergeable statistics of one column, updated chunk by chunk."""
+
+    def __init__(self, name, dtype):
+        self.name = name
+        self.dtype = dtype
+        self.numeric = is_numeric_dtype(dtype) and not is_bool_dtype(dtype)
+        self.temporal = is_datetime64_any_dtype(dtype)
+        self.count = 0
+        self.nulls = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.sketch = np.empty(0, dtype=np.uint64)  # smallest distinct value hashes, sorted
+        self.histogram = None
+
+    def update(self, col: pd.Series):
+        values = col.dropna()
+        self.count += len(values)
+        self.nulls += len(col) - len(values)
+        if values.empty:
+            return
+
+        # K minimum values sketch: the k smallest hashes estimate the number of distinct values
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+        self.sketch = np.union1d(self.sketch, hashes)[:DISTINCT_SKETCH_SIZE]
+
+        if self.numeric:
+            finite = values.to_numpy(dtype=float, na_value=np.nan)
+            finite = finite[np.isfinite(finite)]
+            if finite.size:
+                self.sum += float(finite.sum())
+                low, high = float(finite.min()), float(finite.max())
+                self.min = low if self.min is None else min(self.min, low)
+                self.max = high if self.max is None else max(self.max, high)
+        elif self.temporal:
+            low, high = values.min(), values.max()
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+
+    def update_histogram(self, col: pd.Series):
+        values = col.to_numpy(dtype=float, na_value=np.nan)
+        values = values[np.isfinite(values)]
+        counts, _ = np.histogram(values, bins=HISTOGRAM_BINS, range=self._histogram_range())
+        self.histogram = counts if self.histogram is None else self.histogram + counts
+
+    def _histogram_range(self):
+        # A constant column gets one unit wide bins around its value, as numpy does
+        if self.min == self.max:
+            return self.min - 0.5, self.max + 0.5
+        return self.min, self.max
+
+    @property
+    def needs_histogram(self) -> bool:
+        return self.numeric and self.min is not None
+
+    def distinct(self) -> int:
+        if len(self.sketch) < DISTINCT_SKETCH_SIZE:
+            return len(self.sketch)
+        return int(round((DISTINCT_SKETCH_SIZE - 1) / (float(self.sketch[-1]) / 2.0 ** 64)))
+
+    def result(self) -> dict:
+        stats = {
+            "name": str(self.name),
+            "dtype": str(self.dtype),
+            "count": self.count,
+            "nulls": self.nulls,
+            "distinct": self.distinct(),
+            "distinct_exact": len(self.sketch) < DISTINCT_SKETCH_SIZE,
+        }
+        if self.numeric:
+            stats.update(
+                sum=_number(self.sum) if self.min is not None else None,
+                mean=_number(self.sum / self.count) if self.min is not None and self.count else None,
+                min=self.min,
+                max=self.max,
+            )
+            if self.histogram is not None:
+                edges = np.linspace(*self._histogram_range(), HISTOGRAM_BINS + 1)
+                stats["histogram"] = {"edges": edges.tolist(), "counts": self.histogram.tolist()}
+        elif self.temporal:
+            stats.update(
+                min=self.min.isoformat() if self.min is not None else None,
+                max=self.max.isoformat() if self.max is not None else None,
+            )
+        return stats
+
+
+@traced("upload.summarize")
+def summarize_chunks(chunks: Callable[[], Iterable[pd.DataFrame]]) -> dict:
+    """
+    Per-column summary of a table read as chunks: count, null count, distinct estimate,
+    sum/mean/min/max and a histogram for numeric columns, the range for dates.
+    chunks() is called twice, once more for the histograms once the ranges are known.
+    """
+    columns: List[_ColumnStats] = []
+    rows = 0
+    for chunk in chunks():
+        if not columns:
+            columns = [_ColumnStats(name, dtype) for name, dtype in chunk.dtypes.items()]
+        rows += len(chunk)
+        for i, stats in enumerate(columns):
+            stats.update(chunk.iloc[:, i])
+
+    if any(stats.needs_histogram for stats in columns):
+        for chunk in chunks():
+            for i, stats in enumerate(columns):
+                if stats.needs_histogram:
+                    stats.update_histogram(chunk.iloc[:, i])
+
+    return {"version": SUMMARY_VERSION, "rows": rows, "columns": [stats.result() for stats in columns]}
+
+
+def summarize_frame(df: pd.DataFrame) -> dict:
+    """summarize_chunks of a frame in memory, each statistic computed on whole columns."""
+    return summarize_chunks(lambda: [df])
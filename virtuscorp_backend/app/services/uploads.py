@@ -0,0 +1,315 @@
+# app/services/uploads.py
+#
+# pandas, pyarrow and the summary statistics are imported by the functions that read or
+# convert data, on first use; paths, hashing and the index of uploads don't need them.
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import TYPE_CHECKING, Dict, Iterator, Optional, Tuple
+
+import orjson
+
+from app.config import UPLOAD_CACHE_MAX_BYTES
+from app.utils.cache import ByteBudgetLRU
+from app.utils.instrumentation import traced
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = "uploaded_files"
+SUPPORTED_EXTENSIONS = (".csv", ".xlsx")
+# Uncompressed Arrow IPC sidecar written next to each upload, so reads can mmap it
+COLUMNAR_SUFFIX = ".arrow"
+# Rows per record batch in the sidecar, the unit of chunked reads
+COLUMNAR_BATCH_ROWS = 65_536
+# Per-column summary statistics written next to each upload
+SUMMARY_SUFFIX = ".summary.json"
+# Private links to uploads read by report jobs (see pin_upload)
+PINNED_DIR = os.path.join(UPLOAD_DIR, ".pinned")
+DIGEST_CACHE_SIZE = 1024
+
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+# Parsed uploads keyed by (user_id, path, inode, mtime_ns, size)
+_frame_cache = ByteBudgetLRU(UPLOAD_CACHE_MAX_BYTES)
+# SHA-256 of file contents keyed by (device, inode, mtime_ns, size), oldest first
+_digests: Dict[Tuple[int, int, int, int], str] = {}
+_digests_lock = threading.Lock()
+
+
+def user_upload_dir(user_id: int) -> str:
+    """
+    Directory holding the uploads of a user, sharded by the low bits of the id so no
+    directory grows with the number of users.
+    """
+    return os.path.join(UPLOAD_DIR, f"{user_id % 256:02x}", str(user_id))
+
+
+def columnar_path(file_path: str) -> str:
+    return file_path + COLUMNAR_SUFFIX
+
+
+def summary_path(file_path: str) -> str:
+    return file_path + SUMMARY_SUFFIX
+
+
+@traced("upload.parse")
+def parse_upload(file_path: str) -> pd.DataFrame:
+    """Parse an original CSV or Excel upload."""
+    import pandas as pd
+
+    if file_path.endswith(".csv"):
+        return pd.read_csv(file_path)
+    return pd.read_excel(file_path)
+
+
+def sniff_upload(file_path: str, nrows: int) -> pd.DataFrame:
+    """Parse only the header and the first nrows rows of an upload, for validation."""
+    import pandas as pd
+
+    if file_path.endswith(".csv"):
+        return pd.read_csv(file_path, nrows=nrows)
+    return pd.read_excel(file_path, nrows=nrows)
+
+
+@traced("upload.convert")
+def convert_upload(user_id: int, file_path: str) -> pd.DataFrame:
+    """
+    Parse a freshly stored upload once, write its columnar and summary sidecars and cache
+    the frame. Blocking; run it in the thread pool.
+    """
+    from app.services.summary import summarize_frame
+
+    df = parse_upload(file_path)
+    write_columnar(df, file_path)
+    write_summary(summarize_frame(df), file_path)
+    invalidate_user_cache(user_id)
+    _remember_frame(user_id, file_path, df)
+    return df
+
+
+def write_columnar(df: pd.DataFrame, file_path: str) -> Optional[str]:
+    """
+    Convert a parsed upload into the Arrow IPC sidecar.
+    Returns the sidecar path, or None when the frame can't be represented in Arrow
+    (for example a column mixing numbers and text) - reads then fall back to parsing.
+    """
+    import pyarrow as pa
+
+    target = columnar_path(file_path)
+    tmp_path = f"{target}.tmp"
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=COLUMNAR_BATCH_ROWS)
+        os.replace(tmp_path, target)
+    except (pa.ArrowException, ValueError, TypeError) as e:
+        logger.warning(f"Could not convert {file_path} to Arrow: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    return target
+
+
+@traced("upload.read_columnar")
+def read_columnar(path: str) -> pd.DataFrame:
+    """Read an Arrow IPC sidecar through a memory map instead of parsing the original."""
+    import pyarrow as pa
+
+    source = pa.memory_map(path, "r")
+    return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+def link_upload(source_path: str, file_path: str):
+    """
+    Store an upload as a hard link to an identical stored one, together with its sidecars,
+    so the contents and derived artifacts exist once on disk. Sidecars the source lacks are
+    removed at the target, since they belong to a file that is being replaced. Blocking.
+    """
+    for source, target in (
+        (columnar_path(source_path), columnar_path(file_path)),
+        (summary_path(source_path), summary_path(file_path)),
+        (source_path, file_path),
+    ):
+        if not os.path.exists(source):
+            if os.path.exists(target):
+                os.remove(target)
+            continue
+        tmp_path = f"{target}.link"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        os.link(source, tmp_path)
+        os.replace(tmp_path, target)
+
+
+def write_summary(summary: dict, file_path: str) -> bytes:
+    """Store the summary of an upload in its sidecar; returns the serialized summary."""
+    content = orjson.dumps(summary, option=orjson.OPT_SERIALIZE_NUMPY)
+    target = summary_path(file_path)
+    tmp_path = f"{target}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, target)
+    return content
+
+
+def load_upload_summary(file_path: str) -> bytes:
+    """
+    The serialized summary of an upload, read from its sidecar. Uploads stored before
+    summaries existed (or with an outdated one) are summarized once, streaming over the
+    columnar sidecar chunk by chunk. Blocking.
+    """
+    from app.services.summary import SUMMARY_VERSION, summarize_chunks
+
+    sidecar = summary_path(file_path)
+    if os.path.exists(sidecar) and os.stat(sidecar).st_mtime_ns >= os.stat(file_path).st_mtime_ns:
+        with open(sidecar, "rb") as f:
+            content = f.read()
+        if orjson.loads(content).get("version") == SUMMARY_VERSION:
+            return content
+    summary = summarize_chunks(lambda: iter_upload_chunks(file_path, COLUMNAR_BATCH_ROWS))
+    return write_summary(summary, file_path)
+
+
+def remove_upload(file_path: str):
+    """Delete an upload together with its derived artifacts."""
+    for path in (file_path, columnar_path(file_path), summary_path(file_path)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def file_digest(file_path: str) -> str:
+    """
+    SHA-256 of the file contents, remembered while the file is unchanged. Keyed by the
+    inode rather than the path, so hard links to the same contents share the entry.
+    """
+    stat = os.stat(file_path)
+    key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    digest = _digests.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with _digests_lock:
+            _digests[key] = digest
+            if len(_digests) > DIGEST_CACHE_SIZE:
+                del _digests[next(iter(_digests))]
+    return digest
+
+
+def pin_upload(file_path: str) -> str:
+    """
+    Hard-link an upload and its sidecars to a private path, whose contents stay the same
+    when the upload is replaced. Remove the pinned copy with remove_upload. Blocking.
+    """
+    os.makedirs(PINNED_DIR, exist_ok=True)
+    pinned = os.path.join(PINNED_DIR, uuid.uuid4().hex + os.path.splitext(file_path)[1])
+    link_upload(file_path, pinned)
+    return pinned
+
+
+def remove_stale_pins(max_age: float) -> int:
+    """
+    Remove pinned uploads linked more than max_age seconds ago, left behind by jobs of a
+    process that died. Returns how many files were removed. Blocking.
+    """
+    if not os.path.isdir(PINNED_DIR):
+        return 0
+    # Linking updates the ctime, so it tells when the pin was made
+    cutoff = time.time() - max_age
+    removed = 0
+    with os.scandir(PINNED_DIR) as it:
+        for entry in it:
+            try:
+                if entry.stat().st_ctime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+    return removed
+
+
+def read_upload(file_path: str, stat: Optional[os.stat_result] = None) -> pd.DataFrame:
+    """Read an upload from its columnar sidecar when it is up to date, without caching."""
+    stat = stat or os.stat(file_path)
+    sidecar = columnar_path(file_path)
+    if os.path.exists(sidecar) and os.stat(sidecar).st_mtime_ns >= stat.st_mtime_ns:
+        return read_columnar(sidecar)
+    # Uploads stored before the conversion existed get their sidecar on first read
+    df = parse_upload(file_path)
+    write_columnar(df, file_path)
+    return df
+
+
+def upload_schema_frame(file_path: str) -> pd.DataFrame:
+    """An empty frame with the columns and dtypes of an upload, read without any rows."""
+    import pyarrow as pa
+
+    sidecar = columnar_path(file_path)
+    if os.path.exists(sidecar) and os.stat(sidecar).st_mtime_ns >= os.stat(file_path).st_mtime_ns:
+        return pa.ipc.open_file(pa.memory_map(sidecar, "r")).schema.empty_table().to_pandas()
+    return sniff_upload(file_path, 0)
+
+
+def iter_upload_chunks(file_path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """
+    Yield an upload as DataFrames of at most chunk_rows rows. With an up-to-date sidecar
+    only one chunk is converted from the memory map at a time, so memory stays flat.
+    """
+    import pyarrow as pa
+
+    stat = os.stat(file_path)
+    sidecar = columnar_path(file_path)
+    if os.path.exists(sidecar) and os.stat(sidecar).st_mtime_ns >= stat.st_mtime_ns:
+        reader = pa.ipc.open_file(pa.memory_map(sidecar, "r"))
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            for offset in range(0, batch.num_rows, chunk_rows):
+                yield batch.slice(offset, chunk_rows).to_pandas()
+        return
+
+    df = read_upload(file_path, stat)
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+@traced("upload.load")
+def load_upload_frame(user_id: int, file_path: str) -> pd.DataFrame:
+    """
+    Load an upload as a DataFrame, reusing the in-process cache when the file is unchanged.
+    The returned frame may be shared between requests and must not be modified in place.
+    """
+    stat = os.stat(file_path)
+    df = _frame_cache.get(_cache_key(user_id, file_path, stat))
+    if df is not None:
+        return df
+
+    df = read_upload(file_path, stat)
+    invalidate_user_cache(user_id)
+    _remember_frame(user_id, file_path, df, stat)
+    return df
+
+
+def _cache_key(user_id: int, file_path: str, stat: os.stat_result) -> tuple:
+    return (user_id, file_path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _remember_frame(user_id: int, file_path: str, df: pd.DataFrame, stat: Optional[os.stat_result] = None):
+    stat = stat or os.stat(file_path)
+    _frame_cache.put(_cache_key(user_id, file_path, stat), df, int(df.memory_usage(deep=True).sum()))
+
+
+def invalidate_user_cache(user_id: int):
+    """Forget every cached frame of the user."""
+    _frame_cache.discard_where(lambda key: key[0] == user_id)
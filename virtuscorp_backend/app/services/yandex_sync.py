@@ -0,0 +1,281 @@
+# app/services/yandex_sync.py
+
+import asyncio
+import logging
+import random
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import List, Optional
+from zoneinfo import ZoneInfo
+
+import httpx
+from tortoise.expressions import Q
+from tortoise.transactions import in_transaction
+
+from app.config import (
+    METRIC_INGEST_BATCH_SIZE,
+    YANDEX_API_URL,
+    YANDEX_MAX_CONNECTIONS,
+    YANDEX_MAX_RETRIES,
+    YANDEX_RATE_LIMIT,
+    YANDEX_RETRY_BACKOFF,
+    YANDEX_SYNC_CONCURRENCY,
+    YANDEX_SYNC_LEASE,
+    YANDEX_SYNC_LOOKBACK_DAYS,
+    YANDEX_TIMEOUT,
+)
+from app.crud.metric import bulk_insert_metrics
+from app.models.metric import Metric, MetricRollupDirty
+from app.models.yandex import YandexIntegration
+from app.utils.rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+MARKETPLACE = "Yandex"
+# Category of the synced metrics: re-syncing a day replaces them and leaves uploaded data alone
+SYNC_CATEGORY = "Яндекс Маркет API"
+ORDERS_METRIC = "Заказы"
+REVENUE_METRIC = "Выручка"
+# The Partner API works with Moscow dates
+YANDEX_TZ = ZoneInfo("Europe/Moscow")
+# Throttled (420/429) and server errors are retried
+RETRY_STATUSES = {420, 429, 500, 502, 503, 504}
+ORDERS_PAGE_SIZE = 200
+
+
+class YandexAPIError(Exception):
+    def __init__(self, status_code: Optional[int], detail: str):
+        super().__init__(f"Yandex Market API error {status_code}: {detail}" if status_code else detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class SyncInProgress(Exception):
+    """Another worker holds the integration's sync lease."""
+
+
+_client: Optional[httpx.AsyncClient] = None
+_limiter = RateLimiter(YANDEX_RATE_LIMIT)
+
+
+def get_client() -> httpx.AsyncClient:
+    """The HTTP/2 client shared by every Yandex request of this process, created on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=YANDEX_API_URL,
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=YANDEX_MAX_CONNECTIONS,
+                max_keepalive_connections=YANDEX_MAX_CONNECTIONS,
+            ),
+            timeout=YANDEX_TIMEOUT,
+            headers={"Accept": "application/json"},
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _backoff(attempt: int) -> float:
+    # Exponential with jitter, so throttled workers don't retry in lockstep
+    return YANDEX_RETRY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1)
+
+
+def _retry_after(response: httpx.Response) -> float:
+    try:
+        return float(response.headers.get("Retry-After", 0))
+    except ValueError:
+        return 0
+
+
+async def request(method: str, url: str, token: str, retries: int = YANDEX_MAX_RETRIES, **kwargs) -> httpx.Response:
+    """
+    Send a Partner API request within the token's rate limit. Throttled requests, server
+    errors and transport errors are retried with exponential backoff (at least Retry-After);
+    other error responses, and failures once the retries are used up, raise YandexAPIError.
+    """
+    client = get_client()
+    headers = {"Authorization": f"Bearer {token}"}
+    for attempt in range(retries + 1):
+        await _limiter.wait(token)
+        try:
+            response = await client.request(method, url, headers=headers, **kwargs)
+        except httpx.TransportError as e:
+            if attempt == retries:
+                raise YandexAPIError(None, str(e) or type(e).__name__) from e
+            delay = _backoff(attempt)
+        else:
+            if response.status_code < 400:
+                return response
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                raise YandexAPIError(response.status_code, response.text)
+            delay = max(_backoff(attempt), _retry_after(response))
+            if response.status_code in (420, 429):
+                # Slow down every request with this token, not just this one
+                _limiter.hold(token, delay)
+        logger.warning(f"Yandex {method} {url} failed (attempt {attempt + 1}), retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+
+async def fetch_orders(integration: YandexIntegration, date_from: date, date_to: date) -> List[dict]:
+    """The campaign's orders created between the two dates (inclusive), all pages."""
+    url = f"/campaigns/{integration.campaign_id}/stats/orders"
+    body = {"dateFrom": date_from.isoformat(), "dateTo": date_to.isoformat()}
+    orders = []
+    page_token = None
+    while True:
+        params = {"limit": ORDERS_PAGE_SIZE}
+        if page_token:
+            params["page_token"] = page_token
+        response = await request("POST", url, integration.token, params=params, json=body)
+        result = response.json().get("result") or {}
+        orders.extend(result.get("orders") or [])
+        page_token = (result.get("paging") or {}).get("nextPageToken")
+        if not page_token:
+            return orders
+
+
+def _order_day(value: str) -> date:
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        return datetime.strptime(value[:10], "%d-%m-%Y").date()
+
+
+def daily_metrics(orders: List[dict], user_id: int) -> List[tuple]:
+    """
+    Order count and buyer revenue per creation day, as metric rows in METRIC_COLUMNS order
+    stamped at midnight UTC of the day. Cancelled orders are left out.
+    """
+    counts = defaultdict(int)
+    revenue = defaultdict(float)
+    for order in orders:
+        if str(order.get("status", "")).startswith("CANCELLED"):
+            continue
+        day = _order_day(str(order["creationDate"]))
+        counts[day] += 1
+        for item in order.get("items") or []:
+            for price in item.get("prices") or []:
+                if price.get("type") == "BUYER":
+                    revenue[day] += float(price.get("total") or 0)
+
+    rows = []
+    for day in sorted(counts):
+        ts = datetime.combine(day, time(), tzinfo=timezone.utc)
+        rows.append((ORDERS_METRIC, float(counts[day]), ts, user_id, MARKETPLACE, SYNC_CATEGORY))
+        rows.append((REVENUE_METRIC, revenue[day], ts, user_id, MARKETPLACE, SYNC_CATEGORY))
+    return rows
+
+
+def _last_complete_day() -> date:
+    return datetime.now(YANDEX_TZ).date() - timedelta(days=1)
+
+
+async def sync_integration(integration: YandexIntegration) -> int:
+    """
+    Fetch the complete days after the integration's cursor, replace their synced metrics
+    and move the cursor to yesterday (Moscow time), all in one transaction. A failed sync
+    changes nothing and is redone from scratch next time. Returns the number of metric rows written.
+    """
+    last_day = _last_complete_day()
+    if integration.synced_until:
+        first_day = integration.synced_until + timedelta(days=1)
+    else:
+        first_day = last_day - timedelta(days=YANDEX_SYNC_LOOKBACK_DAYS - 1)
+    if first_day > last_day:
+        return 0
+
+    orders = await fetch_orders(integration, first_day, last_day)
+    rows = daily_metrics(orders, integration.user_id)
+
+    start = datetime.combine(first_day, time(), tzinfo=timezone.utc)
+    end = datetime.combine(last_day + timedelta(days=1), time(), tzinfo=timezone.utc)
+    # The old rows, the new ones and the cursor change together, so readers never see
+    # the days emptied and a failed sync leaves the previous rows in place
+    async with in_transaction():
+        deleted = await Metric.filter(
+            user_id=integration.user_id,
+            marketplace=MARKETPLACE,
+            category=SYNC_CATEGORY,
+            timestamp__gte=start,
+            timestamp__lt=end,
+        ).delete()
+        if deleted:
+            # Days left without rows after the redo still need their rollups recomputed
+            days = (first_day + timedelta(days=n) for n in range((last_day - first_day).days + 1))
+            await MetricRollupDirty.bulk_create(
+                [MetricRollupDirty(user_id=integration.user_id, bucket=day) for day in days],
+                ignore_conflicts=True,
+            )
+        written = await bulk_insert_metrics(rows, METRIC_INGEST_BATCH_SIZE) if rows else 0
+
+        integration.synced_until = last_day
+        await integration.save(update_fields=["synced_until"])
+    return written
+
+
+async def _claim(integration_id: int) -> bool:
+    now = datetime.now(timezone.utc)
+    claimed = await YandexIntegration.filter(
+        Q(sync_lease_until__isnull=True) | Q(sync_lease_until__lt=now),
+        id=integration_id,
+    ).update(sync_lease_until=now + timedelta(seconds=YANDEX_SYNC_LEASE))
+    return bool(claimed)
+
+
+async def sync_claimed(integration: YandexIntegration) -> int:
+    """sync_integration under the integration's lease; raises SyncInProgress when it is taken."""
+    if not await _claim(integration.id):
+        raise SyncInProgress(f"Yandex integration {integration.id} is being synced")
+    try:
+        return await sync_integration(integration)
+    finally:
+        await YandexIntegration.filter(id=integration.id).update(sync_lease_until=None)
+
+
+async def sync_due_integrations() -> int:
+    """
+    Sync every integration whose cursor is behind yesterday, at most YANDEX_SYNC_CONCURRENCY
+    at a time. Integrations taken by another worker are skipped and failures are logged,
+    to be retried on the next run. Returns the number of metric rows written.
+    """
+    due = await YandexIntegration.filter(
+        Q(synced_until__isnull=True) | Q(synced_until__lt=_last_complete_day())
+    )
+    semaphore = asyncio.Semaphore(YANDEX_SYNC_CONCURRENCY)
+
+    async def run(integration: YandexIntegration) -> int:
+        async with semaphore:
+            try:
+                return await sync_claimed(integration)
+            except SyncInProgress:
+                return 0
+            except Exception:
+                logger.exception(f"Yandex sync of integration {integration.id} failed")
+                return 0
+
+    return sum(await asyncio.gather(*(run(integration) for integration in due)))
+
+
+async def run_yandex_sync(interval: float):
+    """
+    Pull Yandex Market stats into the metrics every interval seconds. Runs for the
+    lifetime of the application.
+    """
+    if interval <= 0:
+        return
+    while True:
+        try:
+            if rows := await sync_due_integrations():
+                logger.info(f"Synced {rows} metric row(s) from Yandex Market")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Yandex sync failed")
+        await asyncio.sleep(interval)
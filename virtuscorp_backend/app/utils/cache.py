@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class ByteBudgetLRU:
+    """
+    Thread-safe LRU mapping bounded by the total size of its values in bytes.
+    The caller supplies the size of each value when storing it.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()  # key -> (value, size)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def put(self, key, value, size: int):
+        with self._lock:
+            self._pop(key)
+            if size > self.max_bytes:
+                # Never cache something that would evict everything else
+                return
+            self._items[key] = (value, size)
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                oldest = next(iter(self._items))
+                self._pop(oldest)
+
+    def discard(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def discard_where(self, predicate):
+        """Drop every entry whose key matches the predicate."""
+        with self._lock:
+            for key in [k for k in self._items if predicate(k)]:
+                self._pop(key)
+
+    def _pop(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._total_bytes -= item[1]
+
+
+class TTLCache:
+    """
+    Thread-safe mapping whose entries expire ttl seconds after they are stored, holding
+    at most max_entries (the oldest are dropped first). A ttl of 0 disables caching.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._items = OrderedDict()  # key -> (value, monotonic deadline)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[1] <= time.monotonic():
+                del self._items[key]
+                return None
+            return item[0]
+
+    def put(self, key, value, ttl: Optional[float] = None):
+        """Store a value; ttl can shorten, but not extend, the lifetime of this entry."""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = (value, time.monotonic() + ttl)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
@@ -1,12 +1,23 @@
+import logging
+import time
 from datetime import datetime, timedelta, timezone
+from typing import Optional
 from jose import jwt, JWTError
 from fastapi import Request, HTTPException
+from app.config import AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL
 from app.models.user import User
+from app.utils.cache import TTLCache
 
 SECRET_KEY = "12345"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
+logger = logging.getLogger(__name__)
+
+# Verified tokens -> user id, and user rows by id, local to this worker process
+_token_cache = TTLCache(AUTH_CACHE_TTL, AUTH_CACHE_MAX_ENTRIES)
+_user_cache = TTLCache(AUTH_CACHE_TTL, AUTH_CACHE_MAX_ENTRIES)
+
 def create_access_token(data: dict, expires_delta=None):
     """
     Create a JWT access token with timezone-aware expiration.
@@ -17,29 +28,54 @@ def create_access_token(data: dict, expires_delta=None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def invalidate_cached_user(user_id: int):
+    """Forget the cached row of a user; call it after changing the user."""
+    _user_cache.discard(user_id)
+
+
+async def _cached_user(user_id: int) -> Optional[User]:
+    user = _user_cache.get(user_id)
+    if user is None:
+        user = await User.get_or_none(id=user_id)
+        if user:
+            _user_cache.put(user_id, user)
+    return user
+
+
 async def get_current_user(request: Request) -> User:
     """
     Get the current user from the request token.
+    Verified tokens and user rows are cached for AUTH_CACHE_TTL seconds, so most
+    requests need neither a JWT decode nor a database query.
     """
     token = request.cookies.get("auth-token") or request.headers.get("x-auth-token")
     if not token:
-        print("Authentication error: No token provided")
+        logger.debug("Authentication failed: no token")
         raise HTTPException(status_code=401, detail="No token provided")
 
+    user_id = _token_cache.get(token)
+    if user_id is not None:
+        user = await _cached_user(user_id)
+        if user:
+            return user
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email = payload.get("sub")
         if not email:
-            print("Authentication error: Invalid token (no email in payload)")
+            logger.info("Authentication failed: no email in token")
             raise HTTPException(status_code=401, detail="Invalid token")
 
         user = await User.get_or_none(email=email)
         if not user:
-            print(f"Authentication error: User not found for email: {email}")
+            logger.info("Authentication failed: unknown user", extra={"email": email})
             raise HTTPException(status_code=401, detail="User not found")
         
-        print(f"Successfully authenticated user: {user.id} ({user.email})")
+        # A token is never remembered past its expiry
+        expires_in = payload["exp"] - time.time() if "exp" in payload else None
+        _token_cache.put(token, user.id, ttl=expires_in)
+        _user_cache.put(user.id, user)
         return user
     except JWTError as e:
-        print(f"JWT decode error: {str(e)}")
+        logger.info("Authentication failed: invalid token", extra={"error": str(e)})
         raise HTTPException(status_code=401, detail="Invalid token")
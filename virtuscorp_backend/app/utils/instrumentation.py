@@ -0,0 +1,94 @@
+# app/utils/instrumentation.py
+#
+# Prometheus metrics of the API: request latency per route (recorded by the timing
+# middleware), spans timing the hot paths and report cache lookups, served by
+# GET /metrics. Under app.server every worker process, report workers included, writes
+# its samples to PROMETHEUS_MULTIPROC_DIR and the endpoint adds them up.
+
+import functools
+import inspect
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+METRICS_MEDIA_TYPE = CONTENT_TYPE_LATEST
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the end of its response",
+    ["method", "route", "status"],
+)
+SPAN_LATENCY = Histogram(
+    "span_duration_seconds",
+    "Duration of instrumented operations",
+    ["span"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+SPAN_ERRORS = Counter("span_errors", "Instrumented operations that raised", ["span"])
+REPORT_CACHE_LOOKUPS = Counter("report_cache_lookups", "Lookups of rendered reports in the report cache", ["result"])
+
+# Query methods of Tortoise's database clients
+DB_CLIENT_METHODS = ("execute_query", "execute_query_dict", "execute_insert", "execute_many", "execute_script")
+
+
+@contextmanager
+def span(name: str):
+    """Time the enclosed block, awaits included, as span_duration_seconds{span=name}."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        SPAN_ERRORS.labels(name).inc()
+        raise
+    finally:
+        SPAN_LATENCY.labels(name).observe(time.perf_counter() - start)
+
+
+def traced(name: str):
+    """Decorator timing every call of a function (or coroutine function) as a span."""
+
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def instrument_db_client(client):
+    """Time the queries run through a Tortoise connection as db.<method> spans."""
+    for method in DB_CLIENT_METHODS:
+        # Wrapped on the instance, once; the class methods stay untouched
+        if method not in vars(client) and hasattr(client, method):
+            setattr(client, method, traced(f"db.{method}")(getattr(client, method)))
+
+
+def render_metrics() -> bytes:
+    """The metrics in the Prometheus text format, summed over worker processes if there are several."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
@@ -0,0 +1,65 @@
+# app/utils/logger.py
+#
+# Logging setup shared by the API workers and the report worker processes. Modules log
+# through logging.getLogger(__name__); fields passed with extra={...} become keys of the
+# JSON line, and every line logged while handling a request carries its request id.
+
+import contextvars
+import logging
+import sys
+from datetime import datetime, timezone
+from typing import Optional
+
+import orjson
+
+from app.config import LOG_FORMAT, LOG_LEVEL
+
+# Set by the timing middleware for the duration of each request
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed in extra (uvicorn adds an
+# ANSI-colored copy of its messages, which is left out as well)
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message",
+    "asctime",
+    "taskName",
+    "color_message",
+}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = request_id_var.get()
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode()
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        request_id = request_id_var.get()
+        return f"[{request_id}] {line}" if request_id else line
+
+
+def configure_logging():
+    """Send every logger's records to stdout at LOG_LEVEL, formatted as LOG_FORMAT."""
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(LOG_LEVEL)
@@ -0,0 +1,76 @@
+# app/utils/profiler.py
+#
+# A sampling profiler for live worker processes: a thread snapshots the stacks of every
+# other thread at a fixed interval and counts identical stacks. The result is in the
+# collapsed format ("frame;frame;frame count" per line) read by flamegraph.pl and
+# speedscope. It costs nothing while not running.
+
+import asyncio
+import sys
+import threading
+from collections import Counter
+
+DEFAULT_INTERVAL = 0.005
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._stacks = Counter()
+        self.samples = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval: float = DEFAULT_INTERVAL):
+        """Start sampling; raises RuntimeError if this process is already being profiled."""
+        with self._lock:
+            if self._thread is not None:
+                raise RuntimeError("The profiler is already running in this process")
+            self._stop.clear()
+            self._stacks = Counter()
+            self.samples = 0
+            self._thread = threading.Thread(
+                target=self._run, args=(interval,), name="sampling-profiler", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> str:
+        """Stop sampling and return the collapsed stacks, most frequent first."""
+        with self._lock:
+            if self._thread is None:
+                return ""
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        return "\n".join(f"{stack} {count}" for stack, count in self._stacks.most_common())
+
+    def _run(self, interval: float):
+        own_id = threading.get_ident()
+        while not self._stop.wait(interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+
+profiler = SamplingProfiler()
+
+
+async def profile_for(seconds: float, interval: float = DEFAULT_INTERVAL) -> str:
+    """Profile this process for the given time while it keeps serving, then return the stacks."""
+    profiler.start(interval)
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        stacks = profiler.stop()
+    return stacks
@@ -0,0 +1,30 @@
+import asyncio
+from typing import Dict, Hashable
+
+
+class RateLimiter:
+    """
+    Spaces out calls sharing a key to at most `rate` per second within one event loop.
+    Callers reserve the next free slot and sleep until it comes, so concurrent callers
+    are served in order without a lock. A rate of 0 disables the limit.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next: Dict[Hashable, float] = {}  # key -> earliest time of the next call
+
+    async def wait(self, key: Hashable):
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next.get(key, now))
+        self._next[key] = slot + self.interval
+        if len(self._next) > 1000:
+            self._next = {k: t for k, t in self._next.items() if t > now}
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def hold(self, key: Hashable, seconds: float):
+        """Make no call with the key for the next `seconds` (e.g. after HTTP 429)."""
+        now = asyncio.get_running_loop().time()
+        self._next[key] = max(self._next.get(key, now), now + seconds)
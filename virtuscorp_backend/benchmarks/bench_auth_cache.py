@@ -0,0 +1,76 @@
+"""
+Measure requests per second on GET /api/user/profile with the get_current_user
+token/user cache disabled and enabled.
+
+Requests go in-process through httpx's ASGI transport, so the numbers show the cost of
+the request path itself (JWT decode and user query vs. cache hits), not network I/O.
+SQLite in memory hides most of the query cost; point --db-url at PostgreSQL to see it.
+
+Run from the virtuscorp_backend directory:
+    python -m benchmarks.bench_auth_cache --seconds 5 --concurrency 20
+    python -m benchmarks.bench_auth_cache --db-url postgres://postgres:pw@localhost:5432/bench
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+
+import httpx
+from fastapi import FastAPI
+from tortoise import Tortoise
+
+from app.api.routes import user as user_routes
+from app.config import AUTH_CACHE_TTL
+from app.models.user import User
+from app.utils import helpers
+
+BENCH_EMAIL = "auth-bench@virtuscorp.ru"
+
+
+async def run(client: httpx.AsyncClient, token: str, seconds: float, concurrency: int) -> int:
+    deadline = time.perf_counter() + seconds
+    count = 0
+
+    async def worker():
+        nonlocal count
+        while time.perf_counter() < deadline:
+            response = await client.get("/api/user/profile", headers={"x-auth-token": token})
+            response.raise_for_status()
+            count += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return count
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db-url", default="sqlite://:memory:")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    await Tortoise.init(db_url=args.db_url, modules={"models": ["app.models.user"]})
+    await Tortoise.generate_schemas(safe=True)
+    user, _ = await User.get_or_create(email=BENCH_EMAIL, defaults={"password_hash": "-"})
+    token = helpers.create_access_token({"sub": user.email})
+
+    app = FastAPI()
+    app.include_router(user_routes.router, prefix="/api/user")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for label, ttl in (("no cache", 0), (f"cache (ttl {AUTH_CACHE_TTL:g}s)", AUTH_CACHE_TTL or 30)):
+            for cache in (helpers._token_cache, helpers._user_cache):
+                cache.ttl = ttl
+                cache.clear()
+            # get_current_user prints a line per request; keep it off the console
+            with contextlib.redirect_stdout(io.StringIO()):
+                await run(client, token, 0.5, args.concurrency)  # warm-up
+                count = await run(client, token, args.seconds, args.concurrency)
+            print(f"{label:<20} {count / args.seconds:9.0f} req/s")
+
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
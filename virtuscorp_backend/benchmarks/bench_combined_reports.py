@@ -0,0 +1,87 @@
+"""
+Measure the wall-clock time of a combined report rendered section by section in one
+process against its sections rendered in parallel by a process pool and then merged.
+Parallel time should approach the slowest section plus the merge when the machine has
+at least as many cores as sections.
+
+Run from the virtuscorp_backend directory:
+    python -m benchmarks.bench_combined_reports --rows 5000 --format pdf
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from app.services.exporters import REPORT_TYPES, get_exporter, merge_report_files, render_report_file
+from app.services.uploads import convert_upload
+
+
+def make_upload(directory: str, rows: int) -> str:
+    rng = np.random.default_rng(7)
+    df = pd.DataFrame(
+        {
+            "Дата": pd.date_range("2024-01-01", periods=rows, freq="h"),
+            "Маркетплейс": rng.choice(["Ozon", "WB", "Yandex"], rows),
+            "Выручка": rng.normal(1000, 250, rows).round(2),
+            "Заказы": rng.integers(0, 500, rows),
+        }
+    )
+    path = os.path.join(directory, "user_0_bench.csv")
+    df.to_csv(path, index=False)
+    convert_upload(0, path)
+    return path
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=5_000)
+    parser.add_argument("--format", default="pdf", choices=["pdf", "excel"])
+    parser.add_argument("--workers", type=int, default=len(REPORT_TYPES))
+    args = parser.parse_args()
+    extension = get_exporter(args.format).extension
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = make_upload(directory, args.rows)
+        sections = [
+            (f"Отчет: {report_type}", os.path.join(directory, f"part{i}.{extension}"))
+            for i, report_type in enumerate(REPORT_TYPES)
+        ]
+        target = os.path.join(directory, f"combined.{extension}")
+
+        section_times = [
+            timed(render_report_file, source, path, title, args.format) for title, path in sections
+        ]
+        merge_time = timed(merge_report_files, sections, target, args.format)
+        for (title, _), elapsed in zip(sections, section_times):
+            print(f"section {title:<20} {elapsed:7.2f} s")
+        print(f"merge                        {merge_time:7.2f} s")
+        print(f"sequential total             {sum(section_times) + merge_time:7.2f} s")
+
+        with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            # Warm the workers up, so process start and imports are not measured
+            list(pool.map(get_exporter, [args.format] * args.workers))
+            start = time.perf_counter()
+            futures = [
+                pool.submit(render_report_file, source, path, title, args.format) for title, path in sections
+            ]
+            for future in futures:
+                future.result()
+            pool.submit(merge_report_files, sections, target, args.format).result()
+            parallel = time.perf_counter() - start
+        print(f"parallel ({args.workers} workers)         {parallel:7.2f} s "
+              f"(slowest section + merge: {max(section_times) + merge_time:.2f} s, {os.cpu_count()} CPUs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark /api/metrics/aggregate queries against a seeded metrics table.
+
+Seeds a dedicated user with --rows synthetic metrics (spread over names, marketplaces,
+categories and two years of timestamps) plus background rows for other users, then times
+aggregate_metrics for every bucket, with and without the composite indexes.
+
+Run from the virtuscorp_backend directory against a disposable database:
+    python -m benchmarks.bench_metrics_aggregate --db-url postgres://postgres:pw@localhost:5432/bench --rows 5000000
+"""
+import argparse
+import asyncio
+import time
+
+from tortoise import Tortoise, connections
+
+from app.config import get_database_url
+from app.crud.metric import BUCKETS, aggregate_metrics
+from app.models.user import User
+
+BENCH_EMAIL = "aggregate-bench@virtuscorp.local"
+INDEXES = {
+    "idx_metrics_user_name_ts": 'metrics (user_id, name, "timestamp")',
+    "idx_metrics_user_mp_ts": 'metrics (user_id, marketplace, "timestamp")',
+}
+
+SEED_SQL = """
+    INSERT INTO metrics (name, value, "timestamp", user_id, marketplace, category)
+    SELECT (ARRAY['Выручка', 'Заказы', 'Возвраты', 'Средний чек'])[1 + g % 4],
+           random() * 1000,
+           now() - (random() * interval '730 days'),
+           $1,
+           (ARRAY['Ozon', 'WB', 'Yandex'])[1 + g % 3],
+           (ARRAY['Продажи', 'Ценообразование'])[1 + g % 2]
+    FROM generate_series(1, $2) AS g
+"""
+
+
+async def seed(conn, rows: int, other_users: int) -> int:
+    user, _ = await User.get_or_create(email=BENCH_EMAIL, defaults={"password_hash": "-"})
+    existing = await conn.execute_query_dict("SELECT COUNT(*) AS n FROM metrics WHERE user_id = $1", [user.id])
+    if existing[0]["n"] >= rows:
+        return user.id
+
+    await conn.execute_query("DELETE FROM metrics WHERE user_id = $1", [user.id])
+    await conn.execute_query(SEED_SQL, [user.id, rows])
+    # Rows of other users, so the indexes have something to skip over
+    for i in range(other_users):
+        other, _ = await User.get_or_create(email=f"other-{i}@virtuscorp.local", defaults={"password_hash": "-"})
+        await conn.execute_query(SEED_SQL, [other.id, rows // max(other_users, 1)])
+    await conn.execute_script("ANALYZE metrics")
+    return user.id
+
+
+async def time_queries(user_id: int, repeat: int):
+    for bucket in BUCKETS:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = await aggregate_metrics(user_id, bucket, name="Выручка")
+            timings.append(time.perf_counter() - start)
+        print(f"  {bucket:>5}: best {min(timings) * 1000:8.1f} ms, groups={len(result)}")
+
+
+async def main(args):
+    await Tortoise.init(
+        db_url=args.db_url or get_database_url(),
+        modules={"models": ["app.models.user", "app.models.metric", "app.models.report", "app.models.yandex"]},
+    )
+    await Tortoise.generate_schemas(safe=True)
+    conn = connections.get("default")
+
+    start = time.perf_counter()
+    user_id = await seed(conn, args.rows, args.other_users)
+    print(f"Seeded in {time.perf_counter() - start:.1f}s")
+
+    print("Without composite indexes:")
+    for index in INDEXES:
+        await conn.execute_script(f"DROP INDEX IF EXISTS {index}")
+    await time_queries(user_id, args.repeat)
+
+    print("With composite indexes:")
+    for index, target in INDEXES.items():
+        await conn.execute_script(f"CREATE INDEX IF NOT EXISTS {index} ON {target}")
+    await conn.execute_script("ANALYZE metrics")
+    await time_queries(user_id, args.repeat)
+
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db-url", default=None, help="Defaults to the application database")
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--other-users", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,89 @@
+"""
+Measure PDF report render time and peak Python memory across row counts,
+for the original single-Table renderer and the chunked LongTable engine.
+
+Run from the virtuscorp_backend directory:
+    python -m benchmarks.bench_report_rendering --sizes 1000 5000 20000
+"""
+import argparse
+import io
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Table, TableStyle
+
+from app.services.reporting import build_pdf
+
+
+def make_frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    return pd.DataFrame(
+        {
+            "Дата": pd.date_range("2024-01-01", periods=rows, freq="h"),
+            "Маркетплейс": rng.choice(["Ozon", "WB", "Yandex"], rows),
+            "Выручка": rng.normal(1000, 250, rows).round(2),
+            "Заказы": rng.integers(0, 500, rows),
+        }
+    )
+
+
+def legacy_build(df: pd.DataFrame, title: str, target):
+    """The renderer as it was before the chunked engine, kept here for comparison."""
+    styles = getSampleStyleSheet()
+    doc = SimpleDocTemplate(target, pagesize=letter)
+    data = [df.columns.tolist()]
+    for _, row in df.iterrows():
+        data.append([str(x) for x in row.tolist()])
+    table = Table(data)
+    table.setStyle(
+        TableStyle(
+            [
+                ("BACKGROUND", (0, 0), (-1, 0), colors.lightblue),
+                ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
+                ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+                ("GRID", (0, 0), (-1, -1), 1, colors.black),
+            ]
+        )
+    )
+    doc.build([Paragraph(title, styles["Heading1"]), table])
+
+
+def measure(build, df):
+    # Timed and memory-traced in separate runs: tracemalloc slows rendering down a lot
+    buffer = io.BytesIO()
+    start = time.perf_counter()
+    build(df, "Отчет: benchmark", buffer)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    build(df, "Отчет: benchmark", io.BytesIO())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1e6, len(buffer.getvalue()) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 5_000, 20_000])
+    parser.add_argument("--skip-legacy-above", type=int, default=None,
+                        help="Skip the slow legacy renderer for row counts above this value")
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'engine':>8} {'time s':>8} {'peak MB':>8} {'pdf MB':>7}")
+    for rows in args.sizes:
+        df = make_frame(rows)
+        engines = [("chunked", lambda df, title, target: build_pdf([df], title, target))]
+        if args.skip_legacy_above is None or rows <= args.skip_legacy_above:
+            engines.insert(0, ("legacy", legacy_build))
+        for name, build in engines:
+            elapsed, peak, size = measure(build, df)
+            print(f"{rows:>8} {name:>8} {elapsed:>8.2f} {peak:>8.1f} {size:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark: cold start of the API, measured as the time from launching a fresh uvicorn
+process to the first successful response of GET /. Compares the lazy imports of the app
+with an eager start that loads pandas, reportlab, openpyxl and the PDF font before the
+app is imported, as every worker process used to.
+
+The database is SQLite in memory, so the numbers are the cost of imports and startup,
+not of connecting to Postgres.
+
+Run from the virtuscorp_backend directory:
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+# Runs in the child process: the app on SQLite, with the report workers left alone
+SERVER = """
+import sys
+if {eager}:
+    import openpyxl, pandas, pypdf
+    import app.services.reporting
+from app.db.database import TORTOISE_ORM
+TORTOISE_ORM["connections"]["default"] = "sqlite://:memory:"
+if "aerich.models" in TORTOISE_ORM["apps"]["models"]["models"]:
+    TORTOISE_ORM["apps"]["models"]["models"].remove("aerich.models")
+import uvicorn
+uvicorn.run("app.main:app", host="127.0.0.1", port={port}, log_level="error")
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_request(eager: bool, workdir: str, timeout: float = 60) -> float:
+    port = free_port()
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.getcwd(),
+        REPORT_WORKERS_PREWARM="false",
+        YANDEX_SYNC_INTERVAL="0",
+    )
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-W", "ignore", "-c", SERVER.format(eager=eager, port=port)], cwd=workdir, env=env
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode}")
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                    return time.perf_counter() - start
+            except httpx.TransportError:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f"No response within {timeout} s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # One run of each to warm the OS file cache and the bytecode caches
+        time_to_first_request(True, workdir)
+        time_to_first_request(False, workdir)
+        for label, eager in (("eager imports", True), ("lazy imports", False)):
+            timings = [time_to_first_request(eager, workdir) for _ in range(args.runs)]
+            print(f"{label:14} median {statistics.median(timings) * 1000:7.0f} ms  "
+                  f"min {min(timings) * 1000:7.0f} ms  max {max(timings) * 1000:7.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
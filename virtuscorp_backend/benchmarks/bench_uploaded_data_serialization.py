@@ -0,0 +1,87 @@
+"""
+Compare the old per-cell serialization of /api/uploaded-data with the column-wise path.
+
+Run from the virtuscorp_backend directory:
+    python -m benchmarks.bench_uploaded_data_serialization --sizes 10000 100000 1000000
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+
+from app.services.serialization import dumps, frame_to_records
+
+
+def make_frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(42)
+    revenue = rng.normal(1000, 250, rows)
+    revenue[rng.random(rows) < 0.05] = np.nan
+    dates = pd.Series(pd.date_range("2023-01-01", periods=rows, freq="min"))
+    dates[rng.random(rows) < 0.01] = pd.NaT
+    return pd.DataFrame(
+        {
+            "Дата": dates,
+            "Маркетплейс": rng.choice(["Ozon", "WB", "Yandex", None], rows),
+            "Выручка": revenue,
+            "Заказы": rng.integers(0, 500, rows),
+            "Категория": rng.choice(["Продажи", "Ценообразование"], rows),
+        }
+    )
+
+
+def legacy_records(df: pd.DataFrame) -> list:
+    """The original iterrows-based conversion, kept here for comparison."""
+    records = []
+    for _, row in df.iterrows():
+        record = {}
+        for col in df.columns:
+            value = row[col]
+            if pd.isna(value):
+                record[col] = 0
+            elif isinstance(value, pd.Timestamp):
+                record[col] = value.strftime("%Y-%m-%d")
+            else:
+                record[col] = value
+        records.append(record)
+    return records
+
+
+def legacy_path(df: pd.DataFrame) -> bytes:
+    # FastAPI's default response path: jsonable_encoder followed by json.dumps
+    content = jsonable_encoder({"data": legacy_records(df)})
+    return json.dumps(content, ensure_ascii=False).encode("utf-8")
+
+
+def vectorized_path(df: pd.DataFrame) -> bytes:
+    return dumps({"data": frame_to_records(df)})
+
+
+def timed(fn, df):
+    start = time.perf_counter()
+    payload = fn(df)
+    return time.perf_counter() - start, len(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--skip-legacy-above", type=int, default=None,
+                        help="Skip the slow legacy path for row counts above this value")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'legacy s':>10} {'vectorized s':>13} {'speedup':>8} {'payload MB':>11}")
+    for rows in args.sizes:
+        df = make_frame(rows)
+        new_time, new_size = timed(vectorized_path, df)
+        if args.skip_legacy_above is not None and rows > args.skip_legacy_above:
+            print(f"{rows:>10} {'-':>10} {new_time:>13.3f} {'-':>8} {new_size / 1e6:>11.1f}")
+            continue
+        old_time, _ = timed(legacy_path, df)
+        print(f"{rows:>10} {old_time:>10.3f} {new_time:>13.3f} {old_time / new_time:>7.1f}x {new_size / 1e6:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
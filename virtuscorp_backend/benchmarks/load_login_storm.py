@@ -0,0 +1,112 @@
+"""
+Load test: latency of an unrelated endpoint (GET /api/user/profile) while a storm of
+concurrent logins hashes passwords, with bcrypt run inline on the event loop (the old
+behaviour) and in the bounded password hashing executor.
+
+Requests go in-process through httpx's ASGI transport, so the event loop of the test is
+the event loop of the app, as in a single uvicorn worker.
+
+Run from the virtuscorp_backend directory:
+    python -m benchmarks.load_login_storm --seconds 10 --logins 16
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+from tortoise import Tortoise
+
+from app.api.routes import auth as auth_routes
+from app.api.routes import user as user_routes
+from app.config import PASSWORD_HASH_WORKERS
+from app.crud import user as user_crud
+from app.models.user import User
+from app.utils.helpers import create_access_token
+
+BENCH_EMAIL = "login-bench@virtuscorp.ru"
+BENCH_PASSWORD = "login-bench-password"
+
+
+async def _inline_hashing(fn, *args):
+    return fn(*args)
+
+
+async def probe(client: httpx.AsyncClient, token: str, stop: asyncio.Event) -> list:
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get("/api/user/profile", headers={"x-auth-token": token})
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.01)
+    return latencies
+
+
+async def login_loop(client: httpx.AsyncClient, stop: asyncio.Event) -> int:
+    count = 0
+    while not stop.is_set():
+        response = await client.post("/api/auth/login", json={"email": BENCH_EMAIL, "password": BENCH_PASSWORD})
+        response.raise_for_status()
+        count += 1
+    return count
+
+
+async def scenario(client, token, seconds: float, logins: int):
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(client, token, stop))
+    storm = [asyncio.create_task(login_loop(client, stop)) for _ in range(logins)]
+    await asyncio.sleep(seconds)
+    stop.set()
+    latencies = await prober
+    completed = sum(await asyncio.gather(*storm))
+    return latencies, completed
+
+
+def summary(latencies: list) -> str:
+    if len(latencies) < 2:
+        return f"{len(latencies)} probes"
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return f"p50 {cuts[49]:8.1f} ms  p99 {cuts[98]:8.1f} ms  max {max(latencies):8.1f} ms  ({len(latencies)} probes)"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db-url", default="sqlite://:memory:")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--logins", type=int, default=16, help="Concurrent clients logging in")
+    args = parser.parse_args()
+
+    await Tortoise.init(db_url=args.db_url, modules={"models": ["app.models.user"]})
+    await Tortoise.generate_schemas(safe=True)
+    password_hash = await user_crud.hash_password(BENCH_PASSWORD)
+    user, _ = await User.update_or_create(email=BENCH_EMAIL, defaults={"password_hash": password_hash})
+    token = create_access_token({"sub": user.email})
+
+    app = FastAPI()
+    app.include_router(auth_routes.router, prefix="/api/auth")
+    app.include_router(user_routes.router, prefix="/api/user")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="https://bench", timeout=None) as client:
+        # get_current_user prints a line per request; keep it off the console
+        with contextlib.redirect_stdout(io.StringIO()):
+            baseline, _ = await scenario(client, token, min(args.seconds, 3), 0)
+        print(f"{'no logins':<26} {summary(baseline)}")
+
+        run_hashing = user_crud._run_hashing
+        modes = (("inline bcrypt", _inline_hashing), (f"executor ({PASSWORD_HASH_WORKERS} threads)", run_hashing))
+        for label, hashing in modes:
+            user_crud._run_hashing = hashing
+            with contextlib.redirect_stdout(io.StringIO()):
+                latencies, completed = await scenario(client, token, args.seconds, args.logins)
+            print(f"{label:<26} {summary(latencies)}  logins/s {completed / args.seconds:6.1f}")
+        user_crud._run_hashing = run_hashing
+
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,162 @@
+"""
+Load test: throughput and latency of the production server (python -m app.server) with
+one worker process and with several, under the same number of concurrent clients.
+
+Each client pages through GET /api/uploaded-data of one user with a token, which reads
+the cached upload, authenticates and serializes JSON, the CPU-bound work a single event
+loop is limited by. The workers share a SQLite file and the upload directory, as they
+would share Postgres and the volume in production. With more workers than cores the
+extra workers only add contention, so compare on a machine with several cores.
+
+Run from the virtuscorp_backend directory:
+    python -m benchmarks.load_workers --workers 4 --clients 32 --seconds 10
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BENCH_EMAIL = "workers-bench@virtuscorp.ru"
+ROWS = 20_000
+PAGE_SIZE = 200
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def prepare_database() -> str:
+    """Create the schema and the user once, before any worker starts; returns a token."""
+    from tortoise import Tortoise
+
+    from app.db.database import TORTOISE_ORM
+    from app.models.user import User
+    from app.utils.helpers import create_access_token
+
+    await Tortoise.init(config=TORTOISE_ORM)
+    await Tortoise.generate_schemas()
+    await User.create(email=BENCH_EMAIL, password_hash="-")
+    await Tortoise.close_connections()
+    return create_access_token(data={"sub": BENCH_EMAIL})
+
+
+def sample_csv() -> bytes:
+    lines = ["Дата,Маркетплейс,Категория,Выручка,Заказы"]
+    for i in range(ROWS):
+        lines.append(f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d},Ozon,Категория {i % 50},{i * 13.5:.2f},{i % 97}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def start_server(workers: int, port: int, workdir: str, env: dict) -> subprocess.Popen:
+    env = dict(env, WEB_CONCURRENCY=str(workers), SERVER_PORT=str(port), SERVER_HOST="127.0.0.1")
+    process = subprocess.Popen(
+        [sys.executable, "-W", "ignore", "-m", "app.server"],
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.perf_counter() + 60
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                return process
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Server did not start within 60 s")
+
+
+async def client_loop(client: httpx.AsyncClient, n: int, stop: asyncio.Event, latencies: list):
+    offset = n * PAGE_SIZE
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get("/api/uploaded-data", params={"offset": offset % ROWS, "limit": PAGE_SIZE})
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        offset += PAGE_SIZE
+
+
+async def measure(port: int, token: str, clients: int, seconds: float) -> list:
+    latencies = []
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{port}", headers={"x-auth-token": token}, limits=limits, timeout=60
+    ) as client:
+        # Warm up: every worker parses the upload into its cache and fills its auth cache
+        warmup = asyncio.Event()
+        warmers = [asyncio.create_task(client_loop(client, n, warmup, [])) for n in range(clients)]
+        await asyncio.sleep(2)
+        warmup.set()
+        await asyncio.gather(*warmers)
+
+        stop = asyncio.Event()
+        tasks = [asyncio.create_task(client_loop(client, n, stop, latencies)) for n in range(clients)]
+        await asyncio.sleep(seconds)
+        stop.set()
+        await asyncio.gather(*tasks)
+    return latencies
+
+
+def report(label: str, latencies: list, seconds: float):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{label:10} {len(latencies) / seconds:8.1f} req/s  "
+          f"p50 {statistics.median(latencies):7.1f} ms  p99 {p99:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(
+            os.environ,
+            PYTHONPATH=os.getcwd(),
+            DATABASE_URL=f"sqlite://{os.path.join(workdir, 'bench.db')}",
+            GENERATE_SCHEMAS="false",
+            REPORT_WORKERS_PREWARM="false",
+            YANDEX_SYNC_INTERVAL="0",
+        )
+        # The settings are read at import time, in this process as in the workers
+        os.environ.update(env)
+        os.chdir(workdir)
+        token = asyncio.run(prepare_database())
+
+        print(f"{os.cpu_count()} CPU(s), {args.clients} clients, {args.seconds:.0f} s per run")
+        for workers in dict.fromkeys((1, args.workers)):
+            port = free_port()
+            server = start_server(workers, port, workdir, env)
+            try:
+                if workers == 1:
+                    response = httpx.post(
+                        f"http://127.0.0.1:{port}/api/upload-metrics",
+                        headers={"x-auth-token": token},
+                        files={"file": ("bench.csv", sample_csv(), "text/csv")},
+                        timeout=60,
+                    )
+                    response.raise_for_status()
+                latencies = asyncio.run(measure(port, token, args.clients, args.seconds))
+            finally:
+                server.terminate()
+                server.wait()
+            report(f"{workers} worker{'s' if workers > 1 else ''}", latencies, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
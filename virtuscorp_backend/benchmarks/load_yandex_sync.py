@@ -0,0 +1,152 @@
+"""
+Run the Yandex Market sync against a local mock of the Partner API and check what it
+wrote into the metrics.
+
+The mock serves paginated /campaigns/{id}/stats/orders with deterministic orders,
+answers 429 to tokens going over their rate limit and fails a share of requests with 503,
+so the run exercises pooling, rate limiting, bounded concurrency and retries. The sync
+runs twice: the second run must fetch nothing, since the cursors are already at yesterday.
+
+Run from the virtuscorp_backend directory:
+    python -m benchmarks.load_yandex_sync --integrations 20 --failure-rate 0.1
+    python -m benchmarks.load_yandex_sync --rate 50 --lookback-days 120  # throttled, paginated
+"""
+import argparse
+import asyncio
+import os
+import socket
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+MOCK_RATE_LIMIT = 10  # requests per second per token accepted by the mock
+ORDERS_PER_DAY = 3
+
+
+def mock_orders(campaign_id: str, date_from: date, date_to: date) -> list:
+    orders = []
+    day = date_from
+    while day <= date_to:
+        for n in range(ORDERS_PER_DAY):
+            orders.append(
+                {
+                    "id": f"{campaign_id}-{day.isoformat()}-{n}",
+                    "creationDate": day.isoformat(),
+                    # Every third order of a day is cancelled and must not be counted
+                    "status": "CANCELLED_IN_DELIVERY" if n == 2 else "DELIVERED",
+                    "items": [{"count": 1, "prices": [{"type": "BUYER", "costPerItem": 100.0, "total": 100.0}]}],
+                }
+            )
+        day += timedelta(days=1)
+    return orders
+
+
+def mock_app(failure_rate: float, stats: Counter) -> FastAPI:
+    app = FastAPI()
+    last_call = {}
+    seen = Counter()
+
+    @app.post("/campaigns/{campaign_id}/stats/orders")
+    async def stats_orders(campaign_id: str, request: Request, limit: int = 50, page_token: str = "0"):
+        token = request.headers.get("Authorization")
+        stats["requests"] += 1
+        now = time.monotonic()
+        if now - last_call.get(token, 0) < 1 / MOCK_RATE_LIMIT:
+            stats["429"] += 1
+            last_call[token] = now
+            return JSONResponse({"status": "ERROR"}, status_code=429, headers={"Retry-After": "1"})
+        last_call[token] = now
+        # Deterministic failures: every n-th request of the server
+        seen["calls"] += 1
+        if failure_rate and seen["calls"] % round(1 / failure_rate) == 0:
+            stats["503"] += 1
+            return JSONResponse({"status": "ERROR"}, status_code=503)
+
+        body = await request.json()
+        orders = mock_orders(campaign_id, date.fromisoformat(body["dateFrom"]), date.fromisoformat(body["dateTo"]))
+        start = int(page_token)
+        page = orders[start:start + limit]
+        paging = {"nextPageToken": str(start + limit)} if start + limit < len(orders) else {}
+        return {"status": "OK", "result": {"orders": page, "paging": paging}}
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--integrations", type=int, default=20)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    parser.add_argument("--lookback-days", type=int, default=30)
+    parser.add_argument("--rate", type=float, default=5,
+                        help=f"Requests per second per token sent by the sync (the mock allows {MOCK_RATE_LIMIT})")
+    args = parser.parse_args()
+
+    stats = Counter()
+    port = free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(mock_app(args.failure_rate, stats), host="127.0.0.1", port=port, log_level="error")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    # The sync reads its settings at import time
+    os.environ["YANDEX_API_URL"] = f"http://127.0.0.1:{port}"
+    os.environ["YANDEX_SYNC_LOOKBACK_DAYS"] = str(args.lookback_days)
+    os.environ["YANDEX_RATE_LIMIT"] = str(args.rate)
+    os.environ.setdefault("YANDEX_RETRY_BACKOFF", "0.2")
+    from tortoise import Tortoise
+
+    from app.models.metric import Metric
+    from app.models.user import User
+    from app.models.yandex import YandexIntegration
+    from app.services import yandex_sync
+
+    await Tortoise.init(
+        db_url="sqlite://:memory:",
+        modules={"models": ["app.models.user", "app.models.metric", "app.models.yandex"]},
+    )
+    await Tortoise.generate_schemas()
+    for n in range(args.integrations):
+        user = await User.create(email=f"yandex-{n}@virtuscorp.ru", password_hash="-")
+        # Two integrations share each token, so the per-token limit matters
+        await YandexIntegration.create(user=user, campaign_id=str(1000 + n), business_id="1", token=f"token-{n // 2}")
+
+    start = time.perf_counter()
+    rows = await yandex_sync.sync_due_integrations()
+    elapsed = time.perf_counter() - start
+    print(f"first sync   {rows:6} rows in {elapsed:6.2f} s  "
+          f"({stats['requests']} requests, {stats['429']} throttled, {stats['503']} failed)")
+
+    requests_before = stats["requests"]
+    rows_again = await yandex_sync.sync_due_integrations()
+    print(f"second sync  {rows_again:6} rows, {stats['requests'] - requests_before} requests")
+
+    expected_orders = args.integrations * args.lookback_days * (ORDERS_PER_DAY - 1)
+    orders = sum(await Metric.filter(name=yandex_sync.ORDERS_METRIC).values_list("value", flat=True))
+    revenue = sum(await Metric.filter(name=yandex_sync.REVENUE_METRIC).values_list("value", flat=True))
+    lagging = await YandexIntegration.filter(synced_until__isnull=True).count()
+    ok = orders == expected_orders and revenue == expected_orders * 100 and rows_again == 0 and not lagging
+    print(f"orders {orders:.0f} (expected {expected_orders}), revenue {revenue:.0f}, "
+          f"integrations not synced {lagging}: {'OK' if ok else 'MISMATCH'}")
+
+    await yandex_sync.close_client()
+    await Tortoise.close_connections()
+    server.should_exit = True
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -11,5 +11,20 @@ else
     aerich upgrade
 fi
 
+# Columns added to existing tables come first: creating the missing tables also creates
+# the indexes, some of which cover the new columns
+echo "Adding missing columns..."
+for script in add_metric_upload_path add_yandex_sync_fields; do
+    python -m "migrations.$script" || exit 1
+done
+
+echo "Creating missing tables..."
+python -m migrations.create_schema || exit 1
+
+echo "Creating missing indexes..."
+for script in add_metric_indexes add_report_indexes add_upload_indexes; do
+    python -m "migrations.$script" || exit 1
+done
+
 echo "Starting FastAPI app..."
-exec uvicorn app.main:app --host 0.0.0.0 --port 8000
+exec python -m app.server
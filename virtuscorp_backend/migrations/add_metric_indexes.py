@@ -0,0 +1,35 @@
+"""
+Migration script to add composite indexes to the metrics table
+"""
+from tortoise import Tortoise, run_async
+from app.config import get_database_url
+
+# Same names as the indexes declared in Metric.Meta, so fresh schemas and migrated ones match
+INDEXES = [
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_metrics_user_name_ts ON metrics (user_id, name, "timestamp")',
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_metrics_user_mp_ts ON metrics (user_id, marketplace, "timestamp")',
+]
+
+async def run():
+    # Connect to the database
+    await Tortoise.init(
+        db_url=get_database_url(),
+        modules={"models": ["app.models.user", "app.models.metric"]}
+    )
+    
+    # Get connection
+    connection = Tortoise.get_connection("default")
+    
+    # CONCURRENTLY avoids locking writes to metrics while the index builds,
+    # but it can't run inside a transaction, so each statement runs on its own
+    for statement in INDEXES:
+        await connection.execute_script(statement)
+    await connection.execute_script("ANALYZE metrics")
+    
+    print("Migration completed successfully!")
+    
+    # Close connections
+    await Tortoise.close_connections()
+
+if __name__ == "__main__":
+    run_async(run())
@@ -0,0 +1,41 @@
+"""
+Migration script to tag metric rows with the upload they were ingested from
+"""
+from tortoise import Tortoise, run_async
+from app.config import get_database_url
+
+async def run():
+    # Connect to the database
+    await Tortoise.init(
+        db_url=get_database_url(),
+        modules={"models": ["app.models.user", "app.models.metric"]}
+    )
+    
+    # Get connection
+    connection = Tortoise.get_connection("default")
+    
+    # Runs before create_schema.py, which creates a missing table with the columns already
+    result = await connection.execute_query_dict("SELECT to_regclass('metrics') IS NOT NULL AS present")
+    if not result[0]["present"]:
+        print("No metrics table yet, nothing to migrate")
+        await Tortoise.close_connections()
+        return
+    
+    # Rows ingested before this migration keep a NULL upload_path and are never replaced
+    await connection.execute_script("""
+    ALTER TABLE metrics ADD COLUMN IF NOT EXISTS upload_path VARCHAR(500);
+    """)
+    
+    # Finds the rows of an upload when it is ingested again.
+    # CONCURRENTLY can't run inside a transaction, so this runs as a single statement.
+    await connection.execute_script(
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_metrics_user_upload ON metrics (user_id, upload_path)"
+    )
+    
+    print("Migration completed successfully!")
+    
+    # Close connections
+    await Tortoise.close_connections()
+
+if __name__ == "__main__":
+    run_async(run())
@@ -0,0 +1,29 @@
+"""
+Migration script to add the listing index to the reports table
+"""
+from tortoise import Tortoise, run_async
+from app.config import get_database_url
+
+async def run():
+    # Connect to the database
+    await Tortoise.init(
+        db_url=get_database_url(),
+        modules={"models": ["app.models.user", "app.models.report"]}
+    )
+    
+    # Get connection
+    connection = Tortoise.get_connection("default")
+    
+    # Same definition as Report.Meta; PostgreSQL scans it backwards for newest-first pages.
+    # CONCURRENTLY can't run inside a transaction, so this runs as a single statement.
+    await connection.execute_script(
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reports_user_created ON reports (user_id, created_at, id)"
+    )
+    
+    print("Migration completed successfully!")
+    
+    # Close connections
+    await Tortoise.close_connections()
+
+if __name__ == "__main__":
+    run_async(run())
@@ -0,0 +1,29 @@
+"""
+Migration script to add the content hash index to the uploads table
+"""
+from tortoise import Tortoise, run_async
+from app.config import get_database_url
+
+async def run():
+    # Connect to the database
+    await Tortoise.init(
+        db_url=get_database_url(),
+        modules={"models": ["app.models.user", "app.models.upload"]}
+    )
+    
+    # Get connection
+    connection = Tortoise.get_connection("default")
+    
+    # Finds earlier copies of an upload by its SHA-256 for deduplication.
+    # CONCURRENTLY can't run inside a transaction, so this runs as a single statement.
+    await connection.execute_script(
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_uploads_content_hash ON uploads (content_hash)"
+    )
+    
+    print("Migration completed successfully!")
+    
+    # Close connections
+    await Tortoise.close_connections()
+
+if __name__ == "__main__":
+    run_async(run())
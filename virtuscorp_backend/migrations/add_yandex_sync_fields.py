@@ -0,0 +1,37 @@
+"""
+Migration script to add the sync cursor and lease fields to the Yandex integrations table
+"""
+from tortoise import Tortoise, run_async
+from app.config import get_database_url
+
+async def run():
+    # Connect to the database
+    await Tortoise.init(
+        db_url=get_database_url(),
+        modules={"models": ["app.models.user", "app.models.yandex"]}
+    )
+    
+    # Get connection
+    connection = Tortoise.get_connection("default")
+    
+    # Runs before create_schema.py, which creates a missing table with the columns already
+    result = await connection.execute_query_dict("SELECT to_regclass('yandex_integrations') IS NOT NULL AS present")
+    if not result[0]["present"]:
+        print("No yandex_integrations table yet, nothing to migrate")
+        await Tortoise.close_connections()
+        return
+    
+    # Existing integrations start with an empty cursor and get the lookback period on their first sync
+    await connection.execute_script("""
+    ALTER TABLE yandex_integrations
+    ADD COLUMN IF NOT EXISTS synced_until DATE,
+    ADD COLUMN IF NOT EXISTS sync_lease_until TIMESTAMPTZ;
+    """)
+    
+    print("Migration completed successfully!")
+    
+    # Close connections
+    await Tortoise.close_connections()
+
+if __name__ == "__main__":
+    run_async(run())
@@ -0,0 +1,32 @@
+"""
+Migration script to queue every existing day of metrics for the rollup refresher
+"""
+from tortoise import Tortoise, run_async
+from app.config import get_database_url
+
+async def run():
+    # Connect to the database (creates the rollup tables if they don't exist yet)
+    await Tortoise.init(
+        db_url=get_database_url(),
+        modules={"models": ["app.models.user", "app.models.metric"]}
+    )
+    await Tortoise.generate_schemas(safe=True)
+    
+    # Get connection
+    connection = Tortoise.get_connection("default")
+    
+    # The refresher running in the API recomputes the queued days in the background
+    await connection.execute_script("""
+    INSERT INTO metric_rollup_dirty (user_id, bucket)
+    SELECT DISTINCT user_id, (("timestamp" AT TIME ZONE 'UTC')::date)
+    FROM metrics
+    ON CONFLICT DO NOTHING;
+    """)
+    
+    print("Migration completed successfully!")
+    
+    # Close connections
+    await Tortoise.close_connections()
+
+if __name__ == "__main__":
+    run_async(run())
@@ -0,0 +1,101 @@
+"""
+Migration script to move uploads from the flat uploaded_files/user_<id>_<name> layout into
+the per-user directories and record them in the uploads table
+"""
+import hashlib
+import os
+import re
+from datetime import datetime, timezone
+
+import orjson
+from tortoise import Tortoise, run_async
+from app.config import get_database_url
+from app.models.upload import Upload
+from app.models.user import User
+from app.services.uploads import (
+    SUPPORTED_EXTENSIONS,
+    UPLOAD_DIR,
+    columnar_path,
+    load_upload_summary,
+    summary_path,
+    user_upload_dir,
+)
+
+LEGACY_NAME = re.compile(r"^user_(\d+)_(.+)$")
+
+
+def row_count(path: str) -> int:
+    # Read from the summary sidecar, which is computed (with the Arrow sidecar) if missing
+    return orjson.loads(load_upload_summary(path))["rows"]
+
+
+def sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+async def run():
+    # Connect to the database (creates the uploads table if it doesn't exist yet)
+    await Tortoise.init(
+        db_url=get_database_url(),
+        modules={"models": ["app.models.user", "app.models.upload"]}
+    )
+    await Tortoise.generate_schemas(safe=True)
+
+    user_ids = set(await User.all().values_list("id", flat=True))
+    moved = skipped = 0
+    # Oldest first, so the newest legacy file of a user ends up as the latest upload
+    entries = sorted(os.scandir(UPLOAD_DIR), key=lambda entry: entry.stat().st_ctime if entry.is_file() else 0)
+    for entry in entries:
+        match = LEGACY_NAME.match(entry.name)
+        if not entry.is_file() or not match or not entry.name.endswith(SUPPORTED_EXTENSIONS):
+            continue
+        user_id, filename = int(match.group(1)), match.group(2)
+        if user_id not in user_ids:
+            print(f"Skipping {entry.path}: user {user_id} doesn't exist")
+            skipped += 1
+            continue
+
+        stat = entry.stat()
+        created_at = datetime.fromtimestamp(stat.st_ctime, timezone.utc)
+        target_dir = user_upload_dir(user_id)
+        target = os.path.join(target_dir, filename)
+        os.makedirs(target_dir, exist_ok=True)
+        # Sidecars move along, keeping their mtimes so they stay valid
+        for source, destination in (
+            (columnar_path(entry.path), columnar_path(target)),
+            (summary_path(entry.path), summary_path(target)),
+            (entry.path, target),
+        ):
+            if os.path.exists(source):
+                os.replace(source, destination)
+
+        try:
+            rows = row_count(target)
+        except Exception as e:
+            print(f"Could not summarize {target}: {str(e)}")
+            rows = None
+        await Upload.filter(user_id=user_id, file_path=target).delete()
+        await Upload.create(
+            user_id=user_id,
+            filename=filename,
+            file_path=target,
+            size=stat.st_size,
+            content_hash=sha256(target),
+            row_count=rows,
+            format=os.path.splitext(target)[1].lstrip(".").lower(),
+            created_at=created_at,
+        )
+        moved += 1
+
+    print(f"Migration completed successfully! {moved} upload(s) moved, {skipped} skipped")
+
+    # Close connections
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    run_async(run())
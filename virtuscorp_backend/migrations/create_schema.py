@@ -0,0 +1,33 @@
+"""
+Migration script to create the tables and indexes of every model that don't exist yet.
+Run once by entrypoint.sh before the API workers start, since production deployments
+don't generate schemas at startup (GENERATE_SCHEMAS).
+"""
+from tortoise import Tortoise, run_async
+from app.config import get_database_url
+
+async def run():
+    # Connect to the database
+    await Tortoise.init(
+        db_url=get_database_url(),
+        modules={
+            "models": [
+                "app.models.user",
+                "app.models.metric",
+                "app.models.report",
+                "app.models.yandex",
+                "app.models.upload",
+            ]
+        }
+    )
+    
+    # safe: CREATE ... IF NOT EXISTS, existing tables are left as they are
+    await Tortoise.generate_schemas(safe=True)
+    
+    print("Migration completed successfully!")
+    
+    # Close connections
+    await Tortoise.close_connections()
+
+if __name__ == "__main__":
+    run_async(run())
@@ -0,0 +1,250 @@
+import json
+import re
+import sqlite3
+from datetime import date, datetime, timezone
+
+import pandas as pd
+import pytest
+
+from app.crud.metric import RAW_FILTER_FIELDS, ROLLUP_FILTER_FIELDS
+from app.services.filters import (
+    MAX_FILTER_DEPTH,
+    MAX_FILTER_LENGTH,
+    And,
+    Comparison,
+    FilterError,
+    InList,
+    Not,
+    Or,
+    compile_mask,
+    compile_sql,
+    parse_date_range,
+    parse_filter,
+)
+
+ROWS = [
+    ("revenue", "Ozon", "A", 5.0, datetime(2024, 1, 1, 9, 0)),
+    ("revenue", "WB", "B", 12.5, datetime(2024, 1, 2, 0, 0)),
+    ("orders", "Ozon", "B", 20.0, datetime(2024, 1, 2, 18, 30)),
+    ("orders", "Yandex", "C", 30.0, datetime(2024, 1, 3, 12, 0)),
+    ("revenue", "WB", "A", 15.0, datetime(2024, 1, 4, 23, 59)),
+    ("orders", None, None, 8.0, datetime(2024, 1, 2, 9, 0)),
+]
+COLUMNS = ["name", "marketplace", "category", "value", "timestamp"]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "marketplace =",
+        "= Ozon",
+        "(marketplace = Ozon",
+        "marketplace = Ozon)",
+        "marketplace ~ Ozon",
+        "marketplace not = Ozon",
+        "marketplace in ()",
+        "marketplace in (Ozon, WB",
+        "marketplace = Ozon and",
+        "marketplace = Ozon Ozon",
+        "timestamp = 2024-13-01",
+        "timestamp = 2024-01-01 25:00",
+        "marketplace = 'Ozon",
+    ],
+)
+def test_parse_errors(text):
+    with pytest.raises(FilterError):
+        parse_filter(text)
+
+
+def test_blank_filter_is_no_filter():
+    assert parse_filter(None) is None
+    assert parse_filter("   ") is None
+
+
+def test_length_and_depth_limits():
+    with pytest.raises(FilterError):
+        parse_filter("value = 1 or " * (MAX_FILTER_LENGTH // 13 + 1) + "value = 1")
+    with pytest.raises(FilterError):
+        parse_filter("(" * (MAX_FILTER_DEPTH + 1) + "value = 1" + ")" * (MAX_FILTER_DEPTH + 1))
+    assert parse_filter("(" * (MAX_FILTER_DEPTH - 1) + "value = 1" + ")" * (MAX_FILTER_DEPTH - 1))
+
+
+@pytest.mark.parametrize(
+    "op, expected",
+    [("=", "="), ("==", "="), ("!=", "!="), ("<>", "!="), ("<", "<"), ("<=", "<="), (">", ">"), (">=", ">=")],
+)
+def test_comparison_operators(op, expected):
+    assert parse_filter(f"value {op} 10") == Comparison("value", expected, 10)
+
+
+def test_values_and_structure():
+    assert parse_filter("`Статус заказа` = 'Отменен'") == Comparison("Статус заказа", "=", "Отменен")
+    assert parse_filter('name = "a b"') == Comparison("name", "=", "a b")
+    assert parse_filter("value > -1.5") == Comparison("value", ">", -1.5)
+    assert parse_filter("timestamp >= 2024-01-02") == Comparison("timestamp", ">=", date(2024, 1, 2))
+    assert parse_filter("timestamp < 2024-01-02 10:30") == Comparison("timestamp", "<", datetime(2024, 1, 2, 10, 30))
+    assert parse_filter("marketplace not in (Ozon, 'WB')") == Not(InList("marketplace", ("Ozon", "WB")))
+    # and binds tighter than or
+    assert parse_filter("a = 1 or b = 2 and not c = 3") == Or(
+        (Comparison("a", "=", 1), And((Comparison("b", "=", 2), Not(Comparison("c", "=", 3)))))
+    )
+
+
+def test_date_ranges():
+    assert parse_date_range("2024-01-01..2024-01-31") == (date(2024, 1, 1), date(2024, 1, 31))
+    assert parse_date_range("2024-01-01/2024-01-31") == (date(2024, 1, 1), date(2024, 1, 31))
+    assert parse_date_range("..2024-01-31") == (None, date(2024, 1, 31))
+    assert parse_date_range("2024-01-01..") == (date(2024, 1, 1), None)
+    assert parse_date_range("2024-01-05") == (date(2024, 1, 5), date(2024, 1, 5))
+    assert parse_date_range("last_7_days", today=date(2024, 1, 10)) == (date(2024, 1, 4), date(2024, 1, 10))
+    with pytest.raises(FilterError):
+        parse_date_range("2024-02-01..2024-01-01")
+    with pytest.raises(FilterError):
+        parse_date_range("yesterday")
+
+
+def _frame():
+    return pd.DataFrame(ROWS, columns=COLUMNS)
+
+
+def _sqlite_rows(condition, params, alias="m", missing=None):
+    """
+    Run a compiled condition over the rows in SQLite, adapting the Postgres-only syntax.
+    missing is stored for missing labels: NULL like the metrics table, or '' like rollups.
+    """
+    condition = re.sub(r"= ANY\(\$(\d+)::[^)]*\)", r"IN (SELECT value FROM json_each(?\1))", condition)
+    condition = re.sub(r"\$(\d+)", r"?\1", condition)
+    values = []
+    for param in params:
+        if isinstance(param, list):
+            param = json.dumps([v.isoformat(" ") if isinstance(v, datetime) else v for v in param])
+        elif isinstance(param, datetime):
+            param = param.isoformat(" ")
+        values.append(param)
+
+    db = sqlite3.connect(":memory:")
+    db.execute('CREATE TABLE metrics (id INTEGER, name TEXT, marketplace TEXT, category TEXT, value REAL, "timestamp" TEXT)')
+    db.executemany(
+        "INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (
+                i,
+                name,
+                missing if marketplace is None else marketplace,
+                missing if category is None else category,
+                value,
+                ts.replace(tzinfo=timezone.utc).isoformat(" "),
+            )
+            for i, (name, marketplace, category, value, ts) in enumerate(ROWS)
+        ],
+    )
+    query = f"SELECT {alias}.id FROM metrics {alias} WHERE {condition} ORDER BY {alias}.id"
+    ids = [row[0] for row in db.execute(query, values)]
+    db.close()
+    return ids
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "marketplace = Ozon",
+        "marketplace != Ozon",
+        "value > 12.5",
+        "value <= 15",
+        "value >= 10 and value < 30",
+        "marketplace in (Ozon, WB)",
+        "category not in (A, B)",
+        "not category in (A)",
+        "name = orders or value = 5",
+        "not (marketplace = WB and value > 13)",
+        "not marketplace = Ozon",
+        "not marketplace in (Ozon, WB)",
+        "marketplace not in (Ozon)",
+        "marketplace = ''",
+        "category in (A, '')",
+        "not (category = B or marketplace = Yandex)",
+        "timestamp = 2024-01-02",
+        "timestamp != 2024-01-02",
+        "timestamp < 2024-01-02",
+        "timestamp <= 2024-01-02",
+        "timestamp > 2024-01-02",
+        "timestamp >= 2024-01-03",
+        "timestamp >= 2024-01-02 12:00",
+        "timestamp in (2024-01-01, 2024-01-03)",
+        "Marketplace = WB and Timestamp < 2024-01-04",
+    ],
+)
+def test_mask_and_sql_select_the_same_rows(text):
+    node = parse_filter(text)
+    mask = compile_mask(node, _frame())
+    params = []
+    condition = compile_sql(node, RAW_FILTER_FIELDS, params)
+    assert _sqlite_rows(condition, params) == [i for i, matched in enumerate(mask) if matched]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "marketplace != Ozon",
+        "not marketplace = Ozon",
+        "category in (A, '')",
+        "not (category = B or marketplace = Yandex) and name = orders",
+    ],
+)
+def test_rollup_sql_selects_the_same_rows(text):
+    node = parse_filter(text)
+    mask = compile_mask(node, _frame())
+    params = []
+    condition = compile_sql(node, ROLLUP_FILTER_FIELDS, params)
+    assert _sqlite_rows(condition, params, alias="r", missing="") == [i for i, matched in enumerate(mask) if matched]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "`name; DROP TABLE metrics; --` = 1",
+        "`value) OR (1 = 1` = 1",
+        '`m."timestamp"` = 1',
+        "password_hash = x",
+        "user_id = 7",
+    ],
+)
+def test_unknown_columns_are_rejected(text):
+    node = parse_filter(text)
+    with pytest.raises(FilterError):
+        compile_sql(node, RAW_FILTER_FIELDS, [])
+    with pytest.raises(FilterError):
+        compile_mask(node, _frame())
+
+
+@pytest.mark.parametrize(
+    "value",
+    ["x' OR '1' = '1", "'; DROP TABLE metrics; --", "$1", "a\" OR 1=1 --"],
+)
+def test_values_are_passed_as_parameters(value):
+    quote = '"' if "'" in value else "'"
+    params = []
+    condition = compile_sql(parse_filter(f"name = {quote}{value}{quote}"), RAW_FILTER_FIELDS, params)
+    assert condition == "m.name = $1"
+    assert params == [value]
+    assert _sqlite_rows(condition, params) == []
+
+
+def test_in_list_values_are_one_array_parameter():
+    params = []
+    condition = compile_sql(parse_filter("name in (a, \"c'); --\")"), RAW_FILTER_FIELDS, params)
+    assert condition == "m.name = ANY($1::text[])"
+    assert params == [["a", "c'); --"]]
+
+
+def test_hostile_values_do_not_break_out_of_strings():
+    # A quote can't be escaped inside a string, so the rest is left unparsed
+    with pytest.raises(FilterError):
+        parse_filter("name = 'x'' OR 1 = 1 --'")
+
+
+def test_sql_rejects_values_of_the_wrong_kind():
+    with pytest.raises(FilterError):
+        compile_sql(parse_filter("value > lots"), RAW_FILTER_FIELDS, [])
+    with pytest.raises(FilterError):
+        compile_sql(parse_filter("timestamp > 'soon'"), RAW_FILTER_FIELDS, [])
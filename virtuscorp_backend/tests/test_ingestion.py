@@ -0,0 +1,61 @@
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+from tortoise import Tortoise
+
+from app.models.metric import Metric
+from app.models.user import User
+from app.services import ingestion
+
+pytestmark = pytest.mark.anyio
+
+MODELS = ["app.models.user", "app.models.metric", "app.models.report", "app.models.yandex", "app.models.upload"]
+UPLOADED_AT = datetime(2024, 1, 10, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def user(anyio_backend, tmp_path, monkeypatch):
+    # Ingestion status files are written below the working directory
+    monkeypatch.chdir(tmp_path)
+    await Tortoise.init(db_url="sqlite://:memory:", modules={"models": MODELS})
+    await Tortoise.generate_schemas()
+    yield await User.create(email="u@x.ru", password_hash="-")
+    await Tortoise.close_connections()
+
+
+def test_wide_table_becomes_one_metric_per_numeric_column():
+    df = pd.DataFrame({"Дата": ["2024-01-01", "2024-01-02"], "Выручка": [10, None], "Заказы": [1, 2]})
+
+    metrics = ingestion.frame_to_metric_frame(df, UPLOADED_AT)
+
+    assert sorted(zip(metrics["name"], metrics["value"])) == [("Выручка", 10.0), ("Заказы", 1.0), ("Заказы", 2.0)]
+
+
+def test_table_without_numeric_columns_gives_typed_empty_frame():
+    df = pd.DataFrame({"Дата": ["2024-01-01"], "Комментарий": ["text"]})
+
+    metrics = ingestion.frame_to_metric_frame(df, UPLOADED_AT)
+
+    assert metrics.empty
+    assert list(metrics.columns) == ingestion.METRIC_FRAME_COLUMNS
+    assert str(metrics["timestamp"].dtype) == "datetime64[ns, UTC]"
+    assert list(ingestion._metric_rows(metrics, 1)) == []
+
+
+async def test_ingesting_without_numeric_columns_replaces_previous_rows(user):
+    path = "uploaded_files/07/7/data.csv"
+    numeric = pd.DataFrame({"date": ["2024-01-01", "2024-01-02"], "sales": [10, 20]})
+    assert await ingestion.ingest_upload(user.id, "data.csv", path, numeric) == 2
+
+    text_only = pd.DataFrame({"date": ["2024-01-01"], "note": ["text"]})
+    assert await ingestion.ingest_upload(user.id, "data.csv", path, text_only) == 0
+
+    status = ingestion.get_ingestion_status(user.id)
+    assert status["status"] == "completed", status["error"]
+    assert await Metric.filter(user_id=user.id, upload_path=path).count() == 0
@@ -0,0 +1,42 @@
+import io
+
+import pandas as pd
+from pypdf import PdfReader
+from reportlab.platypus import Paragraph
+
+from app.services.reporting import MAX_COL_WIDTH, TABLE_WIDTH, build_pdf, table_flowables, table_layout
+
+LONG_TEXT = "очень длинное описание товара " * 20
+
+
+def _wide_frame(rows=10):
+    columns = {"sku": [f"SKU-{i}" for i in range(rows)], "description": [LONG_TEXT] * rows}
+    columns.update({f"metric_column_{k}": [1234567.891 * k] * rows for k in range(12)})
+    return pd.DataFrame(columns)
+
+
+def test_columns_are_sized_from_their_contents():
+    layout = table_layout(pd.DataFrame({"id": [1, 2], "note": ["ok", LONG_TEXT]}))
+    assert layout.widths[0] < layout.widths[1] == MAX_COL_WIDTH
+    assert layout.groups == [[0, 1]]
+
+
+def test_wide_frames_are_split_into_tables_that_fit_the_page():
+    layout = table_layout(_wide_frame())
+    assert len(layout.groups) > 1
+    assert sorted({i for group in layout.groups for i in group}) == list(range(14))
+    for group in layout.groups:
+        assert group[0] == 0
+        assert sum(layout.widths[i] for i in group) <= TABLE_WIDTH
+
+
+def test_long_values_wrap_instead_of_overflowing():
+    df = _wide_frame(3)
+    tables = table_flowables(df)
+    cells = [cell for table in tables for row in table._cellvalues for cell in row]
+    assert any(isinstance(cell, Paragraph) for cell in cells)
+    assert "SKU-0" in cells
+
+    target = io.BytesIO()
+    build_pdf([df, df.assign(sku="x" * 1000)], "Отчет", target)
+    assert len(PdfReader(target).pages) > 1
@@ -0,0 +1,198 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from tortoise import Tortoise
+
+from app.models.metric import Metric
+from app.models.user import User
+from app.models.yandex import YandexIntegration
+from app.services import yandex_sync
+from app.utils.rate_limit import RateLimiter
+
+pytestmark = pytest.mark.anyio
+
+TOKEN = "token"
+MODELS = ["app.models.user", "app.models.metric", "app.models.report", "app.models.yandex", "app.models.upload"]
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Delays the code under test slept for; the sleeps themselves return at once."""
+    delays = []
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay, result=None):
+        delays.append(delay)
+        return await real_sleep(0, result)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    monkeypatch.setattr(yandex_sync.random, "uniform", lambda a, b: 1)
+    return delays
+
+
+@pytest.fixture
+async def api(anyio_backend, monkeypatch):
+    """Answers Yandex requests with the queued responses (or exceptions) in order."""
+    queue = []
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        answer = queue.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    client = httpx.AsyncClient(base_url="https://yandex.test", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(yandex_sync, "_client", client)
+    monkeypatch.setattr(yandex_sync, "_limiter", RateLimiter(10))
+    yield queue, requests
+    await client.aclose()
+
+
+async def test_throttled_request_waits_for_retry_after(api, sleeps):
+    queue, requests = api
+    queue += [httpx.Response(429, headers={"Retry-After": "7"}), httpx.Response(200, json={"ok": True})]
+
+    response = await yandex_sync.request("GET", "/campaigns", TOKEN)
+
+    assert response.json() == {"ok": True}
+    assert len(requests) == 2
+    assert requests[0].headers["Authorization"] == f"Bearer {TOKEN}"
+    assert max(sleeps) >= 7
+
+
+async def test_throttling_holds_other_requests_with_the_token(api, sleeps):
+    queue, _ = api
+    queue += [httpx.Response(420, headers={"Retry-After": "5"}), httpx.Response(200), httpx.Response(200)]
+
+    await yandex_sync.request("GET", "/campaigns", TOKEN)
+    sleeps.clear()
+    await yandex_sync.request("GET", "/campaigns", TOKEN)
+
+    # The limiter still holds the token after the retry, so the next call waits as well
+    assert sleeps and sleeps[0] > 4
+
+
+async def test_backoff_grows_exponentially(api, sleeps, monkeypatch):
+    monkeypatch.setattr(yandex_sync, "_limiter", RateLimiter(0))
+    queue, _ = api
+    queue += [httpx.Response(500), httpx.Response(502), httpx.Response(503), httpx.Response(200)]
+
+    await yandex_sync.request("GET", "/campaigns", TOKEN)
+
+    backoff = yandex_sync.YANDEX_RETRY_BACKOFF
+    assert sleeps == [backoff, backoff * 2, backoff * 4]
+
+
+@pytest.mark.parametrize("status", [500, 502, 503, 504, 429])
+async def test_errors_retried_until_retries_run_out(api, sleeps, status):
+    queue, requests = api
+    queue += [httpx.Response(status, text="busy")] * 3
+
+    with pytest.raises(yandex_sync.YandexAPIError) as error:
+        await yandex_sync.request("GET", "/campaigns", TOKEN, retries=2)
+
+    assert error.value.status_code == status
+    assert len(requests) == 3
+
+
+async def test_transport_errors_are_retried(api, sleeps):
+    queue, requests = api
+    queue += [httpx.ConnectError("refused"), httpx.Response(200)]
+
+    response = await yandex_sync.request("GET", "/campaigns", TOKEN)
+
+    assert response.status_code == 200
+    assert len(requests) == 2
+
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404])
+async def test_client_errors_are_not_retried(api, sleeps, status):
+    queue, requests = api
+    queue += [httpx.Response(status, text="denied")]
+
+    with pytest.raises(yandex_sync.YandexAPIError) as error:
+        await yandex_sync.request("GET", "/campaigns", TOKEN)
+
+    assert error.value.status_code == status
+    assert error.value.detail == "denied"
+    assert len(requests) == 1
+
+
+@pytest.fixture
+async def integration(anyio_backend):
+    await Tortoise.init(db_url="sqlite://:memory:", modules={"models": MODELS})
+    await Tortoise.generate_schemas()
+    user = await User.create(email="u@x.ru", password_hash="-")
+    yield await YandexIntegration.create(user=user, campaign_id="1", business_id="2", token=TOKEN)
+    await Tortoise.close_connections()
+
+
+async def test_lease_is_exclusive_until_it_expires(integration):
+    assert await yandex_sync._claim(integration.id)
+    assert not await yandex_sync._claim(integration.id)
+
+    expired = datetime.now(timezone.utc) - timedelta(seconds=1)
+    await YandexIntegration.filter(id=integration.id).update(sync_lease_until=expired)
+    assert await yandex_sync._claim(integration.id)
+
+
+async def test_sync_claimed_refuses_a_taken_lease(integration, monkeypatch):
+    async def sync(_):
+        raise AssertionError("synced without the lease")
+
+    monkeypatch.setattr(yandex_sync, "sync_integration", sync)
+    assert await yandex_sync._claim(integration.id)
+
+    with pytest.raises(yandex_sync.SyncInProgress):
+        await yandex_sync.sync_claimed(integration)
+    assert await yandex_sync.sync_due_integrations() == 0
+
+
+async def test_lease_is_released_after_a_failed_sync(integration, monkeypatch):
+    async def sync(_):
+        raise yandex_sync.YandexAPIError(503, "down")
+
+    monkeypatch.setattr(yandex_sync, "sync_integration", sync)
+
+    with pytest.raises(yandex_sync.YandexAPIError):
+        await yandex_sync.sync_claimed(integration)
+
+    await integration.refresh_from_db()
+    assert integration.sync_lease_until is None
+    assert await yandex_sync._claim(integration.id)
+
+
+async def test_failed_sync_keeps_the_previous_rows(integration, monkeypatch):
+    yesterday = yandex_sync._last_complete_day()
+    integration.synced_until = yesterday - timedelta(days=1)
+    await integration.save()
+    ts = datetime.combine(yesterday, datetime.min.time(), tzinfo=timezone.utc)
+    await Metric.create(
+        user_id=integration.user_id, name=yandex_sync.ORDERS_METRIC, value=3, timestamp=ts,
+        marketplace=yandex_sync.MARKETPLACE, category=yandex_sync.SYNC_CATEGORY,
+    )
+
+    async def fetch_orders(*_):
+        return [{"status": "DELIVERED", "creationDate": yesterday.strftime("%d-%m-%Y 10:00:00"), "items": []}]
+
+    async def bulk_insert_metrics(*_):
+        raise ConnectionError("lost the database")
+
+    monkeypatch.setattr(yandex_sync, "fetch_orders", fetch_orders)
+    monkeypatch.setattr(yandex_sync, "bulk_insert_metrics", bulk_insert_metrics)
+
+    with pytest.raises(ConnectionError):
+        await yandex_sync.sync_integration(integration)
+
+    assert await Metric.filter(user_id=integration.user_id).values_list("value", flat=True) == [3]
+    await integration.refresh_from_db()
+    assert integration.synced_until == yesterday - timedelta(days=1)